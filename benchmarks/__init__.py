@@ -0,0 +1 @@
+# Benchmarks, run with `python -m benchmarks.xxx` from the project root.
@@ -0,0 +1,62 @@
+"""
+每个学生对象占多少内存：以前的 __dict__ 对象 vs 现在的 __slots__ 对象，以及放进 StudentList（带索引）之后。
+Usage: python -m benchmarks.bench_memory [count]
+"""
+import gc
+import json
+import sys
+import tracemalloc
+
+from studentcms.models import Student, StudentList
+
+
+class DictStudent:
+    """以前的存储方式：普通对象，属性都在 __dict__ 里，可选属性只在有值时才 setattr"""
+
+    def __init__(self, data: dict):
+        for k, v in data.items():
+            setattr(self, k, v)
+
+
+def make_rows(count: int):
+    for i in range(count):
+        row = {'id': i + 1, 'student_number': f'2019{i:07d}', 'name': '张三' if i % 2 else 'John Doe',
+               'gender': i % 2, 'age': 18 + i % 10}
+        if i % 2:  # 大约一半的学生有可选属性
+            row.update(id_card=f'{110101200001010000 + i}', phone_number=f'138{i:08d}', address='Beijing')
+        yield row
+
+
+def measure(build, count: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objs = build(count)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objs
+    return (after - before) / count
+
+
+def main(count=100000):
+    # 字符串/整数在两种方式里是一样的，先生成好，只比较对象本身的开销
+    rows = list(make_rows(count))
+    result = {
+        'count': count,
+        'bytes_per_student': {
+            'dict_object': round(measure(lambda n: [DictStudent(row) for row in rows[:n]], count), 1),
+            'slots_object': round(measure(lambda n: [Student.from_dict(row) for row in rows[:n]], count), 1),
+        },
+    }
+
+    def build_list(n):
+        student_list = StudentList()
+        student_list.add_items([Student.from_dict(row) for row in rows[:n]])
+        return student_list
+    result['bytes_per_student']['slots_object_in_student_list'] = round(measure(build_list, count), 1)
+    print(json.dumps(result, indent=2))
+    return result
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
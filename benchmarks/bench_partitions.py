@@ -0,0 +1,108 @@
+"""
+启动时间和查询：一个快照 + 日志（'journal' 后端）vs 按入学年份分区（'partitioned' 后端，workers 个进程并行加载）。
+
+先把名单写成两种快照，再修改 tail 比例的学生（日志里留下这么多条 replay 的记录），然后每种后端在单独的进程里：
+* open: 加载快照、replay 日志、建好索引的时间；
+* by_number / by_id_card: 随机按学号（只查一个分区）/ 身份证号（每个分区都查）查询的 ops/sec；
+* year_query: 查一个入学年份的全部学生（学号前缀）的时间；
+* drop_year: 删除一个入学年份的时间（分区是去掉整个分区，单个列表是 delete_items）。
+Usage: python -m benchmarks.bench_partitions [count] [workers] [tail] [seed]
+"""
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.roster import make_roster
+from studentcms import settings
+from studentcms.journal import Journal
+from studentcms.models import Student, StudentList
+from studentcms.partitions import SNAPSHOT_SUFFIX, PartitionedStorage
+from studentcms.utils.pickle_utils import update_pickle_file_atomically
+
+LOOKUPS = 50000
+
+
+def open_backend(backend: str, data_dir: str, workers=1) -> StudentList:
+    settings.use_data_dir(data_dir)
+    if backend == 'partitioned':
+        return StudentList(PartitionedStorage(Student, os.path.join(data_dir, 'partitions'), workers))
+    student_list = StudentList()
+    student_list.attach_journal(Journal(os.path.join(data_dir, 'students.journal'), os.path.join(data_dir, 'students.pkl')))
+    return student_list
+
+
+def write_tail(backend: str, data_dir: str, tail: float, seed: int):
+    """Change the address of tail * count students, leaving that many update records in the journal(s)."""
+    student_list = open_backend(backend, data_dir)
+    students = list(student_list.sq_list)
+    random.Random(seed).shuffle(students)
+    student_list.update_items(students[:int(len(students) * tail)], {'address': 'Tail'})
+    student_list.close()
+
+
+def run_backend(backend: str, data_dir: str, workers: int, seed: int) -> dict:
+    """Open and query one backend, in a fresh process."""
+    start = time.perf_counter()
+    student_list = open_backend(backend, data_dir, workers)
+    opened = time.perf_counter() - start
+    students = random.Random(seed).sample(list(student_list.sq_list), min(LOOKUPS, student_list.length))
+    result = {'students': student_list.length, 'open_seconds': round(opened, 3)}
+    for key in ('student_number', 'id_card'):
+        values = [getattr(student, key) for student in students if getattr(student, key)]
+        start = time.perf_counter()
+        for value in values:
+            student_list.get_items_by_key_value(key, value)
+        result[f'by_{key}_per_sec'] = round(len(values) / (time.perf_counter() - start), 1)
+    year = Student.partition_of(students[0].student_number)
+    start = time.perf_counter()
+    result['year_students'] = len(student_list.find_students_by_enrollment_year(year)[1])
+    result['year_query_seconds'] = round(time.perf_counter() - start, 4)
+    start = time.perf_counter()
+    result['drop_year'] = student_list.drop_enrollment_year(year)[1]
+    result['drop_year_seconds'] = round(time.perf_counter() - start, 4)
+    student_list.close()
+    return result
+
+
+def main(count=200000, workers=None, tail=0.05, seed=0):
+    workers = workers or os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as data_dir:
+        states = [{'id': k + 1, **data} for k, (_, data) in enumerate(Student.parse_rows(list(make_roster(count, seed))))]
+        update_pickle_file_atomically(os.path.join(data_dir, 'students.pkl'), {'generation': 1, 'states': states})
+        years: dict[str, list] = {}
+        for state in states:
+            years.setdefault(Student.partition_of(state['student_number']), []).append(state)
+        os.makedirs(os.path.join(data_dir, 'partitions'))
+        for year, year_states in years.items():
+            update_pickle_file_atomically(os.path.join(data_dir, 'partitions', year + SNAPSHOT_SUFFIX),
+                                          {'generation': 1, 'states': year_states})
+        result = {'count': count, 'partitions': len(years), 'cpu_count': os.cpu_count(), 'tail': tail, 'open': {}}
+        del states, years
+        context = multiprocessing.get_context('spawn')
+        for backend in ('journal', 'partitioned'):
+            with ProcessPoolExecutor(1, mp_context=context) as pool:
+                pool.submit(write_tail, backend, data_dir, tail, seed).result()
+        for name, backend, backend_workers in (('journal', 'journal', 1), ('partitioned_1', 'partitioned', 1),
+                                               (f'partitioned_{workers}', 'partitioned', workers)):
+            if name in result['open']:
+                continue
+            # 每次用一份新的数据：drop_year 会删掉一个年份
+            copy_dir = tempfile.mkdtemp(dir=data_dir)
+            shutil.copytree(os.path.join(data_dir, 'partitions'), os.path.join(copy_dir, 'partitions'))
+            for file_name in ('students.pkl', 'students.journal'):
+                shutil.copy(os.path.join(data_dir, file_name), copy_dir)
+            with ProcessPoolExecutor(1, mp_context=context) as pool:
+                result['open'][name] = pool.submit(run_backend, backend, copy_dir, backend_workers, seed).result()
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    return result
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:5]
+    main(*(int(arg) for arg in args[:2]), *(float(arg) for arg in args[2:3]), *(int(arg) for arg in args[3:4]))
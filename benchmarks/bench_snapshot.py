@@ -0,0 +1,90 @@
+"""
+启动时间：pickle 快照（'journal' 后端）vs mmap 二进制快照（'mmap' 后端）。
+
+先把名单写成两种快照（记录写入时间和文件大小），然后每种后端在单独的进程里：
+* open: 打开快照、StudentList 可以用了的时间（attach_journal）；
+* first_lookup: 第一次按学号查询；lookups: 随机按学号查询的 ops/sec；
+* rss_mb: 查询之后进程的内存（映射的快照只算读到过的页）。
+  不用 ru_maxrss：Linux 上 exec 之后还保留着父进程（生成名单的进程）的峰值。
+Usage: python -m benchmarks.bench_snapshot [count] [seed]
+"""
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.roster import make_roster
+from studentcms import settings
+from studentcms.journal import Journal
+from studentcms.models import Student, StudentList
+from studentcms.snapshot import MappedJournal, write_snapshot
+from studentcms.storage import MappedStorage
+from studentcms.utils.pickle_utils import update_pickle_file_atomically
+
+LOOKUPS = 100000
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return round(int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20, 1)
+    except (OSError, AttributeError, ValueError):  # 没有 /proc（Windows、macOS）
+        return None
+
+
+def open_backend(backend: str, data_dir: str) -> dict:
+    """Open the snapshot written by main() and time lookups, in a fresh process."""
+    settings.use_data_dir(data_dir)
+    start = time.perf_counter()
+    if backend == 'mmap':
+        student_list = StudentList(MappedStorage(Student))
+        student_list.attach_journal(MappedJournal(os.path.join(data_dir, 'students.mapped.journal'),
+                                                  os.path.join(data_dir, 'students.bin'), Student))
+    else:
+        student_list = StudentList()
+        student_list.attach_journal(Journal(os.path.join(data_dir, 'students.journal'),
+                                            os.path.join(data_dir, 'students.pkl')))
+    opened = time.perf_counter() - start
+    count = student_list.length
+    numbers = [f'{2015 + k % 10}{k:07d}' for k in random.Random(1).choices(range(count), k=LOOKUPS)]
+    start = time.perf_counter()
+    found = student_list.get_item_by_key_value('student_number', numbers[0])[0]
+    first_lookup = time.perf_counter() - start
+    start = time.perf_counter()
+    for number in numbers:
+        student_list.get_item_by_key_value('student_number', number)
+    seconds = time.perf_counter() - start
+    memory = rss_mb()
+    student_list.close()
+    return {'students': count, 'open_seconds': round(opened, 4), 'first_lookup_seconds': round(first_lookup, 6),
+            'found': found, 'lookups_per_sec': round(LOOKUPS / seconds, 1), 'rss_mb': memory}
+
+
+def main(count=1000000, seed=0):
+    with tempfile.TemporaryDirectory() as data_dir:
+        rows = list(make_roster(count, seed))
+        states = [{'id': k + 1, **data} for k, (_, data) in enumerate(Student.parse_rows(rows))]
+        del rows
+        result = {'count': count, 'write': {}, 'open': {}}
+        start = time.perf_counter()
+        update_pickle_file_atomically(os.path.join(data_dir, 'students.pkl'), {'generation': 1, 'states': states})
+        result['write']['pickle'] = {'seconds': round(time.perf_counter() - start, 3),
+                                     'mb': round(os.path.getsize(os.path.join(data_dir, 'students.pkl')) / 2 ** 20, 1)}
+        start = time.perf_counter()
+        write_snapshot(os.path.join(data_dir, 'students.bin.1'), Student, 1, states)
+        result['write']['mmap'] = {'seconds': round(time.perf_counter() - start, 3),
+                                   'mb': round(os.path.getsize(os.path.join(data_dir, 'students.bin.1')) / 2 ** 20, 1)}
+        del states
+        for backend in ('pickle', 'mmap'):
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                result['open'][backend] = pool.submit(open_backend, backend, data_dir).result()
+    print(json.dumps(result, indent=2))
+    return result
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,182 @@
+"""
+StudentList 主要操作的基准测试：在 1k / 100k / 1M 个学生上分别计时，输出 JSON，不同版本的结果可以直接 diff/比较。
+
+* validate_rows: Student.parse_rows 批量校验整份名单；validate_row: parse_row 逐行校验；
+* allocate_id: 逐个分配学生 id；
+* add_item / get_item_by_key_value（按学号）/ _update_item_attr_by_index（改年龄）/ delete_item；
+* update_where / delete_where: 批量修改、删除一个入学年份的学生，ops 是学生数；
+* peak_rss_mb: 这个规模的进程内存峰值。每个规模在单独的进程里跑，互不影响。
+
+名单由 benchmarks.roster 生成，同一个 seed 每次都一样。数据文件（id 文件、--journal 时的日志）放在临时目录。
+Usage: python -m benchmarks.bench_suite [--sizes 1000,100000,1000000] [--seed 0] [--journal]
+                                        [--output result.json] [--baseline old_result.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.roster import make_roster
+from studentcms import settings
+from studentcms.journal import Journal
+from studentcms.models import Student, StudentList
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SIZES = (1000, 100000, 1000000)
+SAMPLE_SIZE = 100000  # 查询/修改/单行校验/分配 id 最多做这么多次
+DELETE_SAMPLE_SIZE = 1000  # delete_item 要在列表里找到对象（O(n)），次数少一些
+
+
+def timed(ops: int, func) -> dict:
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    return {'ops': ops, 'seconds': round(seconds, 4), 'ops_per_sec': round(ops / seconds, 1) if seconds else None}
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)  # macOS 是字节，Linux 是 KB
+
+
+def open_student_list(use_journal):
+    student_list = StudentList()
+    if use_journal:
+        student_list.attach_journal(Journal(settings.STUDENT_JOURNAL_PATH, settings.STUDENT_SNAPSHOT_PATH))
+    return student_list
+
+
+def bench_validation(rows, rng) -> dict:
+    results = {'validate_rows': timed(len(rows), lambda: Student.parse_rows(rows))}
+    invalid = [msg for success, msg in Student.parse_rows(rows[:1000]) if not success]
+    if invalid:
+        raise RuntimeError(f'Generated roster is invalid: {invalid[0]}')
+    sample = rng.choices(rows, k=min(len(rows), SAMPLE_SIZE))
+    results['validate_row'] = timed(len(sample), lambda: [Student.parse_row(row) for row in sample])
+    return results
+
+
+def bench_student_list(student_list, students, rng) -> dict:
+    results = {}
+
+    def add():
+        for student in students:
+            student_list.add_item(student)
+    results['add_item'] = timed(len(students), add)
+
+    numbers = [student.student_number for student in rng.choices(students, k=min(len(students), SAMPLE_SIZE))]
+
+    def get():
+        for number in numbers:
+            student_list.get_item_by_key_value('student_number', number)
+    results['get_item_by_key_value'] = timed(len(numbers), get)
+
+    updates = [(rng.randrange(len(students)), rng.randint(17, 26)) for _ in range(min(len(students), SAMPLE_SIZE))]
+
+    def update():
+        for i, age in updates:
+            student_list._update_item_attr_by_index(i, 'age', age)
+    results['_update_item_attr_by_index'] = timed(len(updates), update)
+
+    victims = rng.sample(students, min(len(students), DELETE_SAMPLE_SIZE))
+
+    def delete():
+        for student in victims:
+            student_list.delete_item(student)
+    results['delete_item'] = timed(len(victims), delete)
+    expected_length = len(students) - len(victims)
+
+    # 一个入学年份（名单的 1/10）的学生：批量修改，再批量删除（比如毕业的一届）
+    year = students[0].student_number[:4]
+    in_year = sum(student.student_number.startswith(year) for student in students if student not in victims)
+    results['update_where'] = timed(in_year, lambda: student_list.update_where(
+        lambda student: student.student_number.startswith(year), {'age': 26}))
+    results['delete_where'] = timed(in_year, lambda: student_list.delete_where(
+        lambda student: student.student_number.startswith(year)))
+    student_list.get_items_in_range('age', 26, 26)  # 索引的批量清理在下一次查询时做，算进来
+    expected_length -= in_year
+    if student_list.length != expected_length:
+        raise RuntimeError('StudentList length is wrong after the benchmark.')
+    return results
+
+
+def run_size(count: int, seed: int, use_journal: bool) -> dict:
+    """One roster size, run in a fresh process."""
+    with tempfile.TemporaryDirectory() as data_dir:
+        settings.use_data_dir(data_dir)
+        rng = random.Random(seed)
+        start = time.perf_counter()
+        rows = list(make_roster(count, seed))
+        results = {'generate_seconds': round(time.perf_counter() - start, 2)}
+        results.update(bench_validation(rows, rng))
+        sample = min(count, SAMPLE_SIZE)
+        results['allocate_id'] = timed(sample, lambda: [Student.get_new_unique_stu_id() for _ in range(sample)])
+        ids = Student.get_new_unique_stu_ids(count)
+        students = [Student.from_dict({'id': student_id, **data})
+                    for student_id, (_, data) in zip(ids, Student.parse_rows(rows))]
+        del rows
+        student_list = open_student_list(use_journal)
+        results.update(bench_student_list(student_list, students, rng))
+        student_list.close()
+        results['peak_rss_mb'] = peak_rss_mb()
+        return results
+
+
+def compare(result: dict, baseline: dict):
+    """Print ops/sec of result relative to baseline, e.g. +12.3% means faster than baseline."""
+    for size, ops in result['sizes'].items():
+        old_ops = baseline.get('sizes', {}).get(size, {})
+        for name, stats in ops.items():
+            old = old_ops.get(name)
+            if isinstance(stats, dict) and isinstance(old, dict) and old.get('ops_per_sec') and stats['ops_per_sec']:
+                change = stats['ops_per_sec'] / old['ops_per_sec'] - 1
+                print(f'{size:>10} {name:<30} {old["ops_per_sec"]:>14.1f} -> {stats["ops_per_sec"]:>14.1f} {change:+8.1%}')
+            elif name == 'peak_rss_mb' and old and stats:
+                print(f'{size:>10} {name:<30} {old:>14.1f} -> {stats:>14.1f} {stats / old - 1:+8.1%}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)), help='comma separated roster sizes')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--journal', action='store_true', help='attach a journal, so every write is persisted')
+    parser.add_argument('--output', help='also write the JSON result to this file')
+    parser.add_argument('--baseline', help='a previous JSON result to compare with')
+    args = parser.parse_args(argv)
+    result = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': 'numpy' in sys.modules,
+        'seed': args.seed,
+        'journal': args.journal,
+        'sizes': {},
+    }
+    context = multiprocessing.get_context('spawn')  # 新进程，内存峰值不受上一个规模影响
+    for size in (int(size) for size in args.sizes.split(',')):
+        with ProcessPoolExecutor(1, mp_context=context) as pool:
+            result['sizes'][str(size)] = pool.submit(run_size, size, args.seed, args.journal).result()
+    text = json.dumps(result, indent=2, sort_keys=True)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + os.linesep)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            compare(result, json.load(f))
+    return result
+
+
+if __name__ == '__main__':
+    main()
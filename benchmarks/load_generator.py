@@ -0,0 +1,175 @@
+"""
+HTTP 服务的负载测试：先批量添加学生，再用 C 个 keep-alive 连接并发地按学号查询 D 秒，报告每秒请求数和延迟。
+--writers W：同时还有 W 个连接不停地添加学生、W 个连接模糊搜索（GET /students?q=），检查读写并发时搜索不出错；
+这些请求不计入 requests_per_second，状态码不对的计入 errors。
+不传 --url 时在临时目录里启动一个服务进程（python -m studentcms --data-dir ... serve），不会动 studentcms/data。
+Usage: python -m benchmarks.load_generator [--url http://127.0.0.1:8000] [--students 1000] [--connections 50]
+                                           [--seconds 5] [--min-rps 1000] [--writers 0]
+"""
+import argparse
+import asyncio
+import json
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+
+async def request(reader, writer, method, path, data=None):
+    body = b'' if data is None else json.dumps(data).encode('utf-8')
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: bench\r\nContent-Length: {len(body)}\r\n\r\n'.encode() + body)
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    length = next(int(line.split(b':')[1]) for line in head.split(b'\r\n') if line.lower().startswith(b'content-length'))
+    return status, json.loads(await reader.readexactly(length))
+
+
+def letters_of(k: int) -> str:
+    """姓名里不能有数字，把 k 写成 a-z 的 "26 进制" """
+    letters = ''
+    while True:
+        k, r = divmod(k, 26)
+        letters = chr(ord('a') + r) + letters
+        if not k:
+            return letters
+
+
+def make_students(count: int) -> list[dict]:
+    return [{'student_number': f'2024{k:07d}', 'name': f'Bench N{letters_of(k)}', 'gender': k % 2, 'age': 18 + k % 10}
+            for k in range(count)]
+
+
+async def seed(host, port, students):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for start in range(0, len(students), 1000):
+            status, result = await request(reader, writer, 'POST', '/students', students[start:start + 1000])
+            if status != 201:
+                raise RuntimeError(f'Seeding failed: {status} {result["message"]}')
+    finally:
+        writer.close()
+
+
+async def lookup_loop(host, port, numbers, deadline, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, 'GET', f'/students/{random.choice(numbers)}')
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def add_loop(host, port, writer_no, deadline, counts, errors):
+    """Add one student after another; numbers start with 2025 so they don't collide with the seeded ones."""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        k = 0
+        while time.perf_counter() < deadline:
+            student = {'student_number': f'2025{writer_no:02d}{k:05d}', 'name': f'Bench W{letters_of(k)}',
+                       'gender': 1, 'age': 20}
+            status, _ = await request(reader, writer, 'POST', '/students', student)
+            counts['adds'] += 1
+            if status != 201:
+                errors.append(status)
+            k += 1
+    finally:
+        writer.close()
+
+
+async def search_loop(host, port, deadline, counts, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            status, _ = await request(reader, writer, 'GET', f'/students?q=bench+w{random.choice("abcdefgh")}&limit=20')
+            counts['searches'] += 1
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run_load(host, port, students, connections, seconds, writers=0):
+    await seed(host, port, students)
+    numbers = [student['student_number'] for student in students]
+    latencies, errors, counts = [], [], {'adds': 0, 'searches': 0}
+    start = time.perf_counter()
+    deadline = start + seconds
+    await asyncio.gather(*(lookup_loop(host, port, numbers, deadline, latencies, errors) for _ in range(connections)),
+                         *(add_loop(host, port, writer_no, deadline, counts, errors) for writer_no in range(writers)),
+                         *(search_loop(host, port, deadline, counts, errors) for _ in range(writers)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'students': len(students),
+        'connections': connections,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'error_statuses': sorted(set(errors)),
+        **counts,
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2) if latencies else None,
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 2) if latencies else None,
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(data_dir, port):
+    process = subprocess.Popen([sys.executable, '-m', 'studentcms', '--data-dir', data_dir, 'serve', '--port', str(port)])
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError('Server exited while starting.')
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('Server did not start in 30 seconds.')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='a running server; default: start one on a temporary data dir')
+    parser.add_argument('--students', type=int, default=1000)
+    parser.add_argument('--connections', type=int, default=50)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--min-rps', type=float, default=0, help='exit with 1 below this many requests per second')
+    parser.add_argument('--writers', type=int, default=0,
+                        help='also add students on this many connections and search names (?q=) on as many')
+    args = parser.parse_args(argv)
+    students = make_students(args.students)
+    if args.url:
+        url = urlsplit(args.url)
+        result = asyncio.run(run_load(url.hostname, url.port or 80, students, args.connections, args.seconds,
+                                      args.writers))
+    else:
+        with tempfile.TemporaryDirectory() as data_dir:
+            port = free_port()
+            server = start_server(data_dir, port)
+            try:
+                result = asyncio.run(run_load('127.0.0.1', port, students, args.connections, args.seconds,
+                                              args.writers))
+            finally:
+                server.terminate()
+                server.wait()
+    result['ok'] = result['errors'] == 0 and result['requests_per_second'] >= args.min_rps
+    print(json.dumps(result, indent=2))
+    return result
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main()['ok'] else 1)
@@ -0,0 +1,86 @@
+"""
+可复现的假学生名单：同一个 seed 生成的名单完全一样，所有字段都能通过 Student 的校验。
+
+* 学号：入学年份 + 7 位序号，11 位，不重复；
+* 身份证号：地区码 + 和年龄一致的出生日期 + 顺序码 + 正确的校验位，不重复（身份证号是唯一约束）。
+  校验位是 X 的号码 is_id_card_valid 不认（它把 X 换成了 '10' 再比较），所以遇到这种就换一个顺序码；
+* 手机号：1 + 3-9 + 9 位数字；
+* 姓名：中文名（含复姓）和英文名，大约 4:1。
+
+Usage: python -m benchmarks.roster [count] [seed]    （输出 CSV 到 stdout）
+"""
+import csv
+import random
+import sys
+
+from studentcms.utils.public_utils import ID_CARD_CHECK_CODE, ID_CARD_WEIGHT_FACTOR
+
+SURNAMES = '王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾肖田董袁潘于蒋蔡余杜叶程苏魏吕丁任沈姚卢'
+COMPOUND_SURNAMES = ('欧阳', '司马', '上官', '诸葛', '东方', '慕容')
+GIVEN_NAME_CHARS = '伟芳娜秀英敏静丽强磊军洋勇艳杰娟涛明超秀兰霞平刚桂英华玉萍红娥玲芬燕彬鹏飞宇浩然子轩雨欣梓涵一诺'
+ENGLISH_FIRST_NAMES = ('James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda', 'David', 'Emma',
+                       'William', 'Olivia', 'Richard', 'Sophia', 'Thomas', 'Mia', 'Daniel', 'Grace', 'Lucas', 'Chloe')
+ENGLISH_LAST_NAMES = ('Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Wilson', 'Moore',
+                      'Taylor', 'Anderson', 'Jackson', 'White', 'Harris', 'Martin', 'Thompson', 'Clark', 'Lewis', 'Lee')
+REGION_CODES = ('110101', '110105', '120101', '310101', '310115', '320102', '330106', '440103', '440305', '510104')
+ADDRESSES = ('Beijing', 'Shanghai', 'Tianjin', 'Nanjing', 'Hangzhou', 'Guangzhou', 'Shenzhen', 'Chengdu')
+ENROLLMENT_YEARS = range(2015, 2025)
+MAX_ROSTER_SIZE = 10 ** 7  # 学号的序号是 7 位
+
+
+def check_code_of(first_17: str) -> str:
+    return ID_CARD_CHECK_CODE[sum(int(d) * w for d, w in zip(first_17, ID_CARD_WEIGHT_FACTOR)) % 11]
+
+
+def make_id_card(rng: random.Random, birth_year: int) -> str:
+    prefix = f'{rng.choice(REGION_CODES)}{birth_year}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}'
+    sequence = rng.randrange(1000)
+    while True:
+        first_17 = f'{prefix}{sequence:03d}'
+        code = check_code_of(first_17)
+        if code != 'X':
+            return first_17 + code
+        sequence = (sequence + 1) % 1000
+
+
+def make_name(rng: random.Random) -> str:
+    if rng.random() < 0.2:
+        return f'{rng.choice(ENGLISH_FIRST_NAMES)} {rng.choice(ENGLISH_LAST_NAMES)}'
+    surname = rng.choice(COMPOUND_SURNAMES) if rng.random() < 0.02 else rng.choice(SURNAMES)
+    return surname + ''.join(rng.choice(GIVEN_NAME_CHARS) for _ in range(rng.randint(1, 2)))
+
+
+def make_roster(count: int, seed=0, optional_ratio=0.8):
+    """
+    Yield count student rows (dict of str, like a CSV row), deterministic for a seed.
+    optional_ratio 的学生有身份证号、手机号和地址。
+    """
+    if count > MAX_ROSTER_SIZE:
+        raise ValueError(f'At most {MAX_ROSTER_SIZE} students.')
+    rng = random.Random(seed)
+    used_id_cards = set()
+    for k in range(count):
+        year = ENROLLMENT_YEARS[k % len(ENROLLMENT_YEARS)]
+        age = rng.randint(17, 26)
+        row = {'student_number': f'{year}{k:07d}', 'name': make_name(rng), 'gender': str(rng.randint(0, 1)),
+               'age': str(age)}
+        if rng.random() < optional_ratio:
+            id_card = make_id_card(rng, 2024 - age)
+            while id_card in used_id_cards:
+                id_card = make_id_card(rng, 2024 - age)
+            used_id_cards.add(id_card)
+            row['id_card'] = id_card
+            row['phone_number'] = f'1{rng.randint(3, 9)}{rng.randrange(10 ** 9):09d}'
+            row['address'] = rng.choice(ADDRESSES)
+        yield row
+
+
+def main(count=1000, seed=0):
+    fields = ('student_number', 'name', 'gender', 'age', 'id_card', 'phone_number', 'address')
+    writer = csv.DictWriter(sys.stdout, fields)
+    writer.writeheader()
+    writer.writerows(make_roster(count, seed))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
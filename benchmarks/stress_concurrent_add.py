@@ -0,0 +1,109 @@
+"""
+并发压力测试：N 个进程（每个进程 T 个写线程 + 1 个读线程）同时往同一份数据里添加学生，
+结束后重新加载数据，检查 id 没有重复、没有丢失写入。数据放在临时目录里，不会动 studentcms/data。
+日志的 compact_every 设得很小，让进程之间互相触发 "其他进程做了快照，重新加载" 的情况。
+Usage: python -m benchmarks.stress_concurrent_add [processes] [students_per_process] [threads_per_process] [journal|sqlite]
+"""
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from studentcms import settings
+from studentcms.journal import Journal
+from studentcms.models import Student, StudentList
+from studentcms.storage import SQLiteStorage
+
+COMPACT_EVERY = 200
+
+
+def open_student_list(data_dir, backend):
+    settings.DATA_PICKLE_PATH = os.path.join(data_dir, 'current_id.pkl')
+    if backend == 'sqlite':
+        return StudentList(SQLiteStorage(os.path.join(data_dir, 'studentcms.sqlite3'), Student))
+    student_list = StudentList()
+    student_list.attach_journal(Journal(os.path.join(data_dir, 'students.journal'),
+                                        os.path.join(data_dir, 'students_snapshot.pkl'), compact_every=COMPACT_EVERY))
+    return student_list
+
+
+def student_numbers_of(process_no: int, thread_no: int, count: int):
+    return [f'{process_no:03d}{thread_no:02d}{k:06d}' for k in range(count)]  # 11 位，每个进程/线程不重叠
+
+
+def worker(process_no, data_dir, count, threads, backend):
+    student_list = open_student_list(data_dir, backend)
+    done = threading.Event()
+
+    def write(thread_no):
+        numbers = student_numbers_of(process_no, thread_no, count // threads)
+        k = 0
+        while k < len(numbers):
+            if k % 50 == 0:  # 一部分用批量添加
+                batch = [Student(number, 'Stress', 1, 20) for number in numbers[k:k + 10]]
+                student_list.add_items(batch)
+                k += len(batch)
+            else:
+                student_list.add_item(Student(numbers[k], 'Stress', 1, 20))
+                k += 1
+
+    def read():
+        while not done.is_set():  # 读线程和写线程并发，检查读锁
+            student_list.get_items_by_key_value('name', 'Stress')
+            student_list.get_page(0, 20)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    writers = [threading.Thread(target=write, args=(thread_no, )) for thread_no in range(threads)]
+    for thread in writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    done.set()
+    reader.join()
+    student_list.close()
+
+
+def main(processes=4, count=1000, threads=2, backend='journal'):
+    count -= count % threads
+    with tempfile.TemporaryDirectory() as data_dir:
+        start = time.perf_counter()
+        workers = [multiprocessing.Process(target=worker, args=(process_no, data_dir, count, threads, backend))
+                   for process_no in range(processes)]
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join()
+        elapsed = time.perf_counter() - start
+        student_list = open_student_list(data_dir, backend)
+        students = list(student_list.student_list)
+        student_list.close()
+    expected = {number for process_no in range(processes) for thread_no in range(threads)
+                for number in student_numbers_of(process_no, thread_no, count // threads)}
+    ids = [student.id for student in students]
+    numbers = [student.student_number for student in students]
+    result = {
+        'backend': backend,
+        'processes': processes,
+        'threads_per_process': threads,
+        'expected': len(expected),
+        'loaded': len(students),
+        'duplicate_ids': len(ids) - len(set(ids)),
+        'lost_writes': len(expected - set(numbers)),
+        'duplicate_writes': len(numbers) - len(set(numbers)),
+        'exit_codes': [process.exitcode for process in workers],
+        'seconds': round(elapsed, 2),
+    }
+    result['ok'] = (result['duplicate_ids'] == result['lost_writes'] == result['duplicate_writes'] == 0
+                    and result['loaded'] == result['expected'] and not any(result['exit_codes']))
+    print(json.dumps(result, indent=2))
+    return result
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    result = main(*(int(arg) for arg in args[:3]), *args[3:4])
+    sys.exit(0 if result['ok'] else 1)
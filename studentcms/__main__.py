@@ -0,0 +1,35 @@
+"""
+python -m studentcms          交互式菜单（和 main.py 一样）
+python -m studentcms serve    HTTP/JSON 服务，见 server.py
+"""
+import argparse
+
+from . import settings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m studentcms', description='Student CMS')
+    parser.add_argument('--data-dir', help='directory of the data files, default: settings.PROJECT_ROOT/data')
+    parser.add_argument('--metrics', metavar='FILE', help='record operation metrics and write them to FILE on exit')
+    subparsers = parser.add_subparsers(dest='command')
+    serve_parser = subparsers.add_parser('serve', help='serve students as a JSON HTTP API')
+    serve_parser.add_argument('--host', default=settings.SERVER_HOST)
+    serve_parser.add_argument('--port', type=int, default=settings.SERVER_PORT)
+    serve_parser.add_argument('--workers', type=int, default=settings.SERVER_WORKERS,
+                              help='threads running storage operations')
+    args = parser.parse_args(argv)
+    if args.data_dir:
+        settings.use_data_dir(args.data_dir)
+    if args.metrics:
+        settings.METRICS_ENABLED = True
+        settings.METRICS_DUMP_FILE = args.metrics
+    if args.command == 'serve':
+        from .server import run_server
+        run_server(args.host, args.port, args.workers)
+    else:
+        from .ui import UserInterfaceManager
+        UserInterfaceManager().run()
+
+
+if __name__ == '__main__':
+    main()
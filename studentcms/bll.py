@@ -1,7 +1,233 @@
 # Business Logic Lever
-from .models import Person, Student, StudentList, CourseList, StudentCourseList  # noqa
+from . import settings
+from .journal import Journal
+from .models import Person, Student, StudentList, Course, CourseList, StudentCourseScore, StudentCourseList  # noqa
+from .partitions import PartitionedStorage
+from .rankings import TOP_K, with_ranks
+from .snapshot import MappedJournal
+from .storage import MappedStorage, SQLiteStorage
+from .utils.metrics import metrics
+from .utils.public_utils import format_result
+
+MAX_RESULTS = 1000  # 一次查询最多返回多少个学生
 
 
 class StudentManager(StudentList):
     def __init__(self):
-        super().__init__()
+        if settings.METRICS_ENABLED:
+            metrics.enable()
+        if settings.STORAGE_BACKEND == 'sqlite':
+            students = SQLiteStorage(settings.SQLITE_DB_PATH, Student)
+            connection = students.connection  # 共用一个连接：删除学生/课程时级联删除成绩，在同一个事务里
+            super().__init__(students,
+                             CourseList(SQLiteStorage(settings.SQLITE_DB_PATH, Course, connection=connection)),
+                             StudentCourseList(SQLiteStorage(settings.SQLITE_DB_PATH, StudentCourseScore,
+                                                             connection=connection)))
+        elif settings.STORAGE_BACKEND == 'mmap':
+            super().__init__(MappedStorage(Student))
+            self.attach_journal(MappedJournal(settings.STUDENT_MAPPED_JOURNAL_PATH, settings.STUDENT_MAPPED_SNAPSHOT_PATH,
+                                              Student))
+        elif settings.STORAGE_BACKEND == 'partitioned':  # 每个分区有自己的日志，StudentList 不再 attach_journal
+            super().__init__(PartitionedStorage(Student, settings.STUDENT_PARTITIONS_PATH, settings.PARTITION_LOAD_WORKERS))
+        else:
+            super().__init__()
+            self.attach_journal(Journal(settings.STUDENT_JOURNAL_PATH, settings.STUDENT_SNAPSHOT_PATH))
+        if settings.STORAGE_BACKEND != 'sqlite':
+            self.course_list.attach_journal(Journal(settings.COURSE_JOURNAL_PATH, settings.COURSE_SNAPSHOT_PATH))
+            self.student_course_list.attach_journal(Journal(settings.SCORE_JOURNAL_PATH, settings.SCORE_SNAPSHOT_PATH))
+            
+    def refresh(self):
+        """Pick up what other running instances changed, called before every menu action."""
+        super().refresh()
+        self.course_list.refresh()
+        self.student_course_list.refresh()
+            
+    def close(self):
+        super().close()
+        self.course_list.close()
+        self.student_course_list.close()
+        if settings.METRICS_DUMP_FILE:
+            metrics.dump(settings.METRICS_DUMP_FILE)
+        
+    def archive_enrollment_year(self, year):
+        """Move the students of a (graduated) year into settings.STUDENT_ARCHIVE_PATH, their scores are kept."""
+        return self.drop_enrollment_year(year, settings.STUDENT_ARCHIVE_PATH)
+        
+    def metrics(self) -> dict:
+        """Snapshot of the operation metrics: calls, failures, latency histogram, bytes read/written per operation."""
+        return metrics.snapshot()
+    
+    def show_metrics(self):
+        if not metrics.enabled:
+            if input('Metrics are disabled, enable them now? (y/n): ').strip().lower() == 'y':
+                metrics.enable()
+            return
+        print(metrics.render())
+        
+    # ---- 非交互的接口：参数是普通的值/字典，返回 format_result 字典，给 HTTP 服务（server.py）等其他系统用 ----
+    @staticmethod
+    def student_to_data(student) -> dict:
+        """学生的公开信息，不包括内部的 id"""
+        data = student.to_dict()
+        data.pop('id', None)
+        return data
+    
+    @staticmethod
+    def _invalid(errors: dict, prefix=''):
+        """400 with the first error as message and the errors of all fields in data: {'errors': {attr: message}}"""
+        return format_result(400, prefix + next(iter(errors.values())), {'errors': errors})
+    
+    @staticmethod
+    def _parse_student(data) -> tuple[dict, dict]:
+        """(student data, {attr: error message}) of a POST body, by the schema of Student (forms.py)."""
+        if not isinstance(data, dict):
+            return {}, {'': 'Student data must be an object.'}
+        return Student.schema().clean(data)
+    
+    def api_get_student(self, student_number):
+        success, students_or_msg = self.get_items_by_key_value('student_number', student_number)
+        if not success:
+            return format_result(404, students_or_msg)
+        return format_result(200, 'OK', self.student_to_data(students_or_msg[0]))
+    
+    def api_find_students(self, query: dict):
+        """
+        query 里只用一种条件：name（完全匹配）、q（模糊搜索）、surname、age_min/age_max、student_number_prefix；
+        limit 限制返回的个数。
+        """
+        try:
+            limit = int(query.get('limit', 100))
+            if limit < 1:
+                return format_result(400, f'Invalid query: limit must be at least 1, got {limit}.')
+            limit = min(limit, MAX_RESULTS)
+            if 'name' in query:
+                success, students_or_msg = self.get_items_by_key_value('name', query['name'])
+            elif 'q' in query:
+                success, students_or_msg = self.search_students_by_name(query['q'], limit)
+            elif 'surname' in query:
+                success, students_or_msg = self.find_students_by_surname(query['surname'])
+            elif 'age_min' in query or 'age_max' in query:
+                low, high = query.get('age_min'), query.get('age_max')
+                success, students_or_msg = self.find_students_by_age_range(
+                    None if low is None else int(low), None if high is None else int(high))
+            elif 'student_number_prefix' in query:
+                success, students_or_msg = self.get_items_by_prefix('student_number', query['student_number_prefix'])
+            else:
+                return format_result(400, 'One of name, q, surname, age_min/age_max, student_number_prefix is required.')
+        except ValueError as e:
+            return format_result(400, f'Invalid query: {e}')
+        students = students_or_msg[:limit] if success else []
+        return format_result(200, 'OK' if success else students_or_msg, [self.student_to_data(s) for s in students])
+    
+    def api_add_students(self, data):
+        """data 是一个学生（字典）或者多个学生（列表）；多个学生在一个 batch 里添加，有一个不合法就都不添加。"""
+        rows = data if isinstance(data, list) else [data]
+        parsed = []
+        for n, row in enumerate(rows):
+            student_data, errors = self._parse_student(row)
+            if errors:
+                return self._invalid(errors, f'Student {n}: ' if isinstance(data, list) else '')
+            parsed.append(student_data)
+        ids = self.get_new_unique_stu_ids(len(parsed))
+        students = [Student.from_dict({'id': student_id, **row}) for student_id, row in zip(ids, parsed)]
+        success, msg = self.add_items(students)
+        if not success:  # 学号或身份证号重复
+            return format_result(409, msg)
+        result = [self.student_to_data(student) for student in students]
+        return format_result(201, f'{len(students)} students added.', result if isinstance(data, list) else result[0])
+    
+    @staticmethod
+    def _parse_changes(data) -> tuple[dict, dict]:
+        """(changes, {attr: error message}) of a PATCH body; a blank optional attribute is cleared (None)."""
+        if not isinstance(data, dict) or not data:
+            return {}, {'': 'Attributes to update are required.'}
+        return Student.schema().clean(data, partial=True)
+    
+    def _update_students(self, updates: list[tuple]):
+        """[(student_number, changes)] in one transaction: all updated or none. Returns format_result."""
+        with self.batch():  # 查找和修改在同一个写锁里，中间不会被其他线程/进程删掉
+            tx = self.transaction()
+            students = []
+            for student_number, changes in updates:
+                success, students_or_msg = self.get_items_by_key_value('student_number', student_number)
+                if not success:
+                    return format_result(404, students_or_msg)
+                tx.update(students_or_msg[0], changes)
+                students.append(students_or_msg[0])
+            success, msg = tx.commit()
+        if not success:  # 值都检查过了，只可能是学号或身份证号重复
+            return format_result(409, msg)
+        return format_result(200, msg, [self.student_to_data(student) for student in students])
+    
+    def api_update_student(self, student_number, data: dict):
+        changes, errors = self._parse_changes(data)
+        if errors:
+            return self._invalid(errors)
+        result = self._update_students([(student_number, changes)])
+        if result['code'] == 200:
+            result.update(message='Student updated.', data=result['data'][0])
+        return result
+    
+    def api_update_students(self, data):
+        """
+        data 是 [{'student_number': ..., 'changes': {...}}, ...]：批量修改在一个事务里，一次提交；
+        有一个不合法（找不到、值不合法、唯一约束冲突）就都不修改。
+        """
+        if not isinstance(data, list) or not data:
+            return format_result(400, 'A list of {"student_number": ..., "changes": {...}} is required.')
+        updates = []
+        for n, update in enumerate(data):
+            if not isinstance(update, dict) or 'student_number' not in update:
+                return format_result(400, f'Update {n}: student_number is required.')
+            changes, errors = self._parse_changes(update.get('changes'))
+            if errors:
+                return self._invalid(errors, f'Update {n}: ')
+            updates.append((update['student_number'], changes))
+        return self._update_students(updates)
+    
+    def api_delete_student(self, student_number):
+        with self.batch():
+            success, students_or_msg = self.get_items_by_key_value('student_number', student_number)
+            if not success:
+                return format_result(404, students_or_msg)
+            self.delete_item(students_or_msg[0])
+        return format_result(200, f'Student {student_number} deleted.')
+    
+    def api_statistics(self):
+        course_names = {course.id: course.name for course in self.course_list.course_list}
+        courses = self.student_course_list.course_aggregate_statistics()
+        averages = self.student_course_list.student_averages()
+        data = {
+            'students': self.length,
+            'courses': {course_id: {'name': course_names.get(course_id), **stats} for course_id, stats in courses.items()},
+            'students_with_scores': len(averages),
+            'average_of_student_averages': sum(averages.values()) / len(averages) if averages else None,
+        }
+        return format_result(200, 'OK', data)
+    
+    def api_rankings(self, query: dict):
+        """Top k scores of each course; query: course_id= (only this course), k= (default TOP_K)."""
+        try:
+            k = min(int(query.get('k', TOP_K)), MAX_RESULTS)
+            course_ids = [int(query['course_id'])] if 'course_id' in query else None
+        except ValueError as e:
+            return format_result(400, f'Invalid query: {e}')
+        tops = self.student_course_list.course_top_scores(k, course_ids)
+        students = self._students_by_ids(student_id for top in tops.values() for student_id, _ in top)
+        data = {}
+        for course_id, top in tops.items():
+            data[course_id] = [{'rank': rank, 'score': score,
+                                'student_number': students[student_id].student_number if student_id in students else None,
+                                'name': students[student_id].name if student_id in students else None}
+                               for rank, student_id, score in with_ranks(top)]
+        return format_result(200, 'OK', data)
+    
+    def api_student_ranks(self, student_number):
+        """Rank and percentile of a student in each of his/her courses."""
+        success, students_or_msg = self.get_items_by_key_value('student_number', student_number)
+        if not success:
+            return format_result(404, students_or_msg)
+        course_names = {course.id: course.name for course in self.course_list.course_list}
+        ranks = self.student_course_list.student_ranks(students_or_msg[0].id)
+        return format_result(200, 'OK', {course_id: {'name': course_names.get(course_id), **rank}
+                                         for course_id, rank in ranks.items()})
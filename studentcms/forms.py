@@ -0,0 +1,226 @@
+# Declarative field schema of models
+"""
+模仿 Django 的 Form：模型在 fields 里声明每个属性怎么转换、怎么校验，
+
+    class Course(Model):
+        fields = {'name': CharField(lambda x: x.strip() != ''), 'teacher': CharField(is_name_valid)}
+
+Schema.for_model(model) 把声明编译成一份计划，每个模型只编译一次：attr -> (转换函数, 校验函数, 是否必填, 错误信息模板)。
+校验一个值就是查一次字典、调用两个函数，不用每次重新建 lambda 的字典、转小写、判断属性是否合法。
+界面（Model.check_data/process_input）、CSV 导入（parse_rows）和 HTTP 接口（clean）用的都是这一份计划。
+
+校验函数不会抛异常：类型不对（比如 age 输入了 'x'）也只是不合法，返回错误信息。
+"""
+
+
+class Field:
+    """
+    One attribute of a model.
+
+    coerce(value): raw input (str from input()/CSV, or a JSON value) -> the type of the attribute; values which can't be
+    converted are returned unchanged and rejected by is_valid(). batch_validator(values) -> list[bool] checks a whole
+    column at once (CSV import) and must agree with is_valid().
+    """
+    converts_strings = True  # coerce() 会改变 str 的值；CharField 不会，CSV 导入时跳过这一步
+    value_types = None  # coerce() 之后值应该是的类型，查询条件用它判断值能不能转换；None: 不检查
+
+    def __init__(self, validator=None, batch_validator=None, label=None):
+        self.validator = validator
+        self.batch_validator = batch_validator
+        self.label = label  # 错误信息里的名字，默认是 model.display_attr(attr)
+
+    def coerce(self, value):
+        return value
+
+    def is_valid(self, value) -> bool:
+        return self.validator is None or bool(self.validator(value))
+
+
+class CharField(Field):
+    converts_strings = False
+    value_types = (str, )
+
+    def coerce(self, value):
+        # JSON 里的数字（学号、手机号）也当作字符串
+        return str(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else value
+
+    def is_valid(self, value) -> bool:
+        return isinstance(value, str) and (self.validator is None or bool(self.validator(value)))
+
+
+class IntegerField(Field):
+    value_types = (int, )
+
+    def __init__(self, min_value=None, max_value=None, choices=None, **kwargs):
+        super().__init__(**kwargs)
+        self.min_value, self.max_value = min_value, max_value
+        self.choices = None if choices is None else frozenset(choices)
+
+    def coerce(self, value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return value
+
+    def is_valid(self, value) -> bool:
+        if not isinstance(value, int):
+            return False
+        if self.choices is not None and value not in self.choices:
+            return False
+        if (self.min_value is not None and value < self.min_value) or (self.max_value is not None and value > self.max_value):
+            return False
+        return super().is_valid(value)
+
+
+class NumberField(IntegerField):
+    """int or float; '85.0' -> 85, '85.5' -> 85.5"""
+    value_types = (int, float)
+
+    def coerce(self, value):
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return value
+        return int(number) if number.is_integer() else number
+
+    def is_valid(self, value) -> bool:
+        if isinstance(value, float):
+            return (self.min_value is None or value >= self.min_value) and (self.max_value is None or value <= self.max_value)
+        return super().is_valid(value)
+
+
+def _is_blank(value) -> bool:
+    return value is None or value == ''
+
+
+class Schema:
+    """The compiled fields of one model, see the module docstring."""
+    _cache: dict = {}
+
+    def __init__(self, model: type):
+        self.model = model
+        self.input_attrs: tuple = model.required_attrs + model.optional_attrs  # 添加/导入时输入的属性，按这个顺序
+        self.required_attrs = frozenset(model.required_attrs)
+        self.plan: dict[str, tuple] = {}
+        self.coercers: dict = {}  # attr -> field.coerce，process_input 只需要这个
+        self.string_attrs = frozenset(attr for attr, field in model.fields.items() if not field.converts_strings)
+        self.batch_validators: dict = {}
+        for attr, field in model.fields.items():
+            label = field.label or model.display_attr(attr)
+            self.plan[attr] = (field.coerce, field.is_valid, attr in self.required_attrs, f'{{}} is an invalid {label}.')
+            self.coercers[attr] = field.coerce
+            if field.batch_validator is not None:
+                self.batch_validators[attr] = field.batch_validator
+        missing = [attr for attr in self.input_attrs if attr not in self.plan]
+        if missing:
+            raise TypeError(f'{model.__name__}.fields has no field for {", ".join(missing)}.')
+
+    @classmethod
+    def for_model(cls, model: type):
+        schema = cls._cache.get(model)
+        if schema is None:
+            schema = cls._cache[model] = cls(model)
+        return schema
+
+    def _entry(self, attr: str):
+        entry = self.plan.get(attr)
+        if entry is None and isinstance(attr, str) and attr.lower() in self.plan:  # 'Name' 也可以
+            entry = self.plan[attr.lower()]
+        return entry
+
+    def coerce(self, attr: str, value):
+        coerce = self.coercers.get(attr)
+        if coerce is None:
+            entry = self._entry(attr)
+            return value if entry is None else entry[0](value)
+        return coerce(value)
+
+    def coerce_lookup(self, attr: str, op: str, value):
+        """
+        The value of a query condition (filter(age__gt='18')) -> the type of attr, so that every storage compares
+        the same typed value. Only the type is checked, not the validator: age__lt=200 is a fine condition.
+        startswith always takes a str prefix; exact None/'' matches blank optional attributes and is kept.
+
+        Raises:
+            ValueError: the value can't be converted to the type of attr
+        """
+        entry = self.plan.get(attr)
+        if entry is None or (op == 'exact' and _is_blank(value)):
+            return value
+        if op == 'startswith':
+            return str(value)
+        if op == 'in':
+            return tuple(value if _is_blank(v) else self._coerce_lookup_value(attr, v) for v in value)
+        return self._coerce_lookup_value(attr, value)
+
+    def _coerce_lookup_value(self, attr: str, value):
+        field = self.model.fields[attr]
+        coerced = field.coerce(value)
+        if field.value_types is not None and (not isinstance(coerced, field.value_types) or isinstance(coerced, bool)):
+            raise ValueError(f'Invalid value for {attr}: {value!r}.')
+        return coerced
+
+    def check(self, attr: str, value, need_check_attr=True) -> tuple[bool, str]:
+        """(True, '') or (False, error message); a blank optional value is valid."""
+        entry = self._entry(attr)
+        if entry is None:
+            return False, f'{attr} is not a valid attribute.' if need_check_attr else f'Invalid {attr}'
+        _, is_valid, required, message = entry
+        if (required or not _is_blank(value)) and not is_valid(value):
+            return False, message.format(value)
+        return True, ''
+
+    def clean(self, data: dict, partial=False) -> tuple[dict, dict]:
+        """
+        Coerce and check a dict of raw values (e.g. a JSON body): returns (cleaned data, {attr: error message}).
+        Strings are stripped and blank optional values dropped, like parse_rows; partial=True (updates) doesn't
+        require the required attrs.
+        """
+        cleaned, errors = {}, {}
+        for attr, value in data.items():
+            entry = self._entry(attr)
+            if entry is None:
+                errors[attr] = f'{attr} is not a valid attribute.'
+                continue
+            coerce, is_valid, required, message = entry
+            value = coerce(value.strip() if isinstance(value, str) else value)
+            if _is_blank(value) and not required:
+                if partial:  # 修改时可以把可选属性清空
+                    cleaned[attr] = None
+                continue
+            if not is_valid(value):
+                errors[attr] = message.format(value)
+            else:
+                cleaned[attr] = value
+        if not partial:
+            for attr in self.input_attrs:
+                if attr in self.required_attrs and attr not in data:
+                    errors[attr] = f'{self.model.display_attr(attr)} is required.'
+        return cleaned, errors
+
+    def parse_rows(self, rows: list[dict]) -> list[tuple]:
+        """
+        Rows of strings (CSV) -> [(True, data) / (False, error message)], column by column: a column with a
+        batch_validator is checked in one call, is_valid() is only called for the values it rejects (to get the message).
+        """
+        datas: list[dict] = [{} for _ in rows]
+        errors: list = [None] * len(rows)
+        for attr in self.input_attrs:
+            coerce, is_valid, required, message = self.plan[attr]
+            values = [(row.get(attr) or '').strip() for row in rows]
+            if attr not in self.string_attrs:
+                values = list(map(coerce, values))
+            batch_validator = self.batch_validators.get(attr)
+            valid_mask = batch_validator(values) if batch_validator else None
+            for i, value in enumerate(values):
+                if errors[i] is not None:
+                    continue
+                if value == '':
+                    if required:
+                        errors[i] = message.format(value)
+                    continue
+                if not (valid_mask[i] if valid_mask is not None else is_valid(value)):
+                    errors[i] = message.format(value)
+                    continue
+                datas[i][attr] = value
+        return [(True, data) if error is None else (False, error) for data, error in zip(datas, errors)]
@@ -0,0 +1,260 @@
+# Secondary indexes for SqList
+"""
+SqList 的二级索引：
+* HashIndex: 哈希索引，等值查询 O(1)；
+* SortedIndex: 有序索引，范围查询和前缀查询 O(log n + k)；
+* AdjacencyIndex: 关联表两端的哈希索引（比如成绩的 student_id/course_id），桶很大时增删也是 O(1)。
+索引只保存 value -> items 的映射，不保存下标；下标在删除时会整体移动，维护起来不划算。
+"""
+import threading
+from bisect import bisect_left, insort
+
+_MISSING = object()  # 区分 "没传 value" 和 "value 就是 None"
+
+
+def prefix_upper_bound(prefix: str) -> str:
+    """The smallest string greater than every string starting with prefix (prefix must not be empty)."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class HashIndex:
+    """Hash index on one attribute: value -> list of items (bucket).
+
+    Unique indexes also use buckets, so lookups behave the same way for both kinds;
+    ``unique`` records the declaration of the model; SqList enforces it before adding or updating items.
+    """
+
+    def __init__(self, attr: str, unique=False):
+        self.attr = attr
+        self.unique = unique
+        self.buckets: dict = {}
+
+    def __len__(self):
+        return len(self.buckets)
+
+    @staticmethod
+    def is_value_indexable(value):
+        # 可选属性没填时是 None 或 ''，不进索引
+        return value is not None and value != ''
+
+    def add(self, item, value=_MISSING):
+        if value is _MISSING:
+            value = getattr(item, self.attr, None)
+        if not self.is_value_indexable(value):
+            return
+        bucket = self.buckets.get(value)
+        if bucket is None:
+            self.buckets[value] = [item]
+        else:
+            bucket.append(item)
+
+    def add_many(self, items):
+        """add() of many items in one loop, several times faster when loading a snapshot."""
+        attr, buckets = self.attr, self.buckets
+        for item in items:
+            value = getattr(item, attr, None)
+            if value is None or value == '':
+                continue
+            bucket = buckets.get(value)
+            if bucket is None:
+                buckets[value] = [item]
+            else:
+                bucket.append(item)
+
+    def remove(self, item, value=_MISSING):
+        if value is _MISSING:
+            value = getattr(item, self.attr, None)
+        if not self.is_value_indexable(value):
+            return
+        bucket = self.buckets.get(value)
+        if not bucket:
+            return
+        for i, indexed_item in enumerate(bucket):  # bucket 很短，按对象身份删除
+            if indexed_item is item:
+                bucket.pop(i)
+                break
+        if not bucket:
+            del self.buckets[value]
+
+    def update(self, item, old_value, new_value):
+        self.remove(item, old_value)
+        self.add(item, new_value)
+
+    def get(self, value) -> list:
+        """Return all items whose attr equals value (a new list)."""
+        return list(self.buckets.get(value, ()))
+
+    def count(self, value) -> int:
+        return len(self.buckets.get(value, ()))
+
+    def get_first(self, value):
+        bucket = self.buckets.get(value)
+        return bucket[0] if bucket else None
+
+    def contains(self, value):
+        return value in self.buckets
+
+    def clear(self):
+        self.buckets.clear()
+
+
+class AdjacencyIndex(HashIndex):
+    """Hash index on one end of a link model (StudentCourseScore.student_id/course_id): value -> {id(item): item}.
+
+    一个学生有几十个成绩、一门课有上千个学生，HashIndex 的列表桶删除时要逐个比较，删掉一门课的全部成绩是 O(k²)；
+    这里的桶是字典，增删都是 O(1)，查一个学生的课程/一门课的学生、级联删除都是 O(度数)。
+    """
+
+    def add(self, item, value=_MISSING):
+        if value is _MISSING:
+            value = getattr(item, self.attr, None)
+        if not self.is_value_indexable(value):
+            return
+        bucket = self.buckets.get(value)
+        if bucket is None:
+            self.buckets[value] = {id(item): item}
+        else:
+            bucket[id(item)] = item
+
+    def add_many(self, items):
+        for item in items:
+            self.add(item)
+
+    def remove(self, item, value=_MISSING):
+        if value is _MISSING:
+            value = getattr(item, self.attr, None)
+        bucket = self.buckets.get(value) if self.is_value_indexable(value) else None
+        if not bucket:
+            return
+        bucket.pop(id(item), None)
+        if not bucket:
+            del self.buckets[value]
+
+    def get(self, value) -> list:
+        return list(self.buckets.get(value, {}).values())
+
+    def get_first(self, value):
+        bucket = self.buckets.get(value)
+        return next(iter(bucket.values())) if bucket else None
+
+
+class SortedIndex:
+    """Ordered index on one attribute, for range and prefix queries.
+
+    entries 是按 (value, id(item)) 排好序的 (value, id(item), item) 列表；id 让每一项都唯一，
+    删除时可以直接二分定位，不用在大量相同的值（比如同龄的学生）里逐个比较。
+    新增的项先放进 _pending，查询前再合并：批量导入/启动加载时只排一次序，而不是每条都 insort。
+    删除也一样，先把 (value, id(item)) 记进 _removed（墓碑），查询前再一次性去掉：
+    批量删除/修改几万条时只扫一遍 entries，而不是每条都 del entries[i]（每次 O(n) 的移动）。
+    被标记删除的项还在 entries 里，引用着 item，所以 id(item) 在清理之前不会被新对象复用。
+    调用方（SqList）保证只 remove 索引里有的项，比如 update 的 old_value 就是索引里的值。
+    """
+    _PENDING_INSORT_LIMIT = 32  # pending/removed 少的时候逐个 insort/del，多的时候整体排序/过滤
+
+    def __init__(self, attr: str):
+        self.attr = attr
+        self.entries: list[tuple] = []
+        self._pending: list[tuple] = []
+        self._removed: set[tuple] = set()
+        self._merge_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries) + len(self._pending) - len(self._removed)
+
+    def _merge_pending(self):
+        if not self._pending and not self._removed:
+            return
+        with self._merge_lock:  # 查询是并发的（读锁），合并只能有一个线程做
+            if self._pending:
+                if len(self._pending) <= self._PENDING_INSORT_LIMIT:
+                    for entry in self._pending:
+                        insort(self.entries, entry)
+                else:
+                    self.entries.extend(self._pending)
+                    self.entries.sort()  # 两段有序数据，Timsort 近似线性地合并
+                self._pending.clear()
+            if self._removed:
+                self._apply_removed()
+
+    def _apply_removed(self):
+        removed = self._removed
+        if len(removed) <= self._PENDING_INSORT_LIMIT:
+            for key in removed:
+                i = bisect_left(self.entries, key)
+                if i < len(self.entries) and self.entries[i][1] == key[1] and self.entries[i][0] == key[0]:
+                    del self.entries[i]
+        else:
+            self.entries = [entry for entry in self.entries if (entry[0], entry[1]) not in removed]
+        removed.clear()
+
+    def add(self, item, value=_MISSING):
+        if value is _MISSING:
+            value = getattr(item, self.attr, None)
+        if not HashIndex.is_value_indexable(value):
+            return
+        key = (value, id(item))
+        if key in self._removed:  # 标记删除后又改回原来的值：项还在，去掉墓碑就行
+            self._removed.discard(key)
+        else:
+            self._pending.append((value, id(item), item))
+
+    def add_many(self, items):
+        """add() of many items; they are sorted into entries once, at the next query."""
+        if self._removed:  # 有墓碑时要逐个检查
+            for item in items:
+                self.add(item)
+            return
+        attr = self.attr
+        self._pending.extend((value, id(item), item) for item in items
+                             if (value := getattr(item, attr, None)) is not None and value != '')
+
+    def remove(self, item, value=_MISSING):
+        if value is _MISSING:
+            value = getattr(item, self.attr, None)
+        if HashIndex.is_value_indexable(value):
+            self._removed.add((value, id(item)))
+
+    def update(self, item, old_value, new_value):
+        if old_value == new_value:
+            return
+        self.remove(item, old_value)
+        self.add(item, new_value)
+
+    def get(self, value) -> list:
+        return self.range(value, value)
+
+    def _range_bounds(self, low, high) -> tuple[int, int]:
+        self._merge_pending()
+        start = 0 if low is None else bisect_left(self.entries, (low, ))
+        end = len(self.entries) if high is None else bisect_left(self.entries, (high, float('inf')))
+        return start, end
+
+    def _prefix_bounds(self, prefix: str) -> tuple[int, int]:
+        if not prefix:
+            return self._range_bounds(None, None)
+        self._merge_pending()
+        return bisect_left(self.entries, (prefix, )), bisect_left(self.entries, (prefix_upper_bound(prefix), ))
+
+    def range(self, low=None, high=None) -> list:
+        """Items with low <= value <= high, ordered by value; None means unbounded."""
+        start, end = self._range_bounds(low, high)
+        return [entry[2] for entry in self.entries[start:end]]
+
+    def prefix(self, prefix: str) -> list:
+        """Items whose (str) value starts with prefix, ordered by value."""
+        start, end = self._prefix_bounds(prefix)
+        return [entry[2] for entry in self.entries[start:end]]
+
+    def count_range(self, low=None, high=None) -> int:
+        """len(range(low, high)) in O(log n), used by the query planner to estimate selectivity."""
+        start, end = self._range_bounds(low, high)
+        return end - start
+
+    def count_prefix(self, prefix: str) -> int:
+        start, end = self._prefix_bounds(prefix)
+        return end - start
+
+    def clear(self):
+        self.entries.clear()
+        self._pending.clear()
+        self._removed.clear()
@@ -0,0 +1,232 @@
+# Write-ahead journal + snapshot persistence
+"""
+预写日志（WAL）：每次 add/delete/update 只往日志文件末尾追加一条很小的记录，不用每次都把整个列表重新 pickle。
+日志太长时做一次快照（compaction），把当前全部数据写进快照文件，然后清空日志，这样启动时 replay 的长度有上限。
+启动：先读快照，再 replay 日志里快照之后的记录。
+
+日志记录格式：4字节长度 + 4字节crc32 + pickle(record)。写到一半崩溃的尾巴会因为长度不够或 crc 不对被丢弃。
+日志文件的第一条记录是 ('generation', n)，快照里也存了 generation；两者不一致说明日志是上一代的（快照写完还没来得及清空日志就崩溃了），直接忽略。
+
+多个程序实例共用同一份日志：读写日志都在 locked() 里（进程间的文件锁）。拿到锁以后先用 read_new() 读出其他进程
+在我们上次读写之后追加的记录，replay 到内存里，再写自己的记录；其他进程做过快照（日志文件被换掉）时整体重新加载。
+"""
+import os
+import pickle
+import struct
+import zlib
+from contextlib import contextmanager
+
+from .utils.locks import FileLock, lock_path_of
+from .utils.metrics import count_bytes, timed
+from .utils.pickle_utils import load_pickle_file, update_pickle_file_atomically
+
+_HEADER = struct.Struct('<II')  # length, crc32
+DEFAULT_COMPACT_EVERY = 10000  # 日志超过这么多条就做一次快照
+
+
+class Journal:
+    def __init__(self, journal_path, snapshot_path, compact_every=DEFAULT_COMPACT_EVERY):
+        self.journal_path = journal_path
+        self.snapshot_path = snapshot_path
+        self.compact_every = compact_every
+        self.generation = 0
+        self.records_count = 0  # 当前日志里的记录数（不含 generation 头）
+        self._buffer: list[bytes] = []
+        self._batch_depth = 0
+        self._fp = None
+        self._offset = 0  # 日志文件里已经读过/写过的字节数，之后的是其他进程追加的
+        self._file_lock = FileLock(lock_path_of(journal_path))
+
+    @staticmethod
+    def _encode(record) -> bytes:
+        payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        return _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+    def _read_records(self, offset=0):
+        """Read valid records after offset, cut off the broken tail if there is one."""
+        records = []
+        if not os.path.exists(self.journal_path):
+            return records
+        with open(self.journal_path, 'rb') as fp:
+            fp.seek(offset)
+            data = fp.read()
+        count_bytes('Journal.read', read=len(data))
+        good_offset = 0
+        while good_offset + _HEADER.size <= len(data):
+            length, crc = _HEADER.unpack_from(data, good_offset)
+            start = good_offset + _HEADER.size
+            payload = data[start:start + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            records.append(pickle.loads(payload))
+            good_offset = start + length
+        if good_offset < len(data):
+            print(f"[Warning] Journal {self.journal_path} has a broken tail, {len(data) - good_offset} bytes dropped.")
+            with open(self.journal_path, 'r+b') as fp:
+                fp.truncate(offset + good_offset)
+        self._offset = offset + good_offset
+        return records
+
+    @timed()
+    def load(self):
+        """
+        Load snapshot and the journal tail written after it. Should be called with the journal locked.
+
+        Returns:
+            tuple[list, list]: (item states in snapshot, journal records to replay);
+            states is a MappedSnapshot for MappedJournal, see snapshot.py
+        """
+        self.generation, states = self._load_snapshot()
+        records = self._read_records()
+        if records and records[0] == ('generation', self.generation):
+            records = records[1:]
+        else:  # 空日志，或者是上一代的日志
+            records = []
+            self._rewrite_journal()
+        self.records_count = len(records)
+        self._open()
+        return states, records
+
+    def position(self) -> tuple:
+        """(generation, offset, records count) after load(), for resume() in another process."""
+        return self.generation, self._offset, self.records_count
+
+    def resume(self, position: tuple):
+        """
+        Continue after a load() done by another process (PartitionedStorage loads partitions in a process pool),
+        the journal must stay locked from that load() until here.
+        """
+        self.generation, self._offset, self.records_count = position
+        self._open()
+
+    def _load_snapshot(self):
+        """(generation, item states) of the snapshot file; subclasses may use another snapshot format."""
+        snapshot = load_pickle_file(self.snapshot_path) if os.path.exists(self.snapshot_path) else {}
+        return snapshot.get('generation', 0), snapshot.get('states', [])
+
+    def _write_snapshot(self, states):
+        states = list(states)
+        update_pickle_file_atomically(self.snapshot_path, {'generation': self.generation, 'states': states})
+        return states
+
+    def _open(self):
+        if self._fp is None:
+            self._fp = open(self.journal_path, 'ab')
+    
+    def _is_file_replaced(self) -> bool:
+        """Another process compacted the journal: our file object points to the old, replaced file."""
+        if self._fp is None:
+            return True
+        try:
+            current = os.stat(self.journal_path)
+        except FileNotFoundError:
+            return True
+        opened = os.fstat(self._fp.fileno())
+        return (current.st_ino, current.st_dev) != (opened.st_ino, opened.st_dev)
+    
+    @contextmanager
+    def locked(self):
+        """Hold the inter-process lock of the journal, buffered records are committed before it is released."""
+        with self._file_lock:
+            try:
+                yield self
+            finally:
+                self.commit()
+    
+    def read_new(self):
+        """
+        Records other processes appended since our last read/write. Should be called with the journal locked.
+
+        Returns:
+            tuple[list | None, list]: (None, new records), or (item states, records) when another process compacted
+            the journal, then everything must be reloaded from the new snapshot.
+        """
+        if self._is_file_replaced():
+            if self._fp is not None:
+                self._fp.close()
+                self._fp = None
+            return self.load()
+        if os.fstat(self._fp.fileno()).st_size == self._offset:
+            return None, []
+        records = self._read_records(self._offset)
+        self.records_count += len(records)
+        return None, records
+
+    def close(self):
+        self.commit()
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def _rewrite_journal(self):
+        """Start a new empty journal of current generation, replace the old one atomically."""
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+        tmp_path = f'{self.journal_path}.tmp'
+        with open(tmp_path, 'wb') as fp:
+            fp.write(self._encode(('generation', self.generation)))
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_path, self.journal_path)
+        self._offset = len(self._encode(('generation', self.generation)))
+
+    def append(self, record):
+        """Append a record. It is written at once, or at the end of the outermost batch()."""
+        self._buffer.append(self._encode(record))
+        self.records_count += 1
+        if self._batch_depth == 0:
+            self.commit()
+
+    def commit(self):
+        """Group commit: write all buffered records with one write() and one fsync()."""
+        if self._buffer:
+            self._write_buffer()
+
+    @timed('Journal.commit')
+    def _write_buffer(self):
+        self._open()
+        data = b''.join(self._buffer)
+        self._fp.write(data)
+        self._fp.flush()
+        os.fsync(self._fp.fileno())
+        count_bytes('Journal.commit', written=len(data))
+        self._offset += len(data)
+        self._buffer.clear()
+
+    @contextmanager
+    def batch(self):
+        """Edits inside the with block are committed together, costing one fsync."""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self.commit()
+
+    @property
+    def in_batch(self):
+        return self._batch_depth > 0
+
+    def need_compaction(self, items_count=0):
+        """
+        日志条数超过 compact_every 且超过当前数据条数时才压缩：
+        快照的代价和数据量成正比，这样均摊到每条修改上是 O(1)，replay 的长度也不会超过数据量。
+        """
+        return self.records_count >= max(self.compact_every, items_count)
+
+    @timed()
+    def compact(self, states):
+        """
+        Write all current item states (an iterable of dicts) to snapshot, then start a new journal.
+        Buffered records are already included in states, so they are dropped.
+        Returns the states as load() would return them from the new snapshot.
+        """
+        self._buffer.clear()
+        self.generation += 1
+        states = self._write_snapshot(states)
+        self._rewrite_journal()
+        self.records_count = 0
+        self._open()
+        return states
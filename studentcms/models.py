@@ -1,22 +1,111 @@
+import functools
+import threading
+from contextlib import contextmanager
+
 from . import settings
-from .utils.pickle_utils import load_pickle_file, update_pickle_file
+from .forms import CharField, IntegerField, NumberField, Schema
+from .indexes import AdjacencyIndex, HashIndex, SortedIndex
+from .name_search import NameSearchIndex
+from .query import Query, parse_conditions
+from .rankings import TOP_K, CourseRanking, with_ranks
+from .score_statistics import GRADE_LABELS, PERCENTILES, CourseAggregate, ScoreStatistics
+from .storage import DictStorage, ListStorage
+from .table_renderer import TableRenderer
+from .transaction import Transaction
+from .utils.id_allocator import get_id_allocator
+from .utils.locks import RWLock, read_locked
+from .utils.metrics import timed
 from .utils.public_utils import format_print, is_name_valid, is_id_card_valid, is_phone_number_valid, \
-    handle_keyboard_interrupt, is_student_number_valid
+    handle_keyboard_interrupt, is_student_number_valid, save_data_to_csv, load_data_from_csv, validate_id_cards, \
+    validate_names, validate_phone_numbers, validate_student_numbers
 
 
 # 存储结构
-class Person:
+class Model:
+    """
+    所有表的基类：声明持久化的属性和主键，负责对象和字典之间的转换。
+    子类都用 __slots__ 存属性，没有 __dict__，每个对象能省下一大半内存；没填的可选属性是 None。
+    """
+    __slots__ = ()
+    required_attrs: tuple = ()
+    optional_attrs: tuple = ()
+    stored_attrs: tuple = ()  # 持久化时保存的属性
+    pk_attrs: tuple = ('id', )  # 主键，日志/数据库里用它定位一条数据
+    fields: dict = {}  # attr -> Field，输入的转换和校验规则，编译成 Schema，见 forms.py
+    
+    def to_dict(self) -> dict:
+        """None 的属性不保存，和 "没有这个属性" 一样"""
+        data = {}
+        for attr in self.stored_attrs:
+            value = getattr(self, attr, None)
+            if value is not None:
+                data[attr] = value
+        return data
+    
+    @classmethod
+    def from_dict(cls, data: dict):
+        """还原对象；不调用 __init__，因为 __init__ 会分配新的 id"""
+        obj = cls.__new__(cls)
+        for attr in cls.optional_attrs:
+            setattr(obj, attr, None)
+        for k, v in data.items():
+            setattr(obj, k, v)
+        return obj
+    
+    @classmethod
+    def schema(cls) -> Schema:
+        return Schema.for_model(cls)
+    
+    @classmethod
+    def display_attr(cls, attr: str):
+        return attr.replace('_', ' ')
+    
+    @classmethod
+    def process_input(cls, key: str, value):
+        """Convert a raw input value (str) to the type of the attribute, e.g. age '20' -> 20."""
+        return Schema.for_model(cls).coerce(key, value)
+    
+    @classmethod
+    def check_data(cls, key: str, value, need_check_key=True) -> tuple[bool, str]:
+        return Schema.for_model(cls).check(key, value, need_check_key)
+    
+    @classmethod
+    def parse_row(cls, row: dict):
+        """
+        把一行字符串数据（比如 CSV 的一行）转换并校验成属性字典，空的可选属性不放进去。
+
+        Returns:
+            tuple[bool, dict | str]: (True, data) or (False, error message)
+        """
+        return cls.parse_rows([row])[0]
+    
+    @classmethod
+    def parse_rows(cls, rows: list[dict]) -> list[tuple]:
+        """parse_row 的批量版本，按列处理，有批量校验函数的列一次校验一整列，见 Schema.parse_rows。"""
+        return Schema.for_model(cls).parse_rows(rows)
+
+
+class Person(Model):
     required_attrs = ('name', 'gender', 'age')  # 不需要变的数据用元组比较好
     optional_attrs = ('id_card', 'phone_number', 'address')
+    stored_attrs = required_attrs + optional_attrs
+    __slots__ = required_attrs + optional_attrs
+    fields = {
+        'name': CharField(is_name_valid, batch_validator=validate_names),
+        'gender': IntegerField(choices=(0, 1)),
+        'age': IntegerField(min_value=6, max_value=123),
+        'id_card': CharField(is_id_card_valid, batch_validator=validate_id_cards),
+        'phone_number': CharField(is_phone_number_valid, batch_validator=validate_phone_numbers),
+        'address': CharField(),  # TODO: 让address成为选项，Choice那种
+    }
 
     def __init__(self, name, gender, age, **kwargs):
         self.name = name
         self.gender = gender  # 0: female; 1: male
         self.age = age
-        # 实例化其他任意个可选属性
-        for k, v in kwargs.items():
-            if k in Person.optional_attrs:
-                setattr(self, k, v)
+        # 实例化其他任意个可选属性，没传的是 None
+        for k in Person.optional_attrs:
+            setattr(self, k, kwargs.get(k))
 
     def __str__(self) -> str:  # 类型注解，Python3.5 引入
         return f'{self.name.title()} -- {self.gender_display}'
@@ -42,10 +131,34 @@ class Person:
     @classmethod
     def is_attr_required(cls, key: str):
         return key in cls.required_attrs
+    
+    @classmethod
+    def display_attr(cls, attr: str):
+        return attr.replace('_', ' ').title()
 
         
 class Student(Person):  # 继承
     required_attrs = ('student_number', ) + Person.required_attrs  # 元组内不可变，但是两个元组可以拼接
+    unique_index_attrs = ('student_number', 'id_card')  # SqList 会为这些属性建立哈希索引
+    index_attrs = ('name', )  # 可重复的索引，同名学生都能查出来
+    sorted_index_attrs = ('age', 'student_number')  # 有序索引：年龄范围、学号前缀（入学年份）查询
+    partition_attr = 'student_number'  # PartitionedStorage 按入学年份分区，见 partitions.py
+    # 二进制快照（snapshot.py）里的定长字段：(属性, struct 格式)；其他属性（name、address）放在字符串堆里
+    snapshot_fixed_attrs = (('id', 'q'), ('student_number', '11s'), ('gender', 'b'), ('age', 'h'),
+                            ('id_card', '18s'), ('phone_number', '11s'))
+    stored_attrs = ('id', ) + required_attrs + Person.optional_attrs
+    __slots__ = ('id', 'student_number')
+    fields = {'student_number': CharField(is_student_number_valid, batch_validator=validate_student_numbers),
+              **Person.fields}
+    table_columns = (  # (列名, 属性, 宽度)，TableRenderer 用它生成表格
+        ('Student Number', 'student_number', 15),
+        ('Name', 'name', 20),
+        ('Gender', 'gender_display', 10),
+        ('Age', 'age', 5),
+        ('ID Card', 'id_card', 20),
+        ('Phone Number', 'phone_number', 20),
+        ('Address', 'address', 20),
+    )
     
     def __init__(self, student_number, name, gender, age, **kwargs):
         super().__init__(name, gender, age, **kwargs)  # 调用父类的初始化，先把父类这些 实例属性 初始化
@@ -58,14 +171,17 @@ class Student(Person):  # 继承
         return ' -- '.join((desc1, desc2))  # 字符串拼接
              
     @staticmethod
-    def get_new_unique_stu_id() -> int:  # 从pickle获取唯一id
-        pickle_data = load_pickle_file(settings.DATA_PICKLE_PATH)
-        student_id = pickle_data.get('student_id')
-        if not student_id:
-            student_id = 1
-        pickle_data['student_id'] = student_id + 1
-        update_pickle_file(settings.DATA_PICKLE_PATH, pickle_data)
-        return student_id
+    def partition_of(student_number) -> str:
+        """学号的前 4 位是入学年份"""
+        return str(student_number)[:4]
+    
+    @staticmethod
+    def get_new_unique_stu_id() -> int:  # 从pickle预留的id段里获取唯一id
+        return get_id_allocator(settings.DATA_PICKLE_PATH).allocate('student_id')
+    
+    @staticmethod
+    def get_new_unique_stu_ids(count: int) -> list[int]:  # 批量导入时一次拿一批id
+        return get_id_allocator(settings.DATA_PICKLE_PATH).allocate_many('student_id', count)
     
     def print_student_info(self):
         # print(f'Student ID: {self.id}\tName: {self.name}\tGender: {self.gender_display}\tAge: {self.age}')  # 调用父类自定义属性 self.gender_display,不需要super().
@@ -75,57 +191,29 @@ class Student(Person):  # 继承
     @classmethod
     def print_columns_name(cls):
         # print('\t\t'.join(self.all_attrs))
-        print(f"{'Student Number':<15}{'Name':<20}{'Gender':<10}{'Age':<5}{'ID Card':<20}{'Phone Number':<20}{'Address':<20}")  # <:左对齐，>:右对齐，^:居中； 20:长度；
+        print(TableRenderer.for_model(Student).header)  # 列宽见 table_columns
     
     def print_student_info_simply(self):
-        """f-string 设置对齐效果比 \\t 和 print的%s 好 """
+        """对齐格式由 TableRenderer 按 table_columns 生成，和分页显示的表格一致"""
         # print('\t\t'.join([str(getattr(self, attr)) for attr in self.all_attrs if getattr(self, attr, None)]))
-        optional_attrs_str = ''.join([f'{getattr(self, attr):<20}' if getattr(self, attr, None) else f"{'':<20}" for attr in self.optional_attrs])
-        print(f"{self.student_number:<15}{self.name:<20}{self.gender_display:<10}{self.age:<5}{optional_attrs_str}")
+        print(TableRenderer.for_model(Student).render_row(self))
     
     # @classmethod
     # def is_attr_valid(cls, key: str):
     #     return super().is_attr_valid(key) or key in ('id',)  # TODO: 每个表都应该有id 和 xxx_id（stu_id, course_id, ...), id是保密的，所以这里注释掉了，在_get_item...方法里也跳过了对id的检查
-    
-    @classmethod
-    def check_data(cls, key: str, value, need_check_key=True) -> tuple[bool, str]:
-        key = key.lower()
-        if need_check_key and not cls.is_attr_valid(key):  # 调用继承的类方法
-            return False, f'{key} is not a valid attribute.'
-        else:
-            if cls.is_attr_required(key) or value:  # attr is required OR value is not blank
-                check_func_map = {
-                    'student_number': is_student_number_valid,
-                    'name': is_name_valid,
-                    'gender': lambda x: x in (0, 1),
-                    'age': lambda x: x >= 6 and x <= 123,
-                    'id_card': is_id_card_valid,
-                    'phone_number': is_phone_number_valid,
-                    'address': lambda _: True  # TODO: 让address成为选项，Choice那种
-                }
-                func = check_func_map.get(key)
-                if not func:
-                    return False, f'Invalid {key}'
-                elif not func(value):
-                    return False, f"{value} is an invalid {cls.display_attr(key)}."
-            return True, ''
-                
-    @classmethod
-    def process_input(cls, key: str, value):
-        try:
-            if key in ('gender', 'age'):
-                return int(value)
-            else:
-                return value
-        except ValueError:
-            return value
-        
-    @classmethod
-    def display_attr(cls, attr: str):
-        return attr.replace('_', ' ').title()
-        
 
-class Course:
+
+class Course(Model):
+    required_attrs = ('name', 'teacher')
+    stored_attrs = ('id', ) + required_attrs
+    index_attrs = ('name', )
+    __slots__ = stored_attrs
+    fields = {
+        'id': IntegerField(label='course id'),
+        'name': CharField(lambda x: x.strip() != '', label='course name'),
+        'teacher': CharField(is_name_valid, label='course teacher'),
+    }
+    
     def __init__(self, course_name, teacher):
         self.id = self.get_new_unique_course_id()
         self.name = course_name
@@ -136,32 +224,84 @@ class Course:
     
     @staticmethod
     def get_new_unique_course_id() -> int:
-        pickle_data = load_pickle_file(settings.DATA_PICKLE_PATH)
-        course_id = pickle_data.get('course_id')
-        if not course_id:
-            course_id = 1
-        pickle_data['course_id'] = course_id + 1
-        update_pickle_file(settings.DATA_PICKLE_PATH, pickle_data)
-        return course_id
+        return get_id_allocator(settings.DATA_PICKLE_PATH).allocate('course_id')
 
     def print_course_info(self):
         print(f'Course ID: {self.id}\tCourse Name: {self.name}\tTeacher: {self.teacher}')
 
 
-class StudentCourseScore:
+class StudentCourseScore(Model):
+    required_attrs = ('student_id', 'course_id', 'score')
+    stored_attrs = required_attrs
+    pk_attrs = ('student_id', 'course_id')  # 一个学生一门课只有一个成绩
+    adjacency_index_attrs = ('student_id', 'course_id')  # 两个方向：学生 -> 成绩（课程），课程 -> 成绩（学生）
+    __slots__ = stored_attrs
+    fields = {
+        'student_id': IntegerField(),
+        'course_id': IntegerField(),
+        'score': NumberField(min_value=0, max_value=100),
+    }
+    
     def __init__(self, student_id, course_id, score):
         self.student_id = student_id
         self.course_id = course_id
         self.score = score
+        
+    def __str__(self) -> str:
+        return f'{self.student_id} -- {self.course_id} -- {self.score}'
+
+
+PERCENTILE_NAMES = ('median', *(f'p{p}' for p in PERCENTILES if p != 50))  # 成绩统计显示的分位数
+
+
+def write_operation(func):
+    """SqList 的写操作在 self.batch() 里执行：拿到线程写锁和进程间的日志文件锁，并且先同步其他进程的修改"""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if self._rwlock.is_writing():  # 嵌套的写操作，外层已经拿到锁了
+            return func(self, *args, **kwargs)
+        with self.batch():
+            return func(self, *args, **kwargs)
+    return wrapper
 
 
 class SqList:
-    def __init__(self, Item: type):
+    def __init__(self, Item: type, storage=None):
         self.model = Item
-        self.sq_list: list[Item] = []
-        self.length = 0
+        # 存储后端，默认是内存里的 list；也可以传入 SQLiteStorage 等实现了 list 方法的对象，见 storage.py
+        self.sq_list: list[Item] = storage if storage is not None else ListStorage()
+        self.in_memory = getattr(self.sq_list, 'in_memory', True)
+        self.length = len(self.sq_list)
         #
         self.check_key_value = getattr(Item, 'check_data', lambda x, y, z=None: (False, 'Item has no check_data method.'))
+        # 二级索引：attr -> HashIndex，由 Item 声明；不在内存里的存储（SQLite）自己有索引，不需要再建
+        self.indexes: dict[str, HashIndex] = {}
+        if self.in_memory:
+            for attr in getattr(Item, 'unique_index_attrs', ()):
+                self.indexes[attr] = HashIndex(attr, unique=True)
+            for attr in getattr(Item, 'index_attrs', ()):
+                self.indexes[attr] = HashIndex(attr)
+            for attr in getattr(Item, 'adjacency_index_attrs', ()):
+                self.indexes[attr] = AdjacencyIndex(attr)
+        # 有序索引：attr -> SortedIndex，用于范围/前缀查询
+        self.sorted_indexes: dict[str, SortedIndex] = {}
+        if self.in_memory:
+            for attr in getattr(Item, 'sorted_index_attrs', ()):
+                self.sorted_indexes[attr] = SortedIndex(attr)
+        # id(item) -> index in sq_list; 删除/插入会让后面的下标整体移动，所以标记为 dirty，用到时再重建
+        self._positions: dict[int, int] = {}
+        self._positions_dirty = False
+        # 持久化日志，见 attach_journal()；为 None 时只存在内存里
+        self.journal = None
+        self.version = 0  # 每次修改 +1，缓存（比如成绩统计的数组）用它判断数据有没有变
+        self.pk_attrs = getattr(Item, 'pk_attrs', ('id', ))
+        # 唯一约束：unique_index_attrs 的值（None/'' 除外）不能重复，增加和修改时检查；replay 日志时不检查，日志里的修改都已经检查过了
+        self.unique_attrs: tuple = getattr(Item, 'unique_index_attrs', ())
+        # 主键重复也要检查：id 是分配的，不会重复；其他主键（成绩的 (student_id, course_id)）是输入的，存储能按主键查时检查
+        self._check_keys = self.pk_attrs != ('id', ) and hasattr(self.sq_list, 'find_by_key')
+        self._replaying = False
+        # 多线程：读操作可以并发，写操作（包括 batch）互斥，见 read_locked/write_operation
+        self._rwlock = RWLock()
 
     def is_empty(self):
         return self.length == 0
@@ -181,45 +321,489 @@ class SqList:
             return False, f'Index--{i} out of list.'
         return True, ''
     
-    def add_item(self, item):
-        """Add item to list."""
+    def _index_item(self, item):
+        for index in self.indexes.values():
+            index.add(item)
+        for index in self.sorted_indexes.values():
+            index.add(item)
+            
+    def _index_items(self, items: list):
+        """_index_item() of many items, one pass per index. Subclasses overriding _index_item override it too."""
+        for index in (*self.indexes.values(), *self.sorted_indexes.values()):
+            index.add_many(items)
+    
+    def _unindex_item(self, item):
+        for index in self.indexes.values():
+            index.remove(item)
+        for index in self.sorted_indexes.values():
+            index.remove(item)
+        self._positions.pop(id(item), None)
+            
+    def _item_key(self, item):
+        return tuple(getattr(item, attr) for attr in self.pk_attrs)
+    
+    def _log_change(self, *record):
+        """Every change goes through here: bump version, write it to journal and compact the journal when it grows too long."""
+        self.version += 1
+        if self.journal is None:
+            return
+        self.journal.append(record)
+        self._compact_journal_if_needed()
+    
+    def _compact_journal_if_needed(self):
+        # batch 里先不压缩，等 batch 结束再检查，避免批量导入时反复写快照
+        if self.journal is not None and not self.journal.in_batch and self.journal.need_compaction(self.length):
+            states = self.journal.compact(item.to_dict() for item in self.sq_list)
+            if hasattr(self.sq_list, 'attach_snapshot'):  # 新快照里已经有全部数据，MappedStorage 换成新快照
+                self.sq_list.attach_snapshot(states)
+    
+    @timed()
+    def attach_journal(self, journal):
+        """
+        Load items from journal's snapshot and replay the journal tail, then log every later change to it.
+        Should be called on an empty list.
+        """
+        with self._rwlock.write_lock(), journal.locked():
+            states, records = journal.load()
+            self.journal = None  # replay 时不再写日志
+            self._load_journal_data(states, records)
+            self.journal = journal
+        return True, f'{self.length} {self.model.__name__} loaded.'
+    
+    def _load_journal_data(self, states, records: list):
+        items = {}
+        replaying, self._replaying = self._replaying, True
+        try:
+            if hasattr(self.sq_list, 'attach_snapshot'):  # MappedStorage 直接使用映射的快照，不逐个加载
+                self.sq_list.attach_snapshot(states)
+                self.length = len(self.sq_list)
+                self._rebuild_derived_data()
+            else:
+                loaded = [self.model.from_dict(state) for state in states]
+                self._add_loaded_items(loaded)
+                if records:  # 只有 replay 需要按主键找对象
+                    items = {self._item_key(item): item for item in loaded}
+            self._replay_changes(records, items)
+        finally:
+            self._replaying = replaying
+    
+    def _add_loaded_items(self, items: list):
+        """
+        Append items loaded from a snapshot: one extend(), no unique checks and no log records (they are already stored),
+        several times faster than add_item() per item on startup.
+        """
+        start = self.length
+        self.sq_list.extend(items)
+        if self.in_memory:
+            self._positions.update((id(item), start + n) for n, item in enumerate(items))
+        self._index_items(items)
+        self.length += len(items)
+        self.version += 1
+    
+    def _sync_journal(self):
+        """
+        Replay the records other processes (other running instances) appended to the journal since we last read it.
+        Called with the journal locked, before every write.
+        """
+        journal = self.journal
+        states, records = journal.read_new()
+        if states is None and not records:
+            return
+        self.journal = None  # replay 时不再写日志
+        try:
+            if states is not None:  # 其他进程做了快照，从新的快照重新加载
+                self._clear()
+                self._load_journal_data(states, records)
+            else:
+                # 只有 delete/set 等需要按主键找到对象；不在内存里的存储用 find_by_key 找，见 _replay_item
+                need_keys = self.in_memory and any(record[0] != 'add' for record in records)
+                items = {self._item_key(item): item for item in self.sq_list} if need_keys else {}
+                self._replay_changes(records, items)
+        finally:
+            self.journal = journal
+    
+    def _clear(self):
+        """Remove all items without logging, before reloading from a snapshot."""
+        self.sq_list.clear()
+        for index in (*self.indexes.values(), *self.sorted_indexes.values()):
+            index.clear()
+        self._positions = {}
+        self._positions_dirty = False
+        self.length = 0
+        self.version += 1
+        self._rebuild_derived_data()
+    
+    def _rebuild_derived_data(self):
+        """Subclasses which keep their own derived data (aggregates, search indexes) rebuild it from sq_list here."""
+        pass
+    
+    def _replay_changes(self, records: list, items: dict):
+        """Replay journal records; consecutive deletes (e.g. from delete_where) are applied with one delete_items()."""
+        replaying, self._replaying = self._replaying, True
+        try:
+            self._replay_records(records, items)
+        finally:
+            self._replaying = replaying
+    
+    def _replay_item(self, items: dict, key, pop=False):
+        """The item of key while replaying: from items, or from the storage when it is not in memory."""
+        item = items.pop(key, None) if pop else items.get(key)
+        if item is None and not self.in_memory:
+            item = self.sq_list.find_by_key(key)
+        return item
+    
+    def _replay_records(self, records: list, items: dict):
+        deleted = []
+        for record in records:
+            if record[0] == 'delete':
+                item = self._replay_item(items, record[1], pop=True)
+                if item is not None:
+                    deleted.append(item)
+                continue
+            if deleted:
+                self.delete_items(deleted)
+                deleted = []
+            self._replay_change(record, items)
+        if deleted:
+            self.delete_items(deleted)
+    
+    def _replay_change(self, record, items: dict):
+        op = record[0]
+        if op == 'add':
+            item = self.model.from_dict(record[1])
+            self.add_item(item)
+            items[self._item_key(item)] = item
+        elif op == 'insert':
+            item = self.model.from_dict(record[2])
+            self.add_item_by_index(record[1], item)
+            items[self._item_key(item)] = item
+        elif op == 'replace':
+            old_item = self._replay_item(items, record[1], pop=True)
+            if old_item is not None:
+                new_item = self.model.from_dict(record[2])
+                self._update_item_by_index(self._get_item_position(old_item), new_item, False)
+                items[self._item_key(new_item)] = new_item
+        elif op in ('update', 'set'):  # ('update', key, {attr: value})；'set' 是以前的版本一次只改一个属性的记录
+            changes = record[2] if op == 'update' else {record[2]: record[3]}
+            item = self._replay_item(items, record[1])
+            if item is not None:
+                self._set_item_attrs(item, changes)
+                if any(attr in self.pk_attrs for attr in changes):
+                    items.pop(record[1], None)
+                    items[self._item_key(item)] = item
+    
+    @contextmanager
+    def batch(self):
+        """
+        Changes inside `with self.batch():` are committed to journal/storage together (one fsync).
+
+        batch 也是写锁：线程之间用读写锁互斥，进程之间用日志的文件锁（SQLite 用它自己的写事务）互斥；
+        拿到锁以后先同步其他进程的修改，保证在最新的数据上改。不要在 batch 里等待用户输入。
+        """
+        if self._rwlock.is_writing():  # 嵌套的 batch，外层已经拿到锁、同步过了
+            yield
+            return
+        self._rwlock.acquire_write()
+        try:
+            if self.journal is not None:
+                with self.journal.locked():
+                    self._sync_journal()
+                    with self.journal.batch():
+                        yield
+                    self._compact_journal_if_needed()
+            elif hasattr(self.sq_list, 'batch'):
+                with self._storage_batch():
+                    yield
+            else:
+                yield
+        finally:
+            self._rwlock.release_write()
+    
+    @contextmanager
+    def _storage_batch(self):
+        """batch() of a storage with its own transactions (SQLite): rolled back on exceptions, then resync from it."""
+        try:
+            with self.sq_list.batch():
+                if self.sq_list.changed_by_others():
+                    self.length = len(self.sq_list)
+                    self._rebuild_derived_data()
+                yield
+        except BaseException:
+            self.length = len(self.sq_list)
+            self.version += 1
+            self._rebuild_derived_data()
+            raise
+    
+    @timed()
+    def refresh(self):
+        """Pick up the changes made by other running instances of the program."""
+        with self.batch():
+            pass
+    
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+        self.sq_list.close()
+    
+    @timed()
+    @read_locked
+    def get_page(self, start: int, size: int) -> list:
+        """Items in [start, start + size), only these rows are read (slice of list / LIMIT OFFSET of SQLite)."""
+        return self.sq_list[start:start + size]
+    
+    def _get_item_position(self, item):
+        """Get the index of item in sq_list by identity, O(1) unless positions are dirty."""
+        if not self.in_memory:
+            return self.sq_list.position_of(item)
+        if self._positions_dirty:
+            self._positions = {id(x): i for i, x in enumerate(self.sq_list)}
+            self._positions_dirty = False
+        return self._positions.get(id(item))
+    
+    def _unique_value_conflict(self, attr: str, value, exclude=None):
+        """Error message if another item (not exclude) already has value as its unique attr, else None. O(1) with the hash index."""
+        if self._replaying or attr not in self.unique_attrs or not HashIndex.is_value_indexable(value):
+            return None
+        index = self.indexes.get(attr)
+        if index is not None and exclude is None:
+            taken = index.contains(value)
+        else:
+            exclude_key = None if exclude is None else self._item_key(exclude)
+            taken = any(self._item_key(owner) != exclude_key for owner in self._find_items(attr, value))
+        return f'{self.model.__name__} with {attr}={value} already exists.' if taken else None
+    
+    def _key_conflict(self, key: tuple, exclude_keys=()):
+        """Error message if an item (other than exclude_keys) already has primary key key, else None."""
+        if self._replaying or not self._check_keys or key in exclude_keys or self.sq_list.find_by_key(key) is None:
+            return None
+        return self._key_exists_message(key)
+    
+    def _key_exists_message(self, key: tuple) -> str:
+        return f'{self.model.__name__} with {", ".join(f"{a}={v}" for a, v in zip(self.pk_attrs, key))} already exists.'
+    
+    def _batch_key_conflicts(self, items: list) -> list:
+        """Primary key conflict message (or None) of every item, with stored items and earlier items of the batch."""
+        if self._replaying or not self._check_keys:
+            return [None] * len(items)
+        seen, conflicts = set(), []
+        for item in items:
+            key = self._item_key(item)
+            conflicts.append(self._key_exists_message(key) if key in seen else self._key_conflict(key))
+            seen.add(key)
+        return conflicts
+    
+    def _unique_conflict(self, item, exclude=None):
+        msg = self._key_conflict(self._item_key(item), () if exclude is None else (self._item_key(exclude), ))
+        if msg:
+            return msg
+        for attr in self.unique_attrs:
+            msg = self._unique_value_conflict(attr, getattr(item, attr, None), exclude)
+            if msg:
+                return msg
+        return None
+    
+    def _existing_values(self, attr: str, values: set) -> set:
+        """The values of attr which are already used by some item."""
+        index = self.indexes.get(attr)
+        if index is not None:
+            return {value for value in values if index.contains(value)}
+        if not self.in_memory:
+            return self.sq_list.existing_values(attr, values)
+        return values & {getattr(item, attr, None) for item in self.sq_list}
+    
+    @read_locked
+    def check_unique_items(self, items: list) -> list[tuple]:
+        """
+        Check the unique attrs of a whole batch in one pass: one lookup per value, duplicates inside the batch included
+        (the first one wins). Returns [(True, '') / (False, error message)] in the order of items.
+        """
+        if self._replaying or not (self.unique_attrs or self._check_keys):
+            return [(True, '')] * len(items)
+        key_conflicts = self._batch_key_conflicts(items)
+        existing = {attr: self._existing_values(attr, {value for item in items if HashIndex.is_value_indexable(
+            value := getattr(item, attr, None))}) for attr in self.unique_attrs}
+        seen: dict[str, set] = {attr: set() for attr in self.unique_attrs}
+        results = []
+        for item, key_conflict in zip(items, key_conflicts):
+            if key_conflict:
+                results.append((False, key_conflict))
+                continue
+            values = [(attr, getattr(item, attr, None)) for attr in self.unique_attrs]
+            values = [(attr, value) for attr, value in values if HashIndex.is_value_indexable(value)]
+            conflict = next(((attr, value) for attr, value in values
+                             if value in existing[attr] or value in seen[attr]), None)
+            if conflict is not None:
+                results.append((False, f'{self.model.__name__} with {conflict[0]}={conflict[1]} already exists.'))
+                continue
+            for attr, value in values:
+                seen[attr].add(value)
+            results.append((True, ''))
+        return results
+    
+    @timed()
+    @write_operation
+    def add_item(self, item, check_unique=True):
+        """Add item to list. check_unique=False when the caller has checked it (PartitionedStorage moving an item)."""
+        msg = self._unique_conflict(item) if check_unique else None
+        if msg:
+            return False, msg
         self.sq_list.append(item)
+        if self.in_memory:
+            self._positions[id(item)] = self.length
+        self._index_item(item)
         self.length += 1
+        self._log_change('add', item.to_dict())
         return True, f'{self.model.__name__} {item} added.'
     
+    @timed()
+    @write_operation
+    def add_items(self, items: list, check_unique=True):
+        """Add many items at once, SQLiteStorage inserts them with executemany()."""
+        if not items:
+            return True, f'0 {self.model.__name__} added.'
+        with self.batch():
+            errors = [msg for success, msg in self.check_unique_items(items) if not success] if check_unique else []
+            if errors:  # 要么全部添加，要么都不添加
+                return False, f'{len(errors)} of {len(items)} {self.model.__name__} rejected, none added: {errors[0]}'
+            start = self.length
+            self.sq_list.extend(items)
+            if self.in_memory:
+                self._positions.update((id(item), start + n) for n, item in enumerate(items))
+            self._index_items(items)
+            for item in items:
+                self._log_change('add', item.to_dict())
+            self.length += len(items)
+        return True, f'{len(items)} {self.model.__name__} added.'
+    
+    @timed()
+    @write_operation
     def add_item_by_index(self, i: int, item):  # maybe not used
         """Add item to list with index."""
         success, msg = self.is_index_valid(i)
         if not success:
             return success, msg
+        msg = self._unique_conflict(item)
+        if msg:
+            return False, msg
         self.sq_list.insert(i, item)
+        self._index_item(item)
+        self._positions_dirty = True
         self.length += 1
+        self._log_change('insert', i, item.to_dict())
         return True, f'{self.model.__name__} {item} added.'
     
-    def _get_item_index_by_key_value(self, key: str, value):  # TODO: 查询结果有两个怎么办
+    @read_locked
+    def _get_item_index_by_key_value(self, key: str, value):
         """
         Used to get the index of item in sq_list.
         Will be used before updating or deleting item.
+        If more than one item matched, the first one is used; use get_items_by_key_value() to get all.
         """
         if key != 'id':
             success, msg = self.check_key_value(key, value)
             if not success:
                 return False, msg
-        for i, item in enumerate(self.sq_list):  # i begins from 0.
-            attr = getattr(item, key)
-            if attr == value:
-                return True, i  # This index do not need to do is_index_valid().
+        index = self.indexes.get(key)
+        if index is not None or not self.in_memory:
+            items = self._find_items(key, value)
+            if items:
+                return True, self._get_item_position(items[0])  # This index do not need to do is_index_valid().
+        else:
+            for i, item in enumerate(self.sq_list):  # i begins from 0.
+                attr = getattr(item, key, None)
+                if attr == value:
+                    return True, i
         return False, f'{self.model.__name__} with {key}={value} not found.'
     
+    def _find_items(self, key: str, value) -> list:
+        """All items with item.key == value, use index if possible."""
+        index = self.indexes.get(key)
+        if index is not None:
+            return index.get(value)
+        if not self.in_memory:
+            return self.sq_list.find_items(key, value)
+        return [item for item in self.sq_list if getattr(item, key, None) == value]
+    
+    @timed()
+    @read_locked
     def get_item_by_key_value(self, key: str, value):
         """Get item by key-value."""
+        if not self.in_memory:  # 存储按索引直接返回对象，不用先算下标再按下标取一次
+            success, items_or_msg = self.get_items_by_key_value(key, value)
+            return (True, items_or_msg[0]) if success else (False, items_or_msg)
         success, i_or_msg = self._get_item_index_by_key_value(key, value)
         if not success:
             return success, i_or_msg
         if not isinstance(i_or_msg, int):  # without this check, self.sq_list[i_or_msg] will show error.
             return False, i_or_msg
         return True, self.sq_list[i_or_msg]
+    
+    @timed()
+    @read_locked
+    def get_items_by_key_value(self, key: str, value):
+        """Get all items matched by key-value, e.g. students with the same name."""
+        if key != 'id':
+            success, msg = self.check_key_value(key, value)
+            if not success:
+                return False, msg
+        items = self._find_items(key, value)
+        if not items:
+            return False, f'{self.model.__name__} with {key}={value} not found.'
+        return True, items
         
+    @timed()
+    @read_locked
+    def get_items_in_range(self, key: str, low=None, high=None):
+        """
+        Items with low <= item.key <= high (None means unbounded), ordered by key.
+        Uses the SortedIndex of key, O(log n + k); SQLite uses its B-tree index.
+        """
+        items = self._items_in_range(key, low, high)
+        if not items:
+            return False, f'{self.model.__name__} with {low} <= {key} <= {high} not found.'
+        return True, items
+    
+    @timed()
+    @read_locked
+    def get_items_by_prefix(self, key: str, prefix: str):
+        """Items whose item.key (str) starts with prefix, ordered by key, O(log n + k) with a SortedIndex."""
+        items = self._items_with_prefix(key, prefix)
+        if not items:
+            return False, f'{self.model.__name__} with {key} starting with {prefix} not found.'
+        return True, items
+    
+    def _items_in_range(self, key: str, low=None, high=None) -> list:
+        index = self.sorted_indexes.get(key)
+        if index is not None:
+            return index.range(low, high)
+        if not self.in_memory:
+            return self.sq_list.find_range(key, low, high)
+        return self._scan_sorted(key, lambda value: (low is None or value >= low) and (high is None or value <= high))
+    
+    def _items_with_prefix(self, key: str, prefix: str) -> list:
+        index = self.sorted_indexes.get(key)
+        if index is not None:
+            return index.prefix(prefix)
+        if not self.in_memory:
+            return self.sq_list.find_prefix(key, prefix)
+        return self._scan_sorted(key, lambda value: str(value).startswith(prefix))
+    
+    def filter(self, **conditions) -> Query:
+        """
+        Lazy AND-query, e.g. filter(gender=1, age__gte=18, student_number__startswith='2020'), see query.py.
+        Iterate it for all matches; .explain() shows which index the planner chose.
+        """
+        return Query(self, parse_conditions(self.model, conditions))
+    
+    def _scan_sorted(self, key: str, match) -> list:
+        """Full scan fallback for keys without a SortedIndex: items whose key value matches, ordered by key."""
+        items = [item for item in self.sq_list
+                 if HashIndex.is_value_indexable(getattr(item, key, None)) and match(getattr(item, key))]
+        items.sort(key=lambda item: getattr(item, key))
+        return items
+    
+    @timed()
+    @write_operation
     def delete_item(self, item):
         """Delete item from list."""
         if self.is_empty():
@@ -227,36 +811,95 @@ class SqList:
         try:
             self.sq_list.remove(item)
             self.length -= 1
+            self._unindex_item(item)
+            self._positions_dirty = True
+            self._log_change('delete', self._item_key(item))
         except ValueError:
             return False, f'{self.model.__name__} {item} not found.'
         else:
+            if not self._replaying:
+                self._items_deleted([item])
             return True, f'{self.model.__name__} {item} deleted.'  # try没有异常时执行，也可以直接放到try中，取消else部分
         
+    def _items_deleted(self, items: list):
+        """
+        Called after items are deleted, except by replay: the cascaded deletes are in the other lists' own journals.
+        Subclasses cascade the delete here.
+        """
+        pass
+    
+    @timed()
+    @write_operation
+    def delete_items(self, items: list):
+        """
+        Delete many items in one pass: storage removes them with one scan (tombstones + compaction, or one SQLite
+        transaction), length and positions are updated once, the journal is committed once.
+        """
+        removed = self.sq_list.remove_many(items) if items else []
+        for item in removed:
+            self._unindex_item(item)
+            self._log_change('delete', self._item_key(item))
+        if not removed:
+            return False, f'No {self.model.__name__} deleted.'
+        self.length -= len(removed)
+        self._positions_dirty = True
+        if not self._replaying:
+            self._items_deleted(removed)
+        return True, f'{len(removed)} {self.model.__name__} deleted.'
+    
+    @timed()
+    @write_operation
+    def delete_where(self, predicate):
+        """Delete all items for which predicate(item) is true, e.g. delete_where(lambda s: s.student_number.startswith('2020'))."""
+        return self.delete_items([item for item in self.sq_list if predicate(item)])
+        
+    @timed()
+    @write_operation
     def _delete_item_by_index(self, i: int, need_check_index=True):
         if need_check_index:
             success, msg = self.is_index_valid(i)
             if not success:
                 return success, msg
-        self.sq_list.pop(i)
+        item = self.sq_list.pop(i)
         self.length -= 1
+        self._unindex_item(item)
+        if i != self.length:  # 删除的不是最后一个，后面的下标都变了
+            self._positions_dirty = True
+        self._log_change('delete', self._item_key(item))
+        if not self._replaying:
+            self._items_deleted([item])
         return True, f'{self.model.__name__} deleted.'
     
+    @timed()
+    @write_operation
     def delete_item_by_key_value(self, key, value):
-        """Delete item by key-value."""
-        success, i_or_msg = self._get_item_index_by_key_value(key, value)
+        """Delete item by key-value. If more than one item matched, the first one is deleted."""
+        success, items_or_msg = self.get_items_by_key_value(key, value)
         if not success:
-            return success, i_or_msg
-        else:  # i_or_msg is a int index
-            return self._delete_item_by_index(i_or_msg, False)    # type: ignore
+            return success, items_or_msg
+        return self.delete_item(items_or_msg[0])
     
+    @timed()
+    @write_operation
     def _update_item_by_index(self, i: int, new_item, need_check_index=True):  # to be deleted.
         if need_check_index:
             success, msg = self.is_index_valid(i)
             if not success:
                 return success, msg
+        old_item = self.sq_list[i]
+        msg = self._unique_conflict(new_item, exclude=old_item)
+        if msg:
+            return False, msg
+        self._unindex_item(old_item)
         self.sq_list[i] = new_item
+        if self.in_memory:
+            self._positions[id(new_item)] = i
+        self._index_item(new_item)
+        self._log_change('replace', self._item_key(old_item), new_item.to_dict())
         return True, f'{self.model.__name__} {new_item} updated.'
     
+    @timed()
+    @write_operation
     def _update_item_attr_by_index(self, i: int, attr: str, new_value, need_check_index=True, need_check_key=True):
         if need_check_index:
             success, msg = self.is_index_valid(i)
@@ -266,9 +909,154 @@ class SqList:
         success, msg = self.check_key_value(attr, new_value, need_check_key)
         if not success:
             return False, msg
-        setattr(self.sq_list[i], attr, new_value)
+        success, msg = self._set_item_attr(self.sq_list[i], attr, new_value)
+        if not success:
+            return False, msg
         return True, f'{self.model.__name__} {attr} updated.'
     
+    @timed()
+    @write_operation
+    def update_items(self, items: list, changes: dict):
+        """Set the attributes in changes on every item, all or none, in one batch."""
+        if not items:
+            for attr, new_value in changes.items():
+                success, msg = self.check_key_value(attr, new_value)
+                if not success:
+                    return False, msg
+            return False, f'No {self.model.__name__} updated.'
+        return self.apply_changes([(item, changes) for item in items])
+    
+    @timed()
+    @write_operation
+    def update_where(self, predicate, changes: dict):
+        """Update all items for which predicate(item) is true, e.g. update_where(lambda s: s.age < 18, {'address': ''})."""
+        return self.update_items([item for item in self.sq_list if predicate(item)], changes)
+    
+    def transaction(self) -> Transaction:
+        """Unit of work: queue changes of many items with tx.update(item, ...), commit them all or none, see transaction.py."""
+        return Transaction(self)
+    
+    @timed()
+    @write_operation
+    def apply_changes(self, changes: list[tuple]) -> tuple[bool, str]:
+        """
+        Apply [(item, {attr: new_value})] all or none: every value and the unique attrs (as they will be after all
+        changes) are checked first, then each item is updated once, all in one batch (one fsync / one commit).
+        """
+        merged: dict[tuple, tuple] = {}
+        for item, item_changes in changes:
+            merged.setdefault(self._item_key(item), (item, {}))[1].update(item_changes)
+        msg = self._check_changes(merged)
+        if msg:
+            return False, msg
+        applied = []  # (item, 旧值)，出异常时改回去
+        try:
+            for item, item_changes in merged.values():
+                applied.append((item, {attr: getattr(item, attr, None) for attr in item_changes}))
+                self._set_item_attrs(item, item_changes, check_unique=False)
+        except Exception:
+            for item, old_values in reversed(applied):
+                self._set_item_attrs(item, old_values, check_unique=False)
+            raise
+        return True, f'{len(merged)} {self.model.__name__} updated.'
+    
+    def _item_changes_conflict(self, item, changes: dict):
+        """Unique attr or primary key conflict of changing one item, else None."""
+        for attr, new_value in changes.items():
+            if new_value != getattr(item, attr, None):
+                msg = self._unique_value_conflict(attr, new_value, exclude=item)
+                if msg:
+                    return msg
+        old_key = self._item_key(item)
+        return self._key_conflict(tuple(changes.get(attr, getattr(item, attr)) for attr in self.pk_attrs), (old_key, ))
+    
+    def _check_changes(self, merged: dict):
+        """Error message of the first invalid value or unique conflict in {key: (item, changes)}, else None."""
+        checked = set()
+        for _, item_changes in merged.values():
+            for attr, new_value in item_changes.items():
+                if (attr, new_value) in checked:  # 批量修改时每个 (属性, 值) 只检查一次
+                    continue
+                success, msg = self.check_key_value(attr, new_value)
+                if not success:
+                    return msg
+                checked.add((attr, new_value))
+        if self._replaying:
+            return None
+        for attr in self.unique_attrs:
+            msg = self._unique_changes_conflict(attr, merged)
+            if msg:
+                return msg
+        return self._key_changes_conflict(merged)
+    
+    def _key_changes_conflict(self, merged: dict):
+        """
+        A new primary key must be unused now, not only after the changes: the items are changed one by one and storages
+        keyed by primary key (DictStorage, SQLite's unique index) can not hold the same key twice, so keys can't be swapped.
+        """
+        if not self._check_keys:
+            return None
+        new_keys = set()
+        for old_key, (item, item_changes) in merged.items():
+            new_key = tuple(item_changes.get(attr, getattr(item, attr)) for attr in self.pk_attrs)
+            if new_key in new_keys:
+                return self._key_exists_message(new_key)
+            new_keys.add(new_key)
+            msg = self._key_conflict(new_key, (old_key, ))
+            if msg:
+                return msg
+        return None
+    
+    def _unique_changes_conflict(self, attr: str, merged: dict):
+        """
+        Unique check on the final state: a new value may be taken only by an item which gives it up in the same changes,
+        so swapping two values works; two items must not get the same new value.
+        """
+        moving = {key: item_changes[attr] for key, (item, item_changes) in merged.items()
+                  if attr in item_changes and item_changes[attr] != getattr(item, attr, None)}
+        owners: dict = {}
+        for key, value in moving.items():
+            if not HashIndex.is_value_indexable(value):
+                continue
+            if value in owners:
+                return f'{attr}={value} is set on more than one {self.model.__name__}.'
+            owners[value] = key
+            if any(self._item_key(owner) not in moving for owner in self._find_items(attr, value)):
+                return f'{self.model.__name__} with {attr}={value} already exists.'
+        return None
+    
+    def _set_item_attr(self, item, attr: str, new_value):
+        """setattr() that keeps indexes up to date and unique attrs unique. All attribute updates should go through here."""
+        return self._set_item_attrs(item, {attr: new_value})
+    
+    @timed()
+    @write_operation
+    def _set_item_attrs(self, item, changes: dict, check_unique=True):
+        """
+        Set several attributes of item as one change: the storage is updated once and one ('update', key, changes)
+        record is logged. check_unique=False when the caller (apply_changes) has checked the final state.
+        """
+        old_key = self._item_key(item)
+        msg = self._item_changes_conflict(item, changes) if check_unique else None
+        if msg:
+            return False, msg
+        for attr, new_value in changes.items():
+            old_value = getattr(item, attr, None)
+            setattr(item, attr, new_value)
+            self._reindex_item_attr(item, attr, old_value, new_value)
+        self.sq_list.item_updated(old_key, changes)
+        self._log_change('update', old_key, dict(changes))
+        return True, ''
+    
+    def _reindex_item_attr(self, item, attr: str, old_value, new_value):
+        """Called after item.attr changed. Subclasses which keep their own derived data override it (and _index_item/_unindex_item)."""
+        index = self.indexes.get(attr)
+        if index is not None:
+            index.update(item, old_value, new_value)
+        sorted_index = self.sorted_indexes.get(attr)
+        if sorted_index is not None:
+            sorted_index.update(item, old_value, new_value)
+    
     # def update_item_by_key_value(self, key, value, new_value):  # to be deleted, UPDATE must DIY in StudentList. 因为用户先输入要修改的学生信息，然后查到学生，再去修改。用户的输入是穿插在其中的，而且需求设计上不支持用id name之外的属性去查学生。所以无法直接形成整体
     #     """Update item by key-value."""
     #     success, i_or_msg = self._get_item_index_by_key_value(key, value)
@@ -280,9 +1068,89 @@ class SqList:
     
     
 class StudentList(SqList, Student):  # TODO: 添加了Student Number,修改一下逻辑
-    def __init__(self):
-        super().__init__(Student)  # 根据 MRO 顺序，会执行 SqList.__init__()
+    def __init__(self, storage=None, course_list=None, student_course_list=None):
+        super().__init__(Student, storage)  # 根据 MRO 顺序，会执行 SqList.__init__()
         self.student_list = self.sq_list  # 引用 SqList 的 sq_list
+        # 课程和成绩；CourseList/StudentCourseList 定义在后面，运行到这里时已经存在了
+        self.course_list = course_list if course_list is not None else CourseList()
+        self.student_course_list = student_course_list if student_course_list is not None else StudentCourseList()
+        if self.course_list.student_course_list is None:  # 删除课程时级联删除成绩
+            self.course_list.student_course_list = self.student_course_list
+        self.score_statistics = ScoreStatistics(self.student_course_list)
+        # 姓名搜索索引（前缀/姓/容错），第一次搜索时才从全部学生建立，之后随增删改更新；
+        # 启动时不用遍历所有学生（映射的快照只在用到时才读）
+        self._name_search_lock = threading.Lock()  # 几个读者同时第一次搜索时，只建一次
+        self._rebuild_derived_data()
+    
+    def _rebuild_derived_data(self):
+        self._name_search = None
+    
+    @property
+    def name_search(self) -> NameSearchIndex:
+        """Built on first use; call it holding the read or write lock, so that no student changes while building."""
+        if self._name_search is None:
+            with self._name_search_lock:
+                if self._name_search is None:
+                    name_search = NameSearchIndex()
+                    for student in self.student_list:
+                        name_search.add(student.name)
+                    self._name_search = name_search
+        return self._name_search
+    
+    def _index_item(self, item):
+        super()._index_item(item)
+        if self._name_search is not None:
+            self._name_search.add(item.name)
+    
+    def _index_items(self, items: list):
+        super()._index_items(items)
+        if self._name_search is not None:
+            for item in items:
+                self._name_search.add(item.name)
+    
+    def _unindex_item(self, item):
+        super()._unindex_item(item)
+        if self._name_search is not None:
+            self._name_search.remove(item.name)
+    
+    def _reindex_item_attr(self, item, attr: str, old_value, new_value):
+        super()._reindex_item_attr(item, attr, old_value, new_value)
+        if attr == 'name' and self._name_search is not None:
+            self._name_search.remove(old_value)
+            self._name_search.add(new_value)
+    
+    def _items_deleted(self, items: list):
+        # 级联删除这些学生的成绩，按邻接索引找，O(这些学生的成绩数)
+        self.student_course_list.delete_enrollments('student_id', [student.id for student in items])
+    
+    def _students_of_names(self, names: list, limit=None) -> list:
+        students = []
+        for name in names:
+            students.extend(self._find_items('name', name))
+            if limit is not None and len(students) >= limit:
+                return students[:limit]
+        return students
+    
+    @timed()
+    @read_locked
+    def search_students_by_name(self, query: str, limit=20):
+        """
+        模糊查找：完全匹配 > 名字以 query 开头 > 英文名的姓 > 打错一个字（编辑距离 1），同一档里长度和 query 越接近的名字越靠前。
+        不用输入完整准确的名字，比如 '张' / '张山' / 'jon doe' 都能找到 '张三' / 'John Doe'。
+        """
+        students = self._students_of_names(self.name_search.search(query, limit), limit)
+        if not students:
+            return False, f'No student\'s name is like {query}.'
+        return True, students
+    
+    @timed()
+    @read_locked
+    def find_students_by_surname(self, surname: str):
+        """ 按姓查找：中文名的姓（包括复姓），英文名的最后一个词 """
+        students = self._students_of_names(self.name_search.by_surname(surname))
+        if not students:
+            return False, f'No student\'s surname is {surname}.'
+        return True, students
     
     @handle_keyboard_interrupt
     def handle_input(self, prompt, key):
@@ -304,6 +1172,7 @@ class StudentList(SqList, Student):  # TODO: 添加了Student Number,修改一
             else:
                 print('Invalid option. Please enter again: ')
 
+    @timed()
     def add_student(self):  # ps. 因为之前的for循环设计，这个add方法不需要改了。👍
         """ 添加学生信息 """
         print("Please enter student information:")
@@ -313,11 +1182,18 @@ class StudentList(SqList, Student):  # TODO: 添加了Student Number,修改一
             processed_input = self.handle_input(prompt, attr)
             input_data[attr] = processed_input  # 动态创建变量方式：1. global()[attr] 2. 字典
             success, msg = self.check_data(attr, input_data[attr], False)
+            if success:
+                msg = self._unique_value_conflict(attr, input_data[attr])  # 学号、身份证号不能重复，输入后马上检查
+                success = msg is None
             if not success:
                 format_print(action='Add student', message=msg)
                 return False, msg
-        return super().add_item(Student(**input_data))
+        success, msg = super().add_item(Student(**input_data))
+        if not success:  # 输入的时候还没有，添加之前被其他实例抢先用了
+            format_print(action='Add student', message=msg)
+        return success, msg
     
+    @timed()
     def delete_student(self):
         """ 删除学生信息 """
         """ 发现这个不符合逻辑，没有确认删除，
@@ -335,6 +1211,7 @@ class StudentList(SqList, Student):  # TODO: 添加了Student Number,修改一
         success, msg = super().delete_item_by_key_value(key, processed_data)
         format_print(f"DELETE {'FAILED' if not success else 'SUCCESS'}", msg)
     
+    @timed()
     def delete_student_2(self):
         """ 删除学生信息 """
         student = self.get_student()
@@ -345,35 +1222,203 @@ class StudentList(SqList, Student):  # TODO: 添加了Student Number,修改一
         else:
             print('Canceled.')
         
+    @timed()
     def get_student(self):
         """ 查找学生信息 """
         option_key_map = {
             '1': 'student_number',
             '2': 'name',
+            '3': 'name_search',  # 前缀/容错搜索，不需要输入准确的名字
         }
         option = self.handle_options('Which way do you want to get?', option_key_map)
-        if option == 'q':
+        if option == 'q' or option is False:
             return
         key = option_key_map[option]
-        processed_data = self.handle_input(f'Enter student\'s {self.display_attr(key)}: ', key)
-        success, student_or_msg = super().get_item_by_key_value(key, processed_data)
-        if success and isinstance(student_or_msg, Student):
-            format_print('GET', 'Here are the student info:')
-            student_or_msg.print_student_info()
-            return student_or_msg
-        elif isinstance(student_or_msg, str):
-            format_print('GET', student_or_msg)
+        if key == 'name_search':
+            query = self.handle_input('Enter (part of) student\'s name: ', key)
+            success, students_or_msg = self.search_students_by_name(query) if query else (False, 'Nothing entered.')
+        else:
+            processed_data = self.handle_input(f'Enter student\'s {self.display_attr(key)}: ', key)
+            success, students_or_msg = super().get_items_by_key_value(key, processed_data)
+        if not success or isinstance(students_or_msg, str):
+            format_print('GET', students_or_msg)
+            return
+        student = students_or_msg[0] if len(students_or_msg) == 1 else self._choose_student(students_or_msg)
+        if student is None:
             return
+        format_print('GET', 'Here are the student info:')
+        student.print_student_info()
+        self._print_student_courses(student)
+        return student
+    
+    def _print_student_courses(self, student):
+        """ 学生选的课和成绩，按邻接索引查，O(课程数) """
+        scores = self.student_course_list.courses_of_student(student.id)
+        if not scores:
+            return
+        course_names = {course.id: course.name for course in self.course_list.course_list}
+        print('Courses: ' + ', '.join(f'{course_names.get(score.course_id, score.course_id)} {score.score}'
+                                      for score in sorted(scores, key=lambda score: score.course_id)))
+            
+    def _choose_student(self, students: list):
+        """ 查到多个学生（同名、搜索结果），全部展示后再用学号确定一个 """
+        format_print('GET', f'{len(students)} students found:')
+        TableRenderer.for_model(Student).write_page(students)
+        student_number = self.handle_input('Enter the Student Number of the one you want: ', 'student_number')
+        matched = [student for student in students if student.student_number == student_number]
+        if not matched:
+            format_print('GET', f'{student_number} is not in the list above.')
+            return None
+        return matched[0]
             
-    def show_all_student_info(self):  # TODO: 分页; show 选课和课程成绩信息；
-        """ 显示所有学生信息 """
+    @timed()
+    def show_all_student_info(self):  # TODO: show 选课和课程成绩信息；
+        """ 分页显示所有学生信息，每页整体渲染后一次输出；只读取当前页的数据 """
         if self.is_empty():
             format_print('Show Students', 'There is no student.')
             return
-        self.print_columns_name()
+        self._show_pages(self.get_page, self.length, self._get_item_index_by_key_value)
+    
+    def _show_pages(self, get_page, total: int, locate):
+        """
+        分页显示学生。
+        get_page(start, size) -> 这一页的学生；locate('student_number', value) -> (success, 下标)，用于按学号跳页。
+        """
+        renderer = TableRenderer.for_model(Student)
+        page_size = settings.PAGE_SIZE
+        cursor = 0  # 当前页第一行的下标
+        while True:
+            pages = (total + page_size - 1) // page_size
+            footer = f'Page {cursor // page_size + 1}/{pages}, {total} students in total.'
+            renderer.write_page(get_page(cursor, page_size), footer)
+            if pages <= 1:
+                return
+            cursor = self._move_page_cursor(cursor, page_size, total, locate)
+            if cursor is None or cursor is False:  # 'q' 或 Ctrl+C
+                return
+    
+    @handle_keyboard_interrupt
+    def _move_page_cursor(self, cursor: int, page_size: int, total: int, locate):
+        """ 翻页：返回新一页第一行的下标，None 表示退出 """
+        prompt = "'n': Next Page, 'p': Previous Page, 'j': Jump to Student Number, 'Q(q)': Return to Menu: "
+        while True:
+            option = input(prompt).lower()
+            if option == 'q':
+                return None
+            elif option == 'n':
+                if cursor + page_size < total:
+                    return cursor + page_size
+                print('This is the last page.')
+            elif option == 'p':
+                if cursor > 0:
+                    return cursor - page_size
+                print('This is the first page.')
+            elif option == 'j':
+                student_number = self.handle_input('Enter student\'s Student Number: ', 'student_number')
+                success, i_or_msg = locate('student_number', student_number)
+                if success and isinstance(i_or_msg, int):
+                    return i_or_msg - i_or_msg % page_size  # 跳到这个学生所在的页
+                format_print('JUMP', i_or_msg)
+            else:
+                print('Invalid option. Please enter again: ')
+
+    def find_students_by_age_range(self, low=None, high=None):
+        """ low <= age <= high 的学生，按年龄排序；None 表示不限 """
+        return self.get_items_in_range('age', low, high)
+    
+    def find_students_by_enrollment_year(self, year):
+        """ 学号的前 4 位是入学年份，按学号前缀查询 """
+        return self.get_items_by_prefix('student_number', str(year))
+    
+    def enrollment_years(self) -> dict:
+        """{enrollment year: number of students}, from the partitions when students are partitioned by year."""
+        if hasattr(self.sq_list, 'partition_counts'):
+            return self.sq_list.partition_counts()
+        years: dict[str, int] = {}
         for student in self.student_list:
-            student.print_student_info_simply()
+            year = Student.partition_of(student.student_number)
+            years[year] = years.get(year, 0) + 1
+        return dict(sorted(years.items()))
+    
+    @timed()
+    @write_operation
+    def drop_enrollment_year(self, year, archive_dir=None):
+        """
+        Remove all students of an enrollment year, e.g. a graduated class. With PartitionedStorage the year's partition
+        is dropped at once, O(1): its files are deleted, or moved into archive_dir (put them back to restore the year).
+        Archived students keep their scores, deleted ones have their scores deleted too.
+        """
+        year = str(year)
+        if not hasattr(self.sq_list, 'drop_partition'):
+            if archive_dir is not None:
+                return False, 'Only students partitioned by enrollment year (the \'partitioned\' backend) can be archived.'
+            students = self._items_with_prefix('student_number', year)
+            if not students:
+                return False, f'No student enrolled in {year}.'
+            success, msg = self.delete_items(students)
+            return (True, f'{len(students)} students of {year} deleted.') if success else (False, msg)
+        partition = self.sq_list.drop_partition(year, archive_dir)
+        if partition is None:
+            return False, f'No student enrolled in {year}.'
+        self.length = len(self.sq_list)
+        self.version += 1
+        self._rebuild_derived_data()
+        if archive_dir is None:
+            self._items_deleted(list(partition.sq_list))
+        return True, f'{partition.length} students of {year} {"deleted" if archive_dir is None else "archived"}.'
+    
+    @timed()
+    def query_students(self):
+        """ 按年龄范围或学号前缀（比如入学年份）查询学生，结果分页显示 """
+        options_mapping = {
+            '1': 'age_range',
+            '2': 'student_number_prefix',
+            '3': 'surname',
+        }
+        option = self.handle_options('Which way do you want to query?', options_mapping)
+        if option == '1':
+            low = self._handle_bound_input('Enter the minimum age (leave blank for no limit): ')
+            high = self._handle_bound_input('Enter the maximum age (leave blank for no limit): ') if low is not False else False
+            if low is False or high is False:
+                return
+            success, students_or_msg = self.find_students_by_age_range(low, high)
+        elif option == '2':
+            prefix = self.handle_input('Enter the beginning of Student Number (e.g. enrollment year 2019): ', 'student_number')
+            if not prefix or not prefix.isdigit():
+                format_print('QUERY', f'{prefix} is not a valid beginning of Student Number.')
+                return
+            success, students_or_msg = self.get_items_by_prefix('student_number', prefix)
+        elif option == '3':
+            surname = self.handle_input('Enter the surname (e.g. 张, 欧阳, Smith): ', 'name')
+            if not surname:
+                return
+            success, students_or_msg = self.find_students_by_surname(surname.strip())
+        else:
+            return
+        if not success:
+            format_print('QUERY', students_or_msg)
+            return
+        positions = {}  # 按学号跳页时才建立 学号 -> 结果里的下标
 
+        def locate(key, value):
+            if not positions:
+                positions.update((student.student_number, i) for i, student in enumerate(students_or_msg))
+            i = positions.get(value)
+            return (True, i) if i is not None else (False, f'{value} is not in the result.')
+        self._show_pages(lambda start, size: students_or_msg[start:start + size], len(students_or_msg), locate)
+    
+    @handle_keyboard_interrupt
+    def _handle_bound_input(self, prompt):
+        """ 输入范围查询的边界：整数，或者留空表示不限（返回 None） """
+        while True:
+            user_input = input(prompt).strip()
+            if not user_input:
+                return None
+            if user_input.isdigit():
+                return int(user_input)
+            print('Please enter a non-negative integer.')
+    
+    @timed()
     def update_student_info(self):  # noqa: C901
         """ 更新学生信息 """
         """
@@ -437,6 +1482,7 @@ class StudentList(SqList, Student):  # TODO: 添加了Student Number,修改一
                     success, msg = super()._update_item_attr_by_index(i_or_msg, key, new_attr_value, False, False)
                     format_print(f"UPDATE {'SUCCESS' if success else 'FAILED'}", msg)
                     
+    @timed()
     def update_student(self):
         """ 更新学生信息 """
         student = self.get_student()
@@ -461,41 +1507,433 @@ class StudentList(SqList, Student):  # TODO: 添加了Student Number,修改一
             need_check_key = True
         else:
             to_update_attrs = self.all_attrs
+        new_values = {}  # 先输入、校验完所有属性，再一次性修改；batch 持有写锁，不能在里面等用户输入
         for attr_name in to_update_attrs:
             new_attr_value = self.handle_input(f'Please enter the new {self.display_attr(attr_name)}: ', attr_name)
             success, msg = self.check_data(attr_name, new_attr_value, need_check_key)
+            if success and new_attr_value != getattr(student, attr_name, None):
+                msg = self._unique_value_conflict(attr_name, new_attr_value, exclude=student)
+                success = msg is None
             if not success:
                 format_print(action='update failed', message=msg)
                 return False, msg
-            setattr(student, attr_name, new_attr_value)  # Update attribute
-            format_print(f"UPDATE {'SUCCESS' if success else 'FAILED'}", msg)
+            new_values[attr_name] = new_attr_value
+        with self.transaction() as tx:  # 所有属性一起修改，一条日志记录；有一个不合法就都不改
+            tx.update(student, new_values)
+        success, msg = tx.result
+        if success:
+            format_print('UPDATE SUCCESS', f'{", ".join(map(self.display_attr, new_values))} updated.')
+        else:
+            format_print('UPDATE FAILED', msg)
+        return success, msg
 
+    @timed()
     def student_course_score_statistics(self):
-        pass
+        """
+        成绩统计：每门课的人数/平均分/标准差/最高最低分，中位数和分位数，分数段分布，学生平均分。
+        人数到最高最低分直接读 StudentCourseList 维护的聚合值；中位数/分位数要排序每门课的成绩，
+        由 self.score_statistics 计算，成绩没有修改（version 不变）时用上次的结果。
+        """
+        course_stats = self.student_course_list.course_aggregate_statistics()
+        if not course_stats:
+            format_print('Statistics', 'There is no score.')
+            return
+        with self.student_course_list._rwlock.read_lock():  # 构建数组时遍历成绩，不能同时被修改
+            percentiles = self.score_statistics.course_statistics()
+        for course_id, stats in course_stats.items():
+            stats.update({name: percentiles[course_id][name] for name in PERCENTILE_NAMES if course_id in percentiles})
+        course_names = {course.id: course.name for course in self.course_list.course_list}
+        print(f"{'Course':<20}{'Count':<8}{'Mean':<8}{'Std':<8}{'Min':<8}{'Max':<8}")
+        for course_id, stats in course_stats.items():
+            course_name = course_names.get(course_id, f'#{course_id}')
+            print(f"{course_name:<20}{stats['count']:<8}" + ''.join(
+                f'{stats[name]:<8.1f}' for name in ('mean', 'std', 'min', 'max')))
+        print()
+        print(f"{'Course':<20}" + ''.join(f'{name.title():<8}' for name in PERCENTILE_NAMES))
+        for course_id, stats in course_stats.items():
+            print(f"{course_names.get(course_id, f'#{course_id}'):<20}" + ''.join(
+                f'{stats[name]:<8.1f}' if name in stats else f"{'-':<8}" for name in PERCENTILE_NAMES))
+        print()
+        print(f"{'Course':<20}" + ''.join(f'{label:<8}' for label in GRADE_LABELS))
+        for course_id, stats in course_stats.items():
+            print(f"{course_names.get(course_id, f'#{course_id}'):<20}" + ''.join(f'{count:<8}' for count in stats['grades']))
+        averages = self.student_course_list.student_averages()
+        print()
+        format_print('Statistics', f'{len(averages)} students have scores, '
+                     f'average of their average scores: {sum(averages.values()) / len(averages):.1f}')
+        return course_stats
+    
+    def _students_by_ids(self, ids) -> dict:
+        """id -> student; one pass over the students in memory, lookups by id in other storages"""
+        ids = set(ids)
+        if self.in_memory:
+            return {student.id: student for student in self.sq_list if student.id in ids}
+        return {student_id: students[0] for student_id in ids if (students := self._find_items('id', student_id))}
+    
+    @timed()
+    def show_rankings(self):
+        """ 成绩排名：每门课的前几名，或者一个学生在每门课里的名次和百分位；都读维护的排名结构，不用排序成绩 """
+        option = self.handle_options('Which ranking do you want to see?',
+                                     {'1': 'top_students_of_each_course', '2': 'ranks_of_a_student'})
+        if option == '1':
+            return self._print_top_scores()
+        if option == '2':
+            student_number = self.handle_input('Enter student\'s Student Number: ', 'student_number')
+            success, students_or_msg = self.get_items_by_key_value('student_number', student_number)
+            if not success:
+                format_print('RANKING', students_or_msg)
+                return
+            return self._print_student_ranks(students_or_msg[0])
+    
+    def _print_top_scores(self):
+        tops = self.student_course_list.course_top_scores()
+        if not tops:
+            format_print('RANKING', 'There is no score.')
+            return
+        course_names = {course.id: course.name for course in self.course_list.course_list}
+        students = self._students_by_ids(student_id for top in tops.values() for student_id, _ in top)
+        for course_id, top in tops.items():
+            print(f"{course_names.get(course_id, f'#{course_id}')}:")
+            for rank, student_id, score in with_ranks(top):
+                student = students.get(student_id)
+                number, name = (student.student_number, student.name) if student else (f'#{student_id}', '')
+                print(f'  {rank:<6}{number:<16}{name:<20}{score}')
+        return tops
+    
+    def _print_student_ranks(self, student):
+        ranks = self.student_course_list.student_ranks(student.id)
+        if not ranks:
+            format_print('RANKING', f'{student.name} has no score.')
+            return
+        course_names = {course.id: course.name for course in self.course_list.course_list}
+        print(f"{'Course':<20}{'Score':<8}{'Rank':<12}{'Percentile':<10}")
+        for course_id, rank in ranks.items():
+            rank_text = f"{rank['rank']}/{rank['count']}"
+            print(f"{course_names.get(course_id, f'#{course_id}'):<20}{rank['score']:<8}{rank_text:<12}{rank['percentile']:.1f}")
+        return ranks
+    
+    @timed()
+    def import_students_from_csv(self, filename, error_filename=None, batch_size=1000):
+        """
+        从 CSV 批量导入学生，列名就是属性名（student_number, name, gender, age, id_card, phone_number, address）。
+        逐行校验，不通过的行写进 error_filename；通过的按批分配 id 并插入。
+        """
+        def parse_rows(rows: list[dict]) -> list[tuple]:
+            """Student.parse_rows, plus one pass over the batch for duplicated student numbers / ID cards"""
+            results = Student.parse_rows(rows)
+            parsed = [Student.from_dict(data) for success, data in results if success]
+            unique_results = iter(self.check_unique_items(parsed))
+            return [result if not result[0] or (unique := next(unique_results))[0] else unique for result in results]
+
+        def add_batch(rows: list[dict]):
+            ids = self.get_new_unique_stu_ids(len(rows))
+            return self.add_items([Student.from_dict({'id': student_id, **data}) for student_id, data in zip(ids, rows)])
+        success, msg = load_data_from_csv(filename, parse_rows, add_batch, error_filename, batch_size)
+        format_print(f"IMPORT {'SUCCESS' if success else 'FAILED'}", msg)
+        return success, msg
+    
+    @timed()
+    def export_students_to_csv(self, filename):
+        count = save_data_to_csv(self.student_list, filename, Student.required_attrs + Student.optional_attrs)
+        msg = f'{count} students exported to {filename}.'
+        format_print('EXPORT', msg)
+        return True, msg
                     
 
-class CourseList:
-    def __init__(self):
-        self.course_list = []
-        self.length = 0
-        
+class CourseList(SqList, Course):
+    def __init__(self, storage=None, student_course_list=None):
+        super().__init__(Course, storage)
+        self.course_list = self.sq_list
+        # 删除课程时级联删除这门课的成绩；没有传入时由 StudentList 连上它的 student_course_list
+        self.student_course_list = student_course_list
+    
+    def _items_deleted(self, items: list):
+        if self.student_course_list is not None:
+            self.student_course_list.delete_enrollments('course_id', [course.id for course in items])
+    
+    def _input_course(self):
+        """ 输入课程 id，返回课程，找不到时返回 None """
+        try:
+            course_id = int(input('Enter course id: '))
+        except ValueError:
+            format_print('COURSE', 'Course id must be a number.')
+            return None
+        success, course_or_msg = self.get_item_by_key_value('id', course_id)
+        if not success:
+            format_print('COURSE', course_or_msg)
+            return None
+        return course_or_msg
+    
+    @timed()
     def add_course(self):
-        pass
+        name, teacher = input('Enter course name: ').strip(), input('Enter teacher: ').strip()
+        for key, value in (('name', name), ('teacher', teacher)):
+            success, msg = self.check_data(key, value)
+            if not success:
+                format_print('ADD FAILED', msg)
+                return False, msg
+        success, msg = self.add_item(Course(name, teacher))
+        format_print(f"ADD {'SUCCESS' if success else 'FAILED'}", msg)
+        return success, msg
     
+    @timed()
     def delete_course(self):
-        pass
+        """ 删除课程，这门课的成绩一起删除，O(选课人数) """
+        course = self._input_course()
+        if course is None:
+            return
+        success, msg = self.delete_item(course)
+        format_print(f"DELETE {'SUCCESS' if success else 'FAILED'}", msg)
+        return success, msg
     
+    @timed()
     def get_course(self):
-        pass
+        course = self._input_course()
+        if course is None:
+            return
+        course.print_course_info()
+        if self.student_course_list is not None:
+            scores = self.student_course_list.students_of_course(course.id)
+            print(f'{len(scores)} students enrolled.')
+        return course
     
+    @timed()
     def update_course(self):
-        pass
+        course = self._input_course()
+        if course is None:
+            return
+        changes = {}
+        for key in ('name', 'teacher'):
+            value = input(f'Enter new {key} (Enter to keep {getattr(course, key)}): ').strip()
+            if value:
+                changes[key] = value
+        if not changes:
+            return
+        with self.transaction() as tx:
+            tx.update(course, changes)
+        format_print(f"UPDATE {'SUCCESS' if tx.result[0] else 'FAILED'}", tx.result[1])
+        return tx.result
 
 
-class StudentCourseList:
-    def __init__(self):
-        self.stu_course_list = []
-        self.length = 0
+class StudentCourseList(SqList, StudentCourseScore):
+    """
+    选课和成绩。默认存在 DictStorage 里（按主键删除 O(1)），student_id/course_id 上有邻接索引（AdjacencyIndex），
+    所以查一个学生的课、一门课的学生，以及删除学生/课程时的级联删除，都只和这个学生/这门课的成绩数有关。
+    """
+    def __init__(self, storage=None):
+        super().__init__(StudentCourseScore, storage if storage is not None else DictStorage(StudentCourseScore))
+        self.stu_course_list = self.sq_list
+        # 每门课的聚合值（人数、总分、平方和、最高最低分、分数段），成绩增删改时 O(1) 更新
+        self._rebuild_derived_data()  # SQLite 里已有的成绩；journal 的数据是 replay 时通过 _index_item 加进来的
+    
+    def _rebuild_derived_data(self):
+        self.course_aggregates: dict[int, CourseAggregate] = {}
+        self.student_totals: dict[int, list] = {}  # student_id -> [总分, 课程数]
+        self.course_rankings: dict[int, CourseRanking] = {}  # 每门课的前 k 名和名次，见 rankings.py
+        for score in self.stu_course_list:
+            self._add_to_aggregates(score.student_id, score.course_id, score.score)
+    
+    def _aggregate(self, course_id) -> CourseAggregate:
+        aggregate = self.course_aggregates.get(course_id)
+        if aggregate is None:
+            aggregate = self.course_aggregates[course_id] = CourseAggregate(course_id)
+        return aggregate
+    
+    def _ranking(self, course_id) -> CourseRanking:
+        ranking = self.course_rankings.get(course_id)
+        if ranking is None:
+            ranking = self.course_rankings[course_id] = CourseRanking(course_id)
+        return ranking
+    
+    def _course_scores(self, course_id):
+        """All scores of a course, used when min/max of the course need to be recalculated."""
+        return [score.score for score in self._find_items('course_id', course_id)]
+    
+    def _course_student_scores(self, course_id):
+        """[(student_id, score)] of a course, used when the top scores of the course need to be reselected."""
+        return [(score.student_id, score.score) for score in self._find_items('course_id', course_id)]
+    
+    @timed()
+    @read_locked
+    def courses_of_student(self, student_id) -> list:
+        """Scores (course_id, score) of a student, O(number of his courses)."""
+        return self._find_items('student_id', student_id)
+    
+    @timed()
+    @read_locked
+    def students_of_course(self, course_id) -> list:
+        """Scores (student_id, score) of a course, O(number of its students)."""
+        return self._find_items('course_id', course_id)
+    
+    @timed()
+    @write_operation
+    def delete_enrollments(self, attr: str, values: list):
+        """Delete the scores whose attr ('student_id' or 'course_id') is in values, O(number of these scores)."""
+        items = [item for value in dict.fromkeys(values) for item in self._find_items(attr, value)]
+        if not items:
+            return True, f'0 {self.model.__name__} deleted.'
+        return self.delete_items(items)
+    
+    def _add_to_aggregates(self, student_id, course_id, score, update_ranking=True):
+        self._aggregate(course_id).add(score)
+        if update_ranking:
+            self._ranking(course_id).add(student_id, score)
+        totals = self.student_totals.get(student_id)
+        if totals is None:
+            self.student_totals[student_id] = [score, 1]
+        else:
+            totals[0] += score
+            totals[1] += 1
+    
+    def _remove_from_aggregates(self, student_id, course_id, score, update_ranking=True):
+        aggregate = self._aggregate(course_id)
+        aggregate.remove(score)
+        if aggregate.count == 0:
+            del self.course_aggregates[course_id]
+        if update_ranking:
+            ranking = self.course_rankings[course_id]
+            ranking.remove(student_id, score)
+            if ranking.count == 0:
+                del self.course_rankings[course_id]
+        totals = self.student_totals[student_id]
+        totals[0] -= score
+        totals[1] -= 1
+        if totals[1] == 0:
+            del self.student_totals[student_id]
+    
+    def _index_item(self, item):
+        super()._index_item(item)
+        self._add_to_aggregates(item.student_id, item.course_id, item.score)
+    
+    def _index_items(self, items: list):
+        super()._index_items(items)
+        scores_of_courses: dict[int, list] = {}
+        for item in items:
+            self._add_to_aggregates(item.student_id, item.course_id, item.score, update_ranking=False)
+            scores_of_courses.setdefault(item.course_id, []).append((item.student_id, item.score))
+        for course_id, scores in scores_of_courses.items():
+            self._ranking(course_id).add_many(scores)
+    
+    def _unindex_item(self, item):
+        super()._unindex_item(item)
+        self._remove_from_aggregates(item.student_id, item.course_id, item.score)
+    
+    def _reindex_item_attr(self, item, attr: str, old_value, new_value):
+        super()._reindex_item_attr(item, attr, old_value, new_value)
+        if attr == 'score':  # 只改分数：课程的排名结构原地更新
+            self._remove_from_aggregates(item.student_id, item.course_id, old_value, update_ranking=False)
+            self._add_to_aggregates(item.student_id, item.course_id, new_value, update_ranking=False)
+            self.course_rankings[item.course_id].replace(item.student_id, old_value, new_value)
+        elif attr in ('student_id', 'course_id'):
+            old = {'student_id': item.student_id, 'course_id': item.course_id, 'score': item.score, attr: old_value}
+            self._remove_from_aggregates(old['student_id'], old['course_id'], old['score'])
+            self._add_to_aggregates(item.student_id, item.course_id, item.score)
+    
+    @timed()
+    @read_locked
+    def student_averages(self) -> dict:
+        """student_id -> average score, read from the maintained totals"""
+        return {student_id: total / count for student_id, (total, count) in sorted(self.student_totals.items())}
+    
+    @timed()
+    @read_locked
+    def course_aggregate_statistics(self) -> dict:
+        """
+        直接读聚合值，不需要扫描成绩；和 ScoreStatistics.course_statistics() 的字段一样，只是没有中位数和分位数。
+
+        Returns:
+            dict: course_id -> {count, mean, std, min, max, grades}
+        """
+        return {course_id: aggregate.to_dict(self._course_scores)
+                for course_id, aggregate in sorted(self.course_aggregates.items())}
+    
+    def _top_scores(self, course_id, k) -> list[tuple]:
+        ranking = self.course_rankings.get(course_id)
+        return ranking.top(k, self._course_student_scores) if ranking is not None and k > 0 else []
+    
+    @timed()
+    @read_locked
+    def top_scores(self, course_id, k=TOP_K) -> list[tuple]:
+        """[(student_id, score)] of the best k scores of a course, best first; O(k log k) for k <= TOP_K."""
+        return self._top_scores(course_id, k)
+    
+    @timed()
+    @read_locked
+    def course_top_scores(self, k=TOP_K, course_ids=None) -> dict:
+        """course_id -> top_scores(course_id, k), of all courses with scores by default"""
+        return {course_id: self._top_scores(course_id, k)
+                for course_id in (sorted(self.course_rankings) if course_ids is None else course_ids)}
+    
+    @timed()
+    @read_locked
+    def student_ranks(self, student_id) -> dict:
+        """
+        Rank of a student in each of his/her courses, O(log n) per course.
+
+        Returns:
+            dict: course_id -> {score, rank, count, percentile}
+        """
+        ranks = {}
+        for score in sorted(self._find_items('student_id', student_id), key=lambda item: item.course_id):
+            ranks[score.course_id] = {'score': score.score, **self.course_rankings[score.course_id].rank_of(score.score)}
+        return ranks
+    
+    def _is_ranking_consistent(self, course_id) -> bool:
+        scores = sorted(self._course_student_scores(course_id), key=lambda pair: (-pair[1], pair[0]))
+        ranking = self.course_rankings.get(course_id)
+        if ranking is None or ranking.count != len(scores) or ranking.top(TOP_K, self._course_student_scores) != scores[:TOP_K]:
+            return False
+        above = 0
+        for i, (_, score) in enumerate(scores):
+            if i > 0 and score != scores[i - 1][1]:
+                above = i
+            if ranking.count_above(score) != above:
+                return False
+        return True
+    
+    def check_rankings(self):
+        """Compare the maintained rankings (top k, ranks) with a full sort of each course."""
+        wrong_courses = [course_id for course_id in sorted(self.course_aggregates.keys() | self.course_rankings.keys())
+                         if not self._is_ranking_consistent(course_id)]
+        if wrong_courses:
+            return False, f'Rankings of course {wrong_courses} are inconsistent.'
+        return True, f'Rankings of {len(self.course_rankings)} courses are consistent.'
+    
+    def check_aggregates(self, tolerance=1e-6):
+        """Compare the maintained aggregates with a full recalculation."""
+        expected = ScoreStatistics(self).course_statistics()
+        actual = self.course_aggregate_statistics()
+        wrong_courses = []
+        for course_id in sorted(expected.keys() | actual.keys()):
+            if course_id not in expected or course_id not in actual:
+                wrong_courses.append(course_id)
+                continue
+            for name in ('count', 'mean', 'std', 'min', 'max', 'grades'):
+                a, b = actual[course_id][name], expected[course_id][name]
+                if name in ('mean', 'std') and abs(a - b) <= tolerance * max(1.0, abs(b)):
+                    continue
+                if a != b:
+                    wrong_courses.append(course_id)
+                    break
+        if wrong_courses:
+            return False, f'Aggregates of course {wrong_courses} are inconsistent.'
+        return True, f'Aggregates of {len(actual)} courses are consistent.'
+        
+    @timed()
+    def import_scores_from_csv(self, filename, error_filename=None, batch_size=1000):
+        """从 CSV 批量导入成绩，列名：student_id, course_id, score"""
+        def add_batch(rows: list[dict]):
+            return self.add_items([StudentCourseScore(**data) for data in rows])
+        success, msg = load_data_from_csv(filename, StudentCourseScore.parse_rows, add_batch, error_filename, batch_size)
+        format_print(f"IMPORT {'SUCCESS' if success else 'FAILED'}", msg)
+        return success, msg
+    
+    @timed()
+    def export_scores_to_csv(self, filename):
+        count = save_data_to_csv(self.stu_course_list, filename, StudentCourseScore.required_attrs)
+        msg = f'{count} scores exported to {filename}.'
+        format_print('EXPORT', msg)
+        return True, msg
 
 
 if __name__ == '__main__':
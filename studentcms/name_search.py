@@ -0,0 +1,179 @@
+# Name search index
+"""
+姓名搜索：前缀搜索、按姓查找、容错（打错一个字）搜索，结果按相关度排序。
+
+索引的是 "不同的姓名"，不是学生：同名的学生只算一个姓名（记录人数），查到姓名后再用 name 的哈希索引取学生。
+* 前缀：排好序的姓名列表 + 二分，相当于一棵压平的 trie；
+* 姓：中文名取第一个字，复姓取前两个字；英文名取最后一个词；
+* 容错：编辑距离 <= 1（替换、插入、删除、相邻交换各算一次）。
+  中文名只有 2-4 个字，bigram 的重合度太低，过滤不掉候选，所以用 "删除一个字符" 的邻域做索引：
+  每个姓名按 (删掉第 i 个字符后的字符串, i) 登记，查询时只做 O(len) 次字典查找，不需要逐个算编辑距离。
+"""
+import threading
+from bisect import bisect_left, insort
+
+from .indexes import prefix_upper_bound
+
+COMPOUND_SURNAMES = frozenset((
+    '欧阳', '司马', '上官', '诸葛', '东方', '皇甫', '尉迟', '公孙', '慕容', '长孙', '宇文', '司徒', '夏侯', '轩辕',
+    '令狐', '端木', '独孤', '南宫', '西门', '百里', '呼延', '闻人', '钟离', '万俟', '澹台', '公冶', '宗政', '濮阳',
+    '淳于', '单于', '太叔', '申屠', '仲孙', '鲜于', '闾丘', '司空', '亓官', '司寇', '子车', '颛孙', '壤驷', '公良',
+    '漆雕', '乐正', '拓跋', '左丘', '东郭', '第五', '梁丘',
+))
+EXACT, PREFIX, SURNAME, TYPO = 0, 1, 2, 3  # 排序的档次：完全匹配 > 前缀匹配 > 姓匹配 > 打错一个字
+
+
+def normalize_name(name: str) -> str:
+    """英文名不区分大小写，多个空格算一个"""
+    return ' '.join(name.lower().split())
+
+
+def is_chinese(text: str) -> bool:
+    return bool(text) and '一' <= text[0] <= '龥'
+
+
+def surname_of(name: str) -> str:
+    name = normalize_name(name)
+    if is_chinese(name):
+        return name[:2] if name[:2] in COMPOUND_SURNAMES and len(name) > 2 else name[:1]
+    return name.rsplit(' ', 1)[-1]
+
+
+class NameSearchIndex:
+    def __init__(self):
+        self.counts: dict[str, int] = {}  # 原始姓名 -> 人数，已有的姓名增减人数时只动这里
+        self.names: dict[str, list] = {}  # 规范化的姓名 -> 原始姓名（通常只有一个，用 list 比 set 省内存）
+        self.sorted_names: list[str] = []  # 规范化的姓名，有序，用于前缀搜索
+        self._pending: list[str] = []  # 新姓名先放这里，查询前再合并，批量加载时只排一次序
+        self._merge_lock = threading.Lock()
+        self.surnames: dict[str, set] = {}  # 姓 -> 规范化的姓名
+        self.deletes: dict[tuple, set] = {}  # (删掉第 i 个字符后的字符串, i) -> 规范化的姓名
+
+    def __len__(self):
+        return len(self.names)
+
+    @staticmethod
+    def _deletes_of(name: str):
+        return [(name[:i] + name[i + 1:], i) for i in range(len(name))]
+
+    def add(self, name: str):
+        count = self.counts.get(name)
+        if count:
+            self.counts[name] = count + 1
+            return
+        if not name:
+            return
+        self.counts[name] = 1
+        key = normalize_name(name)
+        if key == name:
+            key = name  # 中文名规范化后不变，共用一个字符串对象
+        originals = self.names.get(key)
+        if originals is not None:
+            originals.append(name)
+            return
+        self.names[key] = [name]
+        self._pending.append(key)
+        self.surnames.setdefault(surname_of(key), set()).add(key)
+        for delete in self._deletes_of(key):
+            self.deletes.setdefault(delete, set()).add(key)
+
+    def remove(self, name: str):
+        count = self.counts.get(name)
+        if not count:
+            return
+        if count > 1:
+            self.counts[name] = count - 1
+            return
+        del self.counts[name]
+        key = normalize_name(name)
+        originals = self.names[key]
+        originals.remove(name)
+        if originals:
+            return
+        del self.names[key]  # 最后一个叫这个名字的学生没了，把姓名从各个结构里删掉
+        self._merge_pending()
+        i = bisect_left(self.sorted_names, key)
+        if i < len(self.sorted_names) and self.sorted_names[i] == key:
+            del self.sorted_names[i]
+        self._discard(self.surnames, surname_of(key), key)
+        for delete in self._deletes_of(key):
+            self._discard(self.deletes, delete, key)
+
+    @staticmethod
+    def _discard(mapping: dict, k, key: str):
+        keys = mapping.get(k)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del mapping[k]
+
+    def _merge_pending(self):
+        if not self._pending:
+            return
+        with self._merge_lock:  # 查询是并发的（读锁），合并只能有一个线程做
+            if len(self._pending) <= 32:
+                for key in self._pending:
+                    insort(self.sorted_names, key)
+            else:
+                self.sorted_names.extend(self._pending)
+                self.sorted_names.sort()
+            self._pending.clear()
+
+    def _originals(self, keys) -> list[str]:
+        return [name for key in keys for name in sorted(self.names[key])]
+
+    def prefix(self, prefix: str, limit=None) -> list[str]:
+        """Names starting with prefix in alphabetical order, O(log n + k)."""
+        self._merge_pending()
+        key = normalize_name(prefix)
+        if not key:
+            return []
+        start = bisect_left(self.sorted_names, key)
+        end = bisect_left(self.sorted_names, prefix_upper_bound(key), lo=start)
+        if limit is not None:
+            end = min(end, start + limit)
+        return self._originals(self.sorted_names[start:end])
+
+    def by_surname(self, surname: str) -> list[str]:
+        return self._originals(sorted(self.surnames.get(normalize_name(surname), ())))
+
+    def typo_matches(self, query: str) -> set:
+        """Normalized names within edit distance 1 of query (the query itself excluded)."""
+        key = normalize_name(query)
+        matches = set()
+        for delete, i in self._deletes_of(key):
+            if delete in self.names:  # 查询多打了一个字
+                matches.add(delete)
+            matches.update(self.deletes.get((delete, i), ()))  # 同一个位置打错了一个字
+        for i in range(len(key) + 1):  # 查询少打了一个字
+            matches.update(self.deletes.get((key, i), ()))
+        for i in range(len(key) - 1):  # 相邻两个字打反了
+            swapped = key[:i] + key[i + 1] + key[i] + key[i + 2:]
+            if swapped in self.names:
+                matches.add(swapped)
+        matches.discard(key)
+        return matches
+
+    def search(self, query: str, limit=20) -> list[str]:
+        """
+        Ranked candidates: exact match, names starting with query, names with query as surname, names with one typo.
+        In the same rank, names closer in length to the query come first.
+        """
+        key = normalize_name(query)
+        if not key:
+            return []
+        ranked = {}
+        if key in self.names:
+            ranked[key] = EXACT
+        self._merge_pending()
+        start = bisect_left(self.sorted_names, key)
+        end = bisect_left(self.sorted_names, prefix_upper_bound(key), lo=start)
+        for name in self.sorted_names[start:end]:
+            ranked.setdefault(name, PREFIX)
+        if not is_chinese(key):  # 中文的姓就是前缀，上面已经找过了
+            for name in self.surnames.get(key, ()):
+                ranked.setdefault(name, SURNAME)
+        for name in self.typo_matches(key):
+            ranked.setdefault(name, TYPO)
+        keys = sorted(ranked, key=lambda name: (ranked[name], abs(len(name) - len(key)), name))
+        return self._originals(keys[:limit])
@@ -0,0 +1,478 @@
+# Year-partitioned storage of students
+"""
+按入学年份分区存储学生：学号的前 4 位是入学年份（Student.partition_of），每个年份是一个分区。
+
+* 每个分区是一个独立的 SqList：自己的 DictStorage、自己的索引（学号、身份证号、姓名、年龄）、自己的日志和快照
+  （分区目录下的 2019.journal / 2019.pkl），做快照和 replay 都只和这一年的人数有关；
+* 启动时用进程池并行加载各个分区：子进程读快照、在普通的字典上 replay 日志，按列返回；主进程只建对象和索引；
+* 带学号的查询（等值、前缀、范围，比如按入学年份查）只查对应的分区；其他属性（身份证号、姓名）逐个分区查，分区只有十几个；
+* 整个年份归档/删除（drop_partition）是 O(1)：从字典里去掉这个分区、移走它的文件，不用逐个删除学生，别的分区也不用动；
+  其他实例在下一次 batch() 时发现文件不在了，也去掉这个分区；把归档的两个文件放回目录，下一次 batch() 就会加载回来。
+
+和 MappedStorage 一样，返回的都是副本，修改属性后 SqList 调用 item_updated()。学号改到另一个年份时学生要换分区：
+先加进新的分区并提交，再从旧的分区删除，两个日志不是原子的，崩溃时学生最多两边各有一份，不会丢。
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+from functools import partial
+from heapq import merge
+from operator import attrgetter
+
+from .indexes import HashIndex, prefix_upper_bound
+from .journal import Journal
+from .models import SqList
+from .query import Query
+from .storage import DictStorage
+
+JOURNAL_SUFFIX = '.journal'
+SNAPSHOT_SUFFIX = '.pkl'
+
+
+class _States:
+    """Item states (dicts) of one partition keyed by primary key; replays journal records like SqList._replay_change."""
+
+    def __init__(self, pk_attrs: tuple, states):
+        self.pk_attrs = pk_attrs
+        self.by_key: dict[tuple, dict] = {self._key(state): state for state in states}
+
+    def _key(self, state: dict) -> tuple:
+        return tuple(state.get(attr) for attr in self.pk_attrs)
+
+    def _rekey(self, old_key: tuple, state: dict):
+        """Put state under its (new) primary key at the position of old_key, O(n), only when a pk changes."""
+        new_key = self._key(state)
+        self.by_key = {(new_key if key == old_key else key): (state if key == old_key else value)
+                       for key, value in self.by_key.items()}
+
+    def replay(self, record):
+        replay = getattr(self, f'_replay_{record[0]}', None)
+        if replay is not None:
+            replay(*record[1:])
+
+    def _replay_add(self, state):
+        self.by_key[self._key(state)] = dict(state)
+
+    def _replay_insert(self, i: int, state):
+        entries = list(self.by_key.items())
+        entries.insert(i, (self._key(state), dict(state)))
+        self.by_key = dict(entries)
+
+    def _replay_delete(self, key):
+        self.by_key.pop(key, None)
+
+    def _replay_replace(self, key, state):
+        if key in self.by_key:
+            self._rekey(key, dict(state))
+
+    def _replay_update(self, key, changes: dict):
+        state = self.by_key.get(key)
+        if state is not None:
+            state.update(changes)
+            if self._key(state) != key:
+                self._rekey(key, state)
+
+    def _replay_set(self, key, attr, value):  # 以前的版本一次只改一个属性的记录
+        self._replay_update(key, {attr: value})
+
+
+def _read_partition(model: type, journal_path, snapshot_path, as_columns=False) -> tuple:
+    """
+    Load one partition (in a worker process): (journal position for Journal.resume(), item states), the states are the
+    snapshot with the journal tail replayed. as_columns: states as {attr: [values]}, to send them back to the main process
+    (a dict of lists pickles several times faster than a list of dicts).
+    """
+    journal = Journal(journal_path, snapshot_path)
+    states, records = journal.load()
+    journal.close()
+    if records:
+        replayed = _States(getattr(model, 'pk_attrs', ('id', )), states)
+        for record in records:
+            replayed.replay(record)
+        states = list(replayed.by_key.values())
+    if as_columns:
+        states = {attr: [state.get(attr) for state in states] for attr in model.stored_attrs}
+    return journal.position(), states
+
+
+def _items_from_columns(model: type, columns: dict) -> list:
+    """from_dict() of every row of columns; None is set like from_dict() sets the missing optional attrs."""
+    attrs = tuple(columns)
+    new = model.__new__
+    items = []
+    for values in zip(*columns.values()):
+        item = new(model)
+        for attr, value in zip(attrs, values):
+            setattr(item, attr, value)
+        items.append(item)
+    return items
+
+
+class PartitionedStorage:
+    """
+    Items of a model split into partitions by model.partition_of(item.<model.partition_attr>), one SqList and one
+    journal file per partition, see the module docstring. partition_of(value) must be a prefix of str(value): the
+    partitions in name order are also in value order, range/prefix queries on partition_attr skip the other partitions.
+
+    SqList 的写操作在 batch() 里拿着所有分区的日志锁（进程间的文件锁）：跨分区检查唯一约束（身份证号）时，
+    其他实例不会同时修改任何一个分区。
+    """
+    in_memory = False  # 查询交给各个分区的索引
+
+    def __init__(self, model: type, directory, workers=None):
+        self.model = model
+        self.directory = directory
+        self.table_name = model.__name__.lower()
+        self.pk_attrs: tuple = getattr(model, 'pk_attrs', ('id', ))
+        self.partition_attr: str = model.partition_attr
+        self.partitions: dict[str, SqList] = {}  # 分区名（入学年份）-> 分区，按分区名排序
+        self._stack = None  # batch() 里的 ExitStack，batch 中新建的分区也要进入它的 batch
+        self._changed = False
+        os.makedirs(directory, exist_ok=True)
+        self._load(self._names_on_disk(), workers)
+        self._seen = self._state()
+
+    # ---- partitions ----
+    def _paths(self, name: str) -> tuple:
+        base = os.path.join(self.directory, name)
+        return base + JOURNAL_SUFFIX, base + SNAPSHOT_SUFFIX
+
+    def _names_on_disk(self) -> list:
+        return sorted({file_name[:-len(suffix)] for file_name in os.listdir(self.directory)
+                       for suffix in (JOURNAL_SUFFIX, SNAPSHOT_SUFFIX) if file_name.endswith(suffix)})
+
+    def partition_of(self, value) -> str:
+        name = self.model.partition_of(value)
+        if not name.isalnum():  # 分区名是文件名
+            raise ValueError(f'{self.partition_attr}={value!r} does not belong to any partition.')
+        return name
+
+    def partition_counts(self) -> dict:
+        """{partition name: number of items}"""
+        return {name: partition.length for name, partition in self.partitions.items()}
+
+    def _load(self, names: list, workers=None):
+        """
+        Load partitions in a process pool (in this process when there is one worker). The journals are locked until
+        every partition has resumed its journal, so no other instance writes between the workers' reads and here.
+        """
+        journals = {name: Journal(*self._paths(name)) for name in names}
+        workers = min(workers or os.cpu_count() or 1, len(names))
+        with ExitStack() as stack:
+            for journal in journals.values():
+                stack.enter_context(journal.locked())
+            args = [(self.model, journal.journal_path, journal.snapshot_path) for journal in journals.values()]
+            if workers > 1:
+                with ProcessPoolExecutor(workers) as pool:
+                    results = list(pool.map(partial(_read_partition, as_columns=True), *zip(*args)))
+            else:
+                results = [_read_partition(*arg) for arg in args]
+            for (name, journal), (position, states) in zip(journals.items(), results):
+                items = _items_from_columns(self.model, states) if workers > 1 else \
+                    [self.model.from_dict(state) for state in states]
+                partition = SqList(self.model, DictStorage(self.model))
+                partition._add_loaded_items(items)
+                journal.resume(position)
+                partition.journal = journal
+                self.partitions[name] = partition
+
+    def _open_partition(self, name: str) -> SqList:
+        """A new (or created by another instance) partition, loaded from its files."""
+        partition = SqList(self.model, DictStorage(self.model))
+        partition.attach_journal(Journal(*self._paths(name)))
+        self.partitions[name] = partition
+        self.partitions = dict(sorted(self.partitions.items()))
+        if self._stack is not None:
+            self._stack.enter_context(partition.batch())
+        return partition
+
+    def _close_partition(self, name: str) -> SqList:
+        partition = self.partitions.pop(name)
+        partition.close()
+        partition.journal = None  # 还在它的 batch() 里，退出时不能再做快照（会把文件写回来）
+        return partition
+
+    def _partition_for_write(self, value) -> SqList:
+        name = self.partition_of(value)
+        partition = self.partitions.get(name)
+        return partition if partition is not None else self._open_partition(name)
+
+    def drop_partition(self, name: str, archive_dir=None):
+        """
+        Remove a whole partition in O(1): close it and delete its files, or move them into archive_dir.
+        Returns the dropped partition (its items are needed for cascading deletes), None if there is no such partition.
+        Call it in batch(), like every other change.
+        """
+        if name not in self.partitions:
+            return None
+        partition = self._close_partition(name)
+        if archive_dir is not None:
+            os.makedirs(archive_dir, exist_ok=True)
+        for path in self._paths(name):
+            if not os.path.exists(path):  # 还没做过快照的分区只有日志
+                continue
+            if archive_dir is None:
+                os.remove(path)
+            else:
+                os.replace(path, os.path.join(archive_dir, os.path.basename(path)))
+        return partition
+
+    def _discover(self):
+        """Pick up the partitions other instances created (or put back from the archive)."""
+        for name in self._names_on_disk():
+            if name not in self.partitions:
+                self._open_partition(name)
+
+    def _state(self) -> tuple:
+        return tuple(self.partitions), sum(partition.version for partition in self.partitions.values())
+
+    @contextmanager
+    def batch(self):
+        """
+        Every partition's batch(): their journal locks are held and the other instances' changes replayed, the
+        records are committed partition by partition at the end.
+        """
+        if self._stack is not None:
+            yield
+            return
+        with ExitStack() as stack:
+            for name, partition in list(self.partitions.items()):
+                journal = stack.enter_context(partition.journal.locked())
+                if not os.path.exists(journal.journal_path):  # 其他实例删除/归档了这个分区，它的 batch 会重新建一个空日志
+                    self._close_partition(name)
+                    continue
+                stack.enter_context(partition.batch())
+            self._stack = stack
+            try:
+                self._discover()
+                self._changed = self._state() != self._seen
+                yield
+            finally:
+                self._stack = None
+                self._seen = self._state()
+
+    def changed_by_others(self) -> bool:
+        return self._changed
+
+    def close(self):
+        for partition in self.partitions.values():
+            partition.close()
+
+    # ---- list protocol used by SqList ----
+    def _copy(self, item):
+        """The copy handed out to SqList, attribute by attribute (from_dict(to_dict()) costs twice as much)."""
+        copy = self.model.__new__(self.model)
+        for attr in self.model.stored_attrs:
+            setattr(copy, attr, getattr(item, attr, None))
+        return copy
+
+    def _item_key(self, item) -> tuple:
+        return tuple(getattr(item, attr) for attr in self.pk_attrs)
+
+    def _locate(self, key: tuple, hint=None) -> tuple:
+        """(partition, stored item) of primary key key, (None, None) if not stored; hint is the partition to try first."""
+        partitions = self.partitions.values() if hint is None else (hint, *self.partitions.values())
+        for partition in partitions:
+            item = partition.sq_list.find_by_key(key)
+            if item is not None:
+                return partition, item
+        return None, None
+
+    def _locate_item(self, item) -> tuple:
+        return self._locate(self._item_key(item),
+                            self.partitions.get(self.model.partition_of(getattr(item, self.partition_attr, ''))))
+
+    def __len__(self):
+        return sum(partition.length for partition in self.partitions.values())
+
+    def __iter__(self):
+        for partition in list(self.partitions.values()):
+            for item in list(partition.sq_list):
+                yield self._copy(item)
+
+    def _slice(self, start: int, stop: int) -> list:
+        """Stored items at positions [start, stop) of the partitions one after another."""
+        items = []
+        for partition in self.partitions.values():
+            if start >= stop:
+                break
+            length = partition.length
+            if start < length:
+                items.extend(partition.sq_list[start:min(stop, length)])
+            start, stop = max(start - length, 0), stop - length
+        return items
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return [self[j] for j in range(start, stop, step)]
+            return [self._copy(item) for item in self._slice(start, stop)]
+        length = len(self)
+        if i < 0:
+            i += length
+        if not 0 <= i < length:
+            raise IndexError('list index out of range')
+        return self._copy(self._slice(i, i + 1)[0])
+
+    def __setitem__(self, i: int, item):
+        """Replace the i-th item; the new item goes to the end of its partition."""
+        self.remove(self[i])
+        self.append(item)
+
+    def append(self, item):
+        # SqList 已经检查过所有分区的唯一约束
+        self._partition_for_write(getattr(item, self.partition_attr)).add_item(self._copy(item), check_unique=False)
+
+    def extend(self, items):
+        """Add items partition by partition, each partition commits them as one batch."""
+        groups: dict[str, list] = {}
+        for item in items:
+            groups.setdefault(self.partition_of(getattr(item, self.partition_attr)), []).append(self._copy(item))
+        for name, group in groups.items():
+            self._partition_for_write(name).add_items(group, check_unique=False)
+
+    def insert(self, i: int, item):
+        """Items are ordered by partition, an inserted item is appended to its partition."""
+        self.append(item)
+
+    def remove(self, item):
+        partition, stored = self._locate_item(item)
+        if stored is None:
+            raise ValueError(f'{item} not in storage')
+        partition.delete_item(stored)
+
+    def remove_many(self, items) -> list:
+        """Delete items partition by partition with SqList.delete_items(), return the ones which were stored."""
+        groups: dict[int, tuple] = {}
+        removed = []
+        for item in items:
+            partition, stored = self._locate_item(item)
+            if stored is not None:
+                groups.setdefault(id(partition), (partition, []))[1].append(stored)
+                removed.append(item)
+        for partition, stored_items in groups.values():
+            partition.delete_items(stored_items)
+        return removed
+
+    def pop(self, i: int = -1):
+        item = self[i]
+        self.remove(item)
+        return item
+
+    # ---- extra methods, SqList uses them when in_memory is False ----
+    def _partitions_of(self, attr: str, value) -> list:
+        """Partitions which may hold items with attr == value."""
+        if attr != self.partition_attr:
+            return list(self.partitions.values())
+        partition = self.partitions.get(self.model.partition_of(value)) if HashIndex.is_value_indexable(value) else None
+        return [] if partition is None else [partition]
+
+    def find_items(self, attr: str, value) -> list:
+        """Items whose attr equals value: by the index of one partition for partition_attr, of every partition else."""
+        return [self._copy(item) for partition in self._partitions_of(attr, value)
+                for item in partition._find_items(attr, value)]
+
+    def existing_values(self, attr: str, values) -> set:
+        existing = set()
+        if attr == self.partition_attr:
+            groups: dict[str, set] = {}
+            for value in values:
+                if HashIndex.is_value_indexable(value):
+                    groups.setdefault(self.model.partition_of(value), set()).add(value)
+            for name, group in groups.items():
+                if name in self.partitions:
+                    existing |= self.partitions[name]._existing_values(attr, group)
+            return existing
+        values = set(values)
+        for partition in self.partitions.values():
+            existing |= partition._existing_values(attr, values - existing)
+        return existing
+
+    def _merge_sorted(self, attr: str, lists: list) -> list:
+        """Merge lists sorted by attr; partitions are already in the order of partition_attr."""
+        items = [item for items in lists for item in items] if attr == self.partition_attr else \
+            list(merge(*lists, key=attrgetter(attr)))
+        return [self._copy(item) for item in items]
+
+    def find_range(self, attr: str, low=None, high=None) -> list:
+        """Items with low <= attr <= high ordered by attr, None means unbounded."""
+        partitions = self.partitions.items()
+        if attr == self.partition_attr:
+            partitions = [(name, partition) for name, partition in partitions
+                          if (high is None or name <= str(high)) and (low is None or prefix_upper_bound(name) > str(low))]
+        return self._merge_sorted(attr, [partition._items_in_range(attr, low, high) for _, partition in partitions])
+
+    def find_prefix(self, attr: str, prefix: str) -> list:
+        partitions = self.partitions.items()
+        if attr == self.partition_attr:
+            partitions = [(name, partition) for name, partition in partitions
+                          if name.startswith(prefix) or prefix.startswith(name)]
+        return self._merge_sorted(attr, [partition._items_with_prefix(attr, prefix) for _, partition in partitions])
+
+    def _may_match(self, name: str, condition) -> bool:
+        """Whether partition name may hold items matching a condition on partition_attr."""
+        op, value = condition.op, condition.value
+        if op == 'exact':
+            return HashIndex.is_value_indexable(value) and self.model.partition_of(value) == name
+        if op == 'in':
+            return any(HashIndex.is_value_indexable(v) and self.model.partition_of(v) == name for v in value)
+        if op == 'startswith':
+            return name.startswith(str(value)) or str(value).startswith(name)
+        if op in ('gt', 'gte'):
+            return prefix_upper_bound(name) > str(value)
+        return name <= str(value)  # lt, lte
+
+    def _partition_names_of(self, conditions) -> list:
+        return [name for name in self.partitions
+                if all(self._may_match(name, condition) for condition in conditions
+                       if condition.attr == self.partition_attr)]
+
+    def query(self, conditions):
+        """Conditions on partition_attr choose the partitions, each partition's query planner picks its own index."""
+        for name in self._partition_names_of(conditions):
+            partition = self.partitions.get(name)
+            if partition is not None:
+                for item in Query(partition, conditions):
+                    yield self._copy(item)
+
+    def explain_query(self, conditions) -> list[str]:
+        names = self._partition_names_of(conditions)
+        lines = [f'PARTITIONS {", ".join(names) or "none"} ({len(names)} of {len(self.partitions)}, '
+                 f'by {self.partition_attr})']
+        for name in names:
+            partition = self.partitions[name]
+            path = Query(partition, conditions).plan()
+            lines.append(f'{name}: {path.description} (~{path.estimate} of {partition.length} rows)')
+        return lines
+
+    def find_by_key(self, key: tuple):
+        _, item = self._locate(key)
+        return None if item is None else self._copy(item)
+
+    def position_of(self, item):
+        key = self._item_key(item)
+        offset = 0
+        for partition in self.partitions.values():
+            stored = partition.sq_list.find_by_key(key)
+            if stored is not None:
+                return offset + partition._get_item_position(stored)
+            offset += partition.length
+        return None
+
+    def item_updated(self, old_key: tuple, changes: dict):
+        """
+        The stored item gets the changes through its partition (indexes, journal). A partition_attr in another
+        partition moves the item: added to the new partition and committed first, then deleted from the old one.
+        """
+        partition, stored = self._locate(old_key)
+        if stored is None:
+            return
+        name = self.partition_of(changes.get(self.partition_attr, getattr(stored, self.partition_attr)))
+        if self.partitions.get(name) is partition:
+            partition._set_item_attrs(stored, changes, check_unique=False)
+            return
+        target = self._partition_for_write(name)
+        target.add_item(self.model.from_dict({**stored.to_dict(), **changes}), check_unique=False)
+        target.journal.commit()
+        partition.delete_item(stored)
@@ -0,0 +1,205 @@
+# Compound queries on SqList
+"""
+组合条件查询：student_list.filter(gender=1, age__gte=18, student_number__startswith='2020')
+
+条件写成 attr__op=value（和 Django 一样），多个条件之间是 AND，op 有：
+    exact（默认，可以省略）、in、gt、gte、lt、lte、startswith
+没填的可选属性（None / ''）只能用 exact 匹配，比较和 startswith 都不匹配，和索引的处理一致。
+
+查询是惰性的：filter() 只返回 Query，遍历时才执行，结果是生成器，拿够了就可以停下来。
+执行前由 planner 选访问路径：每个能用索引的条件先估计要读多少行（哈希索引看桶的大小，有序索引二分数边界，
+都不用读数据），选行数最少的那个，其余条件对候选逐个检查；没有可用的索引时全表扫描。explain() 显示选择的过程。
+SQLite 存储把所有条件拼成一条 SQL，由 SQLite 自己的 planner 选索引，explain() 显示 EXPLAIN QUERY PLAN；
+MappedStorage 用快照上的一个索引取候选，见 storage.py。
+"""
+import operator
+from functools import partial
+
+from .indexes import HashIndex
+
+
+def _startswith(value, prefix) -> bool:
+    return str(value).startswith(prefix)
+
+
+def _in(value, values) -> bool:
+    return value in values
+
+
+OPERATORS = {  # op -> (显示的符号, 比较函数)
+    'exact': ('==', operator.eq),
+    'in': ('in', _in),
+    'gt': ('>', operator.gt),
+    'gte': ('>=', operator.ge),
+    'lt': ('<', operator.lt),
+    'lte': ('<=', operator.le),
+    'startswith': ('startswith', _startswith),
+}
+
+
+class Condition:
+    """One `attr op value` condition of a query."""
+    __slots__ = ('attr', 'op', 'value', 'symbol', '_compare')
+
+    def __init__(self, attr: str, op: str, value):
+        self.attr = attr
+        self.op = op
+        self.value = tuple(value) if op == 'in' else value
+        self.symbol, self._compare = OPERATORS[op]
+
+    def match(self, item) -> bool:
+        value = getattr(item, self.attr, None)
+        if self.op != 'exact' and not HashIndex.is_value_indexable(value):
+            return False
+        return self._compare(value, self.value)
+
+    def __str__(self):
+        return f'{self.attr} {self.symbol} {self.value!r}'
+
+
+def parse_conditions(model: type, conditions: dict) -> list[Condition]:
+    """
+    {'age__gte': '18', 'gender': 1} -> [Condition('age', 'gte', 18), Condition('gender', 'exact', 1)]
+    值按模型的 fields 转换成属性的类型（Schema.coerce_lookup），不能转换时抛出 ValueError，所有存储后端的结果都一样。
+    """
+    schema = model.schema()
+    parsed = []
+    for lookup, value in conditions.items():
+        attr, _, op = lookup.partition('__')
+        op = op or 'exact'
+        if attr not in model.stored_attrs:
+            raise ValueError(f'{attr} is not an attribute of {model.__name__}.')
+        if op not in OPERATORS:
+            raise ValueError(f'Unknown lookup {op}, use one of {", ".join(OPERATORS)}.')
+        if op == 'in' and (isinstance(value, (str, bytes)) or not hasattr(value, '__iter__')):
+            raise ValueError(f'Invalid value for {attr}: {value!r}, in needs a list of values.')
+        parsed.append(Condition(attr, op, schema.coerce_lookup(attr, op, value)))
+    return parsed
+
+
+class AccessPath:
+    """How the planner gets candidate items: an index lookup or a full scan, with its estimated row count."""
+    __slots__ = ('description', 'estimate', 'covered', 'fetch')
+
+    def __init__(self, description: str, estimate: int, covered: tuple, fetch):
+        self.description = description
+        self.estimate = estimate
+        self.covered = covered  # 索引已经保证满足的条件，不用再逐个检查
+        self.fetch = fetch  # () -> list of candidate items
+
+    @property
+    def is_scan(self):
+        return not self.covered
+
+
+class Query:
+    """
+    Lazy AND-query over a SqList, created by SqList.filter().
+
+    遍历时在读锁里选访问路径、取出候选（对象引用的列表，不复制对象），然后在锁外逐个检查其他条件并 yield，
+    所以遍历的过程中可以修改列表，不会死锁。结果的顺序取决于访问路径（索引顺序或列表顺序）。
+    """
+
+    def __init__(self, sq_list, conditions: list[Condition]):
+        self.sq_list = sq_list
+        self.conditions = conditions
+
+    def __iter__(self):
+        if not self.sq_list.in_memory:
+            return self.sq_list.sq_list.query(self.conditions)
+        return self._execute()
+
+    def _execute(self):
+        with self.sq_list._rwlock.read_lock():
+            path = self.plan()
+            candidates = path.fetch()
+        residual = [condition for condition in self.conditions if condition not in path.covered]
+        if not residual:
+            yield from candidates
+            return
+        for item in candidates:
+            if all(condition.match(item) for condition in residual):
+                yield item
+
+    def first(self):
+        """The first matched item or None, stops at the first match."""
+        return next(iter(self), None)
+
+    def count(self) -> int:
+        return sum(1 for _ in self)
+
+    def access_paths(self) -> list[AccessPath]:
+        """Full scan and every index lookup usable by the conditions, with estimated rows."""
+        sq_list = self.sq_list
+        paths = [AccessPath('full scan', sq_list.length, (), partial(list, sq_list.sq_list))]
+        by_attr: dict[str, list] = {}
+        for condition in self.conditions:
+            by_attr.setdefault(condition.attr, []).append(condition)
+        for attr, conditions in by_attr.items():
+            hash_index, sorted_index = sq_list.indexes.get(attr), sq_list.sorted_indexes.get(attr)
+            for condition in conditions:
+                path = self._equality_path(condition, hash_index, sorted_index)
+                if path is not None:
+                    paths.append(path)
+                if condition.op == 'startswith' and sorted_index is not None:
+                    paths.append(AccessPath(f'sorted index on {attr}, prefix {condition.value!r}',
+                                            sorted_index.count_prefix(condition.value), (condition, ),
+                                            partial(sorted_index.prefix, condition.value)))
+            if sorted_index is not None:
+                path = self._range_path(attr, conditions, sorted_index)
+                if path is not None:
+                    paths.append(path)
+        return paths
+
+    @staticmethod
+    def _equality_path(condition: Condition, hash_index, sorted_index):
+        if condition.op not in ('exact', 'in'):
+            return None
+        values = list(dict.fromkeys((condition.value, ) if condition.op == 'exact' else condition.value))
+        if not all(HashIndex.is_value_indexable(value) for value in values):  # None/'' 不在索引里
+            return None
+        if hash_index is not None:
+            return AccessPath(f'hash index on {condition.attr}, {len(values)} key(s)',
+                              sum(map(hash_index.count, values)), (condition, ),
+                              lambda: [item for value in values for item in hash_index.get(value)])
+        if sorted_index is not None:
+            return AccessPath(f'sorted index on {condition.attr}, {len(values)} key(s)',
+                              sum(sorted_index.count_range(value, value) for value in values), (condition, ),
+                              lambda: [item for value in values for item in sorted_index.range(value, value)])
+        return None
+
+    @staticmethod
+    def _range_path(attr: str, conditions: list, sorted_index):
+        """One range on the sorted index from all gt/gte/lt/lte conditions of attr; gt/lt are checked again."""
+        lows = [condition.value for condition in conditions if condition.op in ('gt', 'gte')]
+        highs = [condition.value for condition in conditions if condition.op in ('lt', 'lte')]
+        if not lows and not highs:
+            return None
+        low, high = (max(lows) if lows else None), (min(highs) if highs else None)
+        covered = tuple(condition for condition in conditions if condition.op in ('gte', 'lte'))
+        return AccessPath(f'sorted index on {attr}, range [{"-inf" if low is None else low}, '
+                          f'{"inf" if high is None else high}]', sorted_index.count_range(low, high), covered,
+                          partial(sorted_index.range, low, high))
+
+    def plan(self) -> AccessPath:
+        """The access path with the fewest estimated rows; an index wins a tie with the scan."""
+        return min(self.access_paths(), key=lambda path: (path.estimate, path.is_scan))
+
+    def explain(self) -> str:
+        """Why the query is executed the way it is: the chosen access path, the filters, the alternatives."""
+        lines = [f'Query on {self.sq_list.model.__name__}: '
+                 + (' AND '.join(map(str, self.conditions)) or 'all items')]
+        if not self.sq_list.in_memory:
+            lines.append(f'{type(self.sq_list.sq_list).__name__} query plan:')
+            lines.extend(f'  {detail}' for detail in self.sq_list.sq_list.explain_query(self.conditions))
+            return '\n'.join(lines)
+        with self.sq_list._rwlock.read_lock():
+            paths = self.access_paths()
+        chosen = min(paths, key=lambda path: (path.estimate, path.is_scan))
+        residual = [str(condition) for condition in self.conditions if condition not in chosen.covered]
+        lines.append(f'Plan: {chosen.description} (~{chosen.estimate} of {self.sq_list.length} rows)')
+        lines.append(f'Filter: {", ".join(residual) if residual else "none"}')
+        lines.append('Access paths considered:')
+        for path in sorted(paths, key=lambda path: (path.estimate, path.is_scan)):
+            lines.append(f'  {"*" if path is chosen else " "} {path.description}: ~{path.estimate} rows')
+        return '\n'.join(lines)
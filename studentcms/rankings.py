@@ -0,0 +1,135 @@
+# Per-course rankings of scores
+"""
+每门课的排名，和 CourseAggregate 一样在成绩增删改时更新，查询时不用排序整门课的成绩：
+
+* 前 k 名：一个小根堆，存的正好是最好的 m 个成绩（m 最多 TOP_CAPACITY，比 TOP_K 大一些），堆顶是第 m 名。
+  新成绩比堆顶好就放进堆（满了替换堆顶），O(log m)；删除的成绩在堆里就从堆里删掉，剩下的仍然是最好的 m - 1 个。
+  删到堆里不够 k 个、而堆外还有成绩时，才用 get_scores 重新选一次（fallback，和 CourseAggregate 的最高最低分一样），
+  多存的几个成绩让连续删掉/改低前几名时不用每次都重新选。
+* 名次/百分位：分数在 0~100 之间，按整数部分分成 101 个桶，桶的人数存在树状数组（Fenwick tree）里，
+  比某个分数高的人数 = 更高的桶的人数之和（O(log 101)）+ 同一个桶里更高的分数的人数（桶里不同的分数很少）。
+
+名次是并列的：同分的学生名次相同，名次 = 1 + 分数比他高的人数。前 k 名同分时学生 id 小的在前。
+"""
+import heapq
+from collections import Counter
+from itertools import chain
+
+TOP_K = 10  # 默认显示的前几名
+TOP_CAPACITY = 4 * TOP_K  # 每门课的堆最多存这么多个成绩
+SCORE_BUCKETS = 101  # 0~100 分，每个整数一个桶
+
+
+def _bucket_of(score) -> int:
+    return min(max(int(score), 0), SCORE_BUCKETS - 1)
+
+
+class CourseRanking:
+    """Top scores and rank counts of one course, see the module docstring."""
+
+    def __init__(self, course_id, capacity=TOP_CAPACITY):
+        self.course_id = course_id
+        self.capacity = capacity
+        self.count = 0
+        self._tree = [0] * (SCORE_BUCKETS + 1)  # 树状数组，下标从 1 开始，桶 b 在 b + 1
+        self._bucket_scores: dict[int, dict] = {}  # 桶 -> {分数: 人数}
+        self._top: list[tuple] = []  # 小根堆，(score, -student_id)：越小越差，是最好的 len(_top) 个成绩
+
+    def _update_tree(self, bucket: int, delta: int):
+        i = bucket + 1
+        while i <= SCORE_BUCKETS:
+            self._tree[i] += delta
+            i += i & -i
+
+    def _count_below_bucket(self, bucket: int) -> int:
+        """Number of scores in the buckets < bucket."""
+        total, i = 0, bucket
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _count(self, score, delta: int):
+        bucket = _bucket_of(score)
+        self._update_tree(bucket, delta)
+        scores = self._bucket_scores.setdefault(bucket, {})
+        scores[score] = scores.get(score, 0) + delta
+        if scores[score] == 0:
+            del scores[score]
+            if not scores:
+                del self._bucket_scores[bucket]
+        self.count += delta
+
+    def add(self, student_id, score):
+        self._count(score, 1)
+        entry, top = (score, -student_id), self._top
+        if len(top) < self.capacity:
+            if len(top) == self.count - 1 or (top and entry > top[0]):  # 堆里是全部成绩，或者比第 m 名好
+                heapq.heappush(top, entry)
+        elif entry > top[0]:
+            heapq.heapreplace(top, entry)
+
+    def add_many(self, pairs):
+        """add() of many (student_id, score) at once, when loading: each distinct score is counted once."""
+        complete = len(self._top) == self.count
+        for score, n in Counter(score for _, score in pairs).items():
+            self._count(score, n)
+        old_top = self._top
+        top = heapq.nlargest(self.capacity, chain(old_top, ((score, -student_id) for student_id, score in pairs)))
+        if not complete:  # 堆外原来就有成绩：只有不比原来的第 m 名差的才确定是最好的
+            top = [entry for entry in top if entry >= old_top[0]] if old_top else []
+        heapq.heapify(top)
+        self._top = top
+
+    def remove(self, student_id, score):
+        self._count(score, -1)
+        entry, top = (score, -student_id), self._top
+        if top and entry >= top[0]:  # 在堆里
+            top.remove(entry)
+            heapq.heapify(top)
+
+    def replace(self, student_id, old_score, new_score):
+        self.remove(student_id, old_score)
+        self.add(student_id, new_score)
+
+    def top(self, k, get_scores) -> list[tuple]:
+        """
+        [(student_id, score)] of the best k scores, best first.
+        get_scores(course_id) -> [(student_id, score)] of all scores of the course, only called when the heap has less
+        than k scores left or k is larger than its capacity.
+        """
+        if k > self.capacity:
+            entries = heapq.nlargest(k, ((score, -student_id) for student_id, score in get_scores(self.course_id)))
+        else:
+            if len(self._top) < min(k, self.count):
+                top = heapq.nlargest(self.capacity, ((score, -student_id) for student_id, score
+                                                     in get_scores(self.course_id)))
+                heapq.heapify(top)  # 建好再换上去：读锁下可能有别的线程同时在读
+                self._top = top
+            entries = sorted(self._top, reverse=True)[:k]
+        return [(-negative_id, score) for score, negative_id in entries]
+
+    def count_above(self, score) -> int:
+        """Number of scores higher than score, O(log SCORE_BUCKETS + distinct scores in its bucket)."""
+        bucket = _bucket_of(score)
+        above = self.count - self._count_below_bucket(bucket + 1)
+        return above + sum(n for value, n in self._bucket_scores.get(bucket, {}).items() if value > score)
+
+    def rank_of(self, score) -> dict:
+        """
+        Returns:
+            dict: {rank, count, percentile}，percentile 是百分位排名：分数更低的人数 + 同分人数的一半，占总人数的百分比
+        """
+        above = self.count_above(score)
+        equal = self._bucket_scores.get(_bucket_of(score), {}).get(score, 0)
+        below = self.count - above - equal
+        return {'rank': above + 1, 'count': self.count, 'percentile': 100 * (below + equal / 2) / self.count}
+
+
+def with_ranks(top: list[tuple]) -> list[tuple]:
+    """[(student_id, score)] best first -> [(rank, student_id, score)], the same score has the same rank."""
+    ranked = []
+    for n, (student_id, score) in enumerate(top, 1):
+        rank = ranked[-1][0] if ranked and ranked[-1][2] == score else n
+        ranked.append((rank, student_id, score))
+    return ranked
@@ -0,0 +1,212 @@
+# Score statistics engine
+"""
+成绩统计：把 StudentCourseList 里的成绩转成三个连续数组（course_id, student_id, score），
+然后用 numpy 一次算完所有课程的统计量，不用按课程一门一门地循环。
+numpy 是可选依赖，没有安装时用纯 Python 计算，结果一样，只是慢一些。
+"""
+import math
+
+from .utils.public_utils import np
+
+PERCENTILES = (25, 50, 75, 90)
+GRADE_EDGES = (60, 70, 80, 90)  # 分数段的分界线，score >= edge 就进入下一段
+GRADE_LABELS = ('<60', '60-69', '70-79', '80-89', '90-100')
+
+
+def grade_index(score) -> int:
+    index = 0
+    for edge in GRADE_EDGES:
+        if score >= edge:
+            index += 1
+    return index
+
+
+def _percentile(sorted_scores: list, p) -> float:
+    """和 numpy.percentile 默认的线性插值一致"""
+    pos = (len(sorted_scores) - 1) * p / 100
+    lo, hi = math.floor(pos), math.ceil(pos)
+    return sorted_scores[lo] + (sorted_scores[hi] - sorted_scores[lo]) * (pos - lo)
+
+
+class ScoreStatistics:
+    """
+    Statistics over a StudentCourseList.
+
+    数组在第一次用到时从成绩列表构建，成绩列表有修改（version 变化）后才重新构建。
+    """
+
+    def __init__(self, student_course_list):
+        self.student_course_list = student_course_list
+        self._version = None
+        self._columns = None
+
+    def _load_columns(self):
+        if self._columns is not None and self._version == self.student_course_list.version:
+            return self._columns
+        scores = self.student_course_list.stu_course_list
+        if np is not None:
+            count = len(scores)
+            self._columns = (
+                np.fromiter((s.course_id for s in scores), dtype=np.int64, count=count),
+                np.fromiter((s.student_id for s in scores), dtype=np.int64, count=count),
+                np.fromiter((s.score for s in scores), dtype=np.float64, count=count),
+            )
+        else:
+            self._columns = tuple(zip(*((s.course_id, s.student_id, s.score) for s in scores))) or ((), (), ())
+        self._version = self.student_course_list.version
+        return self._columns
+
+    def course_statistics(self) -> dict:
+        """
+        Returns:
+            dict: course_id -> {count, mean, std, min, max, median, p25, p50, p75, p90, grades}
+            grades 是各分数段的人数，分数段见 GRADE_LABELS。
+        """
+        course_ids, _, scores = self._load_columns()
+        if len(scores) == 0:
+            return {}
+        if np is None:
+            return self._course_statistics_python(course_ids, scores)
+        # 按课程排序（整数稳定排序很快），每门课是连续的一段，再在每一段里原地排序分数；课程数远小于成绩数
+        order = np.argsort(course_ids, kind='stable')
+        sorted_courses, sorted_scores = course_ids[order], scores[order]
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(sorted_courses)) + 1))
+        counts = np.diff(np.append(starts, len(sorted_courses)))
+        courses = sorted_courses[starts]
+        for start, end in zip(starts.tolist(), (starts + counts).tolist()):
+            sorted_scores[start:end].sort()
+        means = np.add.reduceat(sorted_scores, starts) / counts
+        deviations = sorted_scores - np.repeat(means, counts)
+        stds = np.sqrt(np.add.reduceat(deviations * deviations, starts) / counts)
+        percentiles = {}
+        for p in PERCENTILES:
+            pos = (counts - 1) * p / 100
+            lo, hi = np.floor(pos).astype(np.int64), np.ceil(pos).astype(np.int64)
+            low_scores, high_scores = sorted_scores[starts + lo], sorted_scores[starts + hi]
+            percentiles[p] = (low_scores + (high_scores - low_scores) * (pos - lo)).tolist()
+        bins = len(GRADE_LABELS)
+        course_index = np.repeat(np.arange(len(courses)), counts)
+        grade_index = np.searchsorted(np.array(GRADE_EDGES), sorted_scores, side='right')
+        grades = np.bincount(course_index * bins + grade_index, minlength=len(courses) * bins).reshape(-1, bins)
+        columns = {
+            'count': counts.tolist(),
+            'mean': means.tolist(),
+            'std': stds.tolist(),
+            'min': sorted_scores[starts].tolist(),
+            'max': sorted_scores[starts + counts - 1].tolist(),
+            'grades': grades.tolist(),
+        }
+        result = {}
+        for i, course_id in enumerate(courses.tolist()):
+            stats = {name: values[i] for name, values in columns.items()}
+            stats.update({f'p{p}': percentiles[p][i] for p in PERCENTILES})
+            stats['median'] = stats['p50']
+            result[course_id] = stats
+        return result
+
+    @staticmethod
+    def _course_statistics_python(course_ids, scores) -> dict:
+        scores_by_course: dict = {}
+        for course_id, score in zip(course_ids, scores):
+            scores_by_course.setdefault(course_id, []).append(score)
+        result = {}
+        for course_id in sorted(scores_by_course):
+            course_scores = sorted(scores_by_course[course_id])
+            count = len(course_scores)
+            mean = sum(course_scores) / count
+            grades = [0] * len(GRADE_LABELS)
+            for score in course_scores:
+                grades[grade_index(score)] += 1
+            stats = {
+                'count': count,
+                'mean': mean,
+                'std': math.sqrt(sum((score - mean) ** 2 for score in course_scores) / count),
+                'min': float(course_scores[0]),
+                'max': float(course_scores[-1]),
+                'grades': grades,
+            }
+            stats.update({f'p{p}': float(_percentile(course_scores, p)) for p in PERCENTILES})
+            stats['median'] = stats['p50']
+            result[course_id] = stats
+        return result
+
+    def student_averages(self) -> dict:
+        """student_id -> average score of all his/her courses"""
+        _, student_ids, scores = self._load_columns()
+        if len(scores) == 0:
+            return {}
+        if np is None:
+            totals: dict = {}
+            for student_id, score in zip(student_ids, scores):
+                total = totals.setdefault(student_id, [0, 0])
+                total[0] += score
+                total[1] += 1
+            return {student_id: total / count for student_id, (total, count) in sorted(totals.items())}
+        if student_ids.min() >= 0 and student_ids.max() < 4 * len(student_ids) + 1024:
+            # 学生 id 是 IdAllocator 连续分配的，直接当下标用，不用先排序去重
+            counts = np.bincount(student_ids)
+            students = np.flatnonzero(counts)
+            averages = np.bincount(student_ids, weights=scores)[students] / counts[students]
+        else:
+            students, inverse = np.unique(student_ids, return_inverse=True)
+            averages = np.bincount(inverse, weights=scores) / np.bincount(inverse)
+        return dict(zip(students.tolist(), averages.tolist()))
+
+    def report(self) -> dict:
+        return {'courses': self.course_statistics(), 'students': self.student_averages()}
+
+
+class CourseAggregate:
+    """
+    一门课的聚合值，成绩增删改时 O(1) 更新：人数、总分、平方和、最高最低分、分数段人数。
+    删除的成绩正好是最高/最低分时，最高最低分标记为过期，下次读取时用 get_scores 重新计算（fallback）。
+    """
+
+    def __init__(self, course_id):
+        self.course_id = course_id
+        self.count = 0
+        self.total = 0
+        self.total_sq = 0
+        self.min = None
+        self.max = None
+        self.min_max_stale = False
+        self.grades = [0] * len(GRADE_LABELS)
+
+    def add(self, score):
+        self.count += 1
+        self.total += score
+        self.total_sq += score * score
+        self.grades[grade_index(score)] += 1
+        if not self.min_max_stale:
+            self.min = score if self.min is None else min(self.min, score)
+            self.max = score if self.max is None else max(self.max, score)
+
+    def remove(self, score):
+        self.count -= 1
+        self.total -= score
+        self.total_sq -= score * score
+        self.grades[grade_index(score)] -= 1
+        if self.count == 0:
+            self.min, self.max, self.min_max_stale = None, None, False
+        elif score == self.min or score == self.max:
+            self.min_max_stale = True
+
+    def replace(self, old_score, new_score):
+        self.remove(old_score)
+        self.add(new_score)
+
+    def to_dict(self, get_scores) -> dict:
+        """get_scores(course_id) -> all scores of the course, only called when min/max are stale"""
+        if self.min_max_stale:
+            scores = get_scores(self.course_id)
+            self.min, self.max, self.min_max_stale = min(scores), max(scores), False
+        mean = self.total / self.count
+        variance = max(self.total_sq / self.count - mean * mean, 0)  # 浮点误差可能让它略小于0
+        return {
+            'count': self.count,
+            'mean': mean,
+            'std': math.sqrt(variance),
+            'min': float(self.min),
+            'max': float(self.max),
+            'grades': list(self.grades),
+        }
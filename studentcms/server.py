@@ -0,0 +1,224 @@
+# HTTP/JSON service over StudentManager
+"""
+python -m studentcms serve：把 StudentManager 的增删改查和统计以 JSON 接口提供给其他系统。
+
+* 网络部分是 asyncio（一个线程处理所有连接，支持 keep-alive），只实现了这个服务需要的 HTTP/1.1 子集；
+* 查询/修改数据会拿锁、写日志，是阻塞的，放到一个有上限的线程池里执行，事件循环不会被卡住；
+  在排队的请求数也有上限（SERVER_MAX_PENDING），超过的连接在 semaphore 上等，不会无限占内存；
+* 返回的 JSON 就是 format_result 的 {'code', 'message', 'data'}，HTTP 状态码和 code 一致。
+
+接口：
+    GET    /health
+    GET    /students/<student_number>
+    GET    /students?name=|q=|surname=|age_min=&age_max=|student_number_prefix=[&limit=]
+    POST   /students                    body: 一个学生 {...} 或者多个学生 [{...}, ...]
+    PATCH  /students/<student_number>   body: 要修改的属性 {...}
+    PATCH  /students                    body: 批量修改 [{"student_number": ..., "changes": {...}}, ...]，一个事务
+    DELETE /students/<student_number>
+    GET    /statistics
+    GET    /rankings[?course_id=&k=]       每门课的前 k 名
+    GET    /students/<student_number>/ranks 学生在每门课里的名次和百分位
+    GET    /metrics                     操作统计，见 utils/metrics.py
+"""
+import asyncio
+import json
+import re
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlsplit
+
+from . import settings
+from .bll import StudentManager
+from .utils.public_utils import format_result
+
+MAX_BODY_SIZE = 16 * 1024 * 1024
+STUDENT_PATH_PATTERN = re.compile(r'^/students/(\w+)$')
+STUDENT_RANKS_PATH_PATTERN = re.compile(r'^/students/(\w+)/ranks$')
+PROBE_PATHS = ('/health', '/metrics')
+
+
+class BadRequest(Exception):
+    pass
+
+
+class StudentService:
+    """
+    Route requests to StudentManager.api_* and run them on a bounded thread pool.
+
+    manager 的方法是线程安全的（读写锁），所以多个工作线程可以同时查询。
+    """
+
+    def __init__(self, manager, max_workers=None, max_pending=None):
+        self.manager = manager
+        self.executor = ThreadPoolExecutor(max_workers or settings.SERVER_WORKERS, thread_name_prefix='studentcms')
+        self.max_pending = max_pending or settings.SERVER_MAX_PENDING
+        self._pending = None  # asyncio.Semaphore 要在事件循环里创建
+
+    def route(self, method: str, path: str, query: dict, body):
+        """Return (function, args) for the request, or a format_result dict for a bad route."""
+        match = STUDENT_PATH_PATTERN.match(path)
+        if match:
+            student_number = match.group(1)
+            routes = {
+                'GET': (self.manager.api_get_student, (student_number, )),
+                'PATCH': (self.manager.api_update_student, (student_number, body)),
+                'DELETE': (self.manager.api_delete_student, (student_number, )),
+            }
+        elif (match := STUDENT_RANKS_PATH_PATTERN.match(path)) is not None:
+            routes = {'GET': (self.manager.api_student_ranks, (match.group(1), ))}
+        elif path == '/students':
+            routes = {
+                'GET': (self.manager.api_find_students, (query, )),
+                'POST': (self.manager.api_add_students, (body, )),
+                'PATCH': (self.manager.api_update_students, (body, )),
+            }
+        elif path == '/statistics':
+            routes = {'GET': (self.manager.api_statistics, ())}
+        elif path == '/rankings':
+            routes = {'GET': (self.manager.api_rankings, (query, ))}
+        elif path == '/health':
+            routes = {'GET': (self.health, ())}
+        elif path == '/metrics':
+            routes = {'GET': (self.metrics, ())}
+        else:
+            return format_result(404, f'{path} not found.')
+        handler = routes.get(method)
+        if handler is None:
+            return format_result(405, f'{method} is not allowed on {path}.')
+        return handler
+
+    def health(self):
+        return format_result(200, 'OK', {'students': self.manager.length})
+
+    def metrics(self):
+        return format_result(200, 'OK', self.manager.metrics())
+
+    async def handle(self, method: str, target: str, body: bytes) -> dict:
+        url = urlsplit(target)
+        query = dict(parse_qsl(url.query))
+        if url.path in PROBE_PATHS:  # 不看 body，也不进线程池：body 不合法、线程池满了也能回答
+            handler = self.route(method, url.path, query, None)
+            return handler if isinstance(handler, dict) else handler[0](*handler[1])
+        try:
+            data = json.loads(body) if body else None
+        except ValueError as e:
+            return format_result(400, f'Invalid JSON: {e}')
+        handler = self.route(method, url.path, query, data)
+        if isinstance(handler, dict):
+            return handler
+        func, args = handler
+        if self._pending is None:
+            self._pending = asyncio.Semaphore(self.max_pending)
+        async with self._pending:
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+            except Exception as e:
+                return format_result(500, f'{type(e).__name__}: {e}')
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except BadRequest as e:
+                    await write_response(writer, format_result(400, str(e)), keep_alive=False)
+                    break
+                if request is None:  # 客户端关闭了连接
+                    break
+                method, target, body, keep_alive = request
+                result = await self.handle(method, target, body)
+                await write_response(writer, result, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=None, port=None, ready=None):
+        server = await asyncio.start_server(self.handle_connection, host or settings.SERVER_HOST,
+                                            settings.SERVER_PORT if port is None else port)
+        if ready is not None:
+            ready(server)
+        stop = asyncio.Event()
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)  # kill 的时候也正常退出
+        except (NotImplementedError, AttributeError, RuntimeError):  # Windows 没有 SIGTERM 的信号处理；不在主线程里也不能设置
+            pass
+        async with server:
+            await stop.wait()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.manager.close()
+
+
+def parse_head(head: bytes):
+    """Request line and headers: (method, target, version, {lower-case name: value})."""
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, version = lines[0].split(' ')
+    except ValueError:
+        raise BadRequest(f'Invalid request line: {lines[0]!r}')
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+    return method, target, version, headers
+
+
+async def read_request(reader: asyncio.StreamReader):
+    """
+    Read one request: (method, target, body, keep_alive), or None on a clean EOF.
+    只支持 Content-Length 的 body，不支持 chunked。
+    """
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError as e:
+        if not e.partial.strip():
+            return None
+        raise BadRequest('Incomplete request.')
+    except asyncio.LimitOverrunError:
+        raise BadRequest('Request header is too large.')
+    method, target, version, headers = parse_head(head)
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        raise BadRequest('Chunked body is not supported.')
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise BadRequest('Invalid Content-Length.')
+    if not 0 <= length <= MAX_BODY_SIZE:
+        raise BadRequest('Invalid Content-Length.')
+    body = await reader.readexactly(length) if length else b''
+    connection = headers.get('connection', '').lower()
+    keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+    return method.upper(), target, body, keep_alive
+
+
+async def write_response(writer: asyncio.StreamWriter, result: dict, keep_alive=True):
+    body = json.dumps(result, ensure_ascii=False).encode('utf-8')
+    status = HTTPStatus(result['code'])
+    writer.write(
+        f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+        f'Content-Type: application/json; charset=utf-8\r\n'
+        f'Content-Length: {len(body)}\r\n'
+        f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode('latin-1') + body
+    )
+    await writer.drain()
+
+
+def run_server(host=None, port=None, workers=None):
+    service = StudentService(StudentManager(), max_workers=workers)
+
+    def ready(server):
+        address = ', '.join(f'{sock.getsockname()[0]}:{sock.getsockname()[1]}' for sock in server.sockets)
+        print(f'Serving StudentCMS on http://{address} (Ctrl+C to quit)', flush=True)
+
+    try:
+        asyncio.run(service.serve(host, port, ready))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()  # 提交还没写进日志的修改
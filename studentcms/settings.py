@@ -1,3 +1,38 @@
 import os
 PROJECT_ROOT = r'F:/Hanpx/Python/Python-Practices/PythonProgramming-FromIntroduction2Practice/Projects/StudentCMS/studentcms'
-DATA_PICKLE_PATH = os.path.join(PROJECT_ROOT, 'data', 'current_id.pkl')
\ No newline at end of file
+DATA_PICKLE_PATH = os.path.join(PROJECT_ROOT, 'data', 'current_id.pkl')
+# 存储后端：'journal' 数据在内存里，用快照 + 预写日志持久化；'sqlite' 数据存在 SQLite 文件里；
+# 'mmap' 学生存在 mmap 打开的二进制快照里 + 预写日志，启动不用加载全部学生（课程和成绩同 'journal'）
+# 'partitioned' 学生按入学年份分区，每年一个快照 + 日志，启动时并行加载（课程和成绩同 'journal'），见 partitions.py
+STORAGE_BACKEND = 'journal'
+PAGE_SIZE = 20  # 显示所有学生时每页的行数
+SQLITE_DB_PATH = os.path.join(PROJECT_ROOT, 'data', 'studentcms.sqlite3')
+# 学生数据的持久化：快照 + 预写日志
+STUDENT_SNAPSHOT_PATH = os.path.join(PROJECT_ROOT, 'data', 'students_snapshot.pkl')
+STUDENT_JOURNAL_PATH = os.path.join(PROJECT_ROOT, 'data', 'students.journal')
+# 'mmap' 后端的学生快照（文件名后面会加上 generation）和日志，和 'journal' 后端的文件分开
+STUDENT_MAPPED_SNAPSHOT_PATH = os.path.join(PROJECT_ROOT, 'data', 'students_snapshot.bin')
+STUDENT_MAPPED_JOURNAL_PATH = os.path.join(PROJECT_ROOT, 'data', 'students_mapped.journal')
+# 'partitioned' 后端的分区目录（每个年份一对 2019.journal / 2019.pkl）、归档目录和加载分区的进程数（None: CPU 核数）
+STUDENT_PARTITIONS_PATH = os.path.join(PROJECT_ROOT, 'data', 'students_partitions')
+STUDENT_ARCHIVE_PATH = os.path.join(PROJECT_ROOT, 'data', 'students_archive')
+PARTITION_LOAD_WORKERS = None
+COURSE_SNAPSHOT_PATH = os.path.join(PROJECT_ROOT, 'data', 'courses_snapshot.pkl')
+COURSE_JOURNAL_PATH = os.path.join(PROJECT_ROOT, 'data', 'courses.journal')
+SCORE_SNAPSHOT_PATH = os.path.join(PROJECT_ROOT, 'data', 'scores_snapshot.pkl')
+SCORE_JOURNAL_PATH = os.path.join(PROJECT_ROOT, 'data', 'scores.journal')
+# 操作统计（调用次数、耗时、读写字节数），见 utils/metrics.py；METRICS_DUMP_FILE 不是 None 时退出时写入这个 JSON 文件
+METRICS_ENABLED = False
+METRICS_DUMP_FILE = None
+# HTTP 服务（python -m studentcms serve）
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8000
+SERVER_WORKERS = 4  # 执行存储操作的线程数
+SERVER_MAX_PENDING = 256  # 同时在排队/执行的请求数上限，超过的请求等待，不会无限堆积
+
+
+def use_data_dir(data_dir):
+    """把所有数据文件（*_PATH）都放到 data_dir 下，文件名不变"""
+    for name, value in list(globals().items()):
+        if name.endswith('_PATH'):
+            globals()[name] = os.path.join(data_dir, os.path.basename(value))
@@ -0,0 +1,348 @@
+# Memory-mapped binary snapshot
+"""
+二进制快照：启动时不再 unpickle 全部对象，而是用 mmap 打开快照文件，只读文件头，打开的时间和数据量无关。
+
+文件格式：
+* 文件头：magic + 4 字节长度 + JSON（行数、generation、字段布局、各部分和各索引的偏移量）；
+* 定长记录：每行一条，null 位图 + model.snapshot_fixed_attrs 声明的定长字段（struct 格式，比如学号 '11s'、年龄 'h'）
+  + 其他属性（name、address 等不定长的字符串）在字符串堆里的 (偏移, 长度)；
+* 字符串堆：UTF-8 字符串首尾相接；
+* 索引：主键和 model 声明的索引属性，每个属性一个按 (值, 行号) 排好序的行号数组（uint32），
+  等值/范围/前缀查询在数组上二分，每一步只解码一个字段。None/'' 和内存里的索引一样不进索引。
+
+文件只写一次、不修改：做快照时写新的一代（文件名后缀是 generation），旧的在没人用的时候删掉。
+Windows 上被映射的文件不能替换，所以不用 os.replace 覆盖同一个文件。
+"""
+import glob
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from .indexes import HashIndex
+from .journal import Journal
+from .utils.metrics import count_bytes, timed
+
+MAGIC = b'SCMSNAP1'
+_LENGTH = struct.Struct('<I')
+_ALIGN = 8
+
+
+def index_attrs_of(model: type) -> tuple:
+    """Attributes indexed in the snapshot: primary key and the indexes declared by model, without duplicates."""
+    return tuple(dict.fromkeys((*getattr(model, 'pk_attrs', ('id', )), *getattr(model, 'unique_index_attrs', ()),
+                                *getattr(model, 'index_attrs', ()), *getattr(model, 'adjacency_index_attrs', ()),
+                                *getattr(model, 'sorted_index_attrs', ()))))
+
+
+def _aligned(offset: int) -> int:
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+class RecordLayout:
+    """Byte layout of one record: null bitmap, fixed-width fields, then (offset, length) of each heap string."""
+
+    def __init__(self, model: type):
+        self.fixed = tuple(getattr(model, 'snapshot_fixed_attrs', ()))
+        fixed_attrs = [attr for attr, _ in self.fixed]
+        self.heap_attrs = tuple(attr for attr in model.stored_attrs if attr not in fixed_attrs)
+        self.attrs = (*fixed_attrs, *self.heap_attrs)
+        self.null_bit = {attr: n for n, attr in enumerate(self.attrs)}
+        self.null_size = (len(self.attrs) + 7) // 8
+        self.struct = struct.Struct('<' + f'{self.null_size}s' + ''.join(fmt for _, fmt in self.fixed)
+                                    + 'II' * len(self.heap_attrs))
+        self.size = self.struct.size
+        # attr -> (在记录里的偏移, struct)，取单个字段时用
+        self.fields = {}
+        offset = self.null_size
+        for attr, fmt in self.fixed:
+            field = struct.Struct('<' + fmt)
+            self.fields[attr] = (offset, field)
+            offset += field.size
+        for attr in self.heap_attrs:
+            self.fields[attr] = (offset, struct.Struct('<II'))
+            offset += 8
+        self.widths = {attr: struct.calcsize(fmt) for attr, fmt in self.fixed if fmt.endswith('s')}
+
+    def pack(self, state: dict, heap: bytearray) -> bytes:
+        """One record of state; name/address 追加到 heap 里，记录里存 (偏移, 长度)。"""
+        fields, null_bits = [], 0
+        for n, (attr, fmt) in enumerate(self.fixed):
+            value = state.get(attr)
+            if value is None:
+                null_bits |= 1 << n
+                value = b'' if fmt.endswith('s') else 0
+            elif fmt.endswith('s'):
+                value = value.encode('utf-8')
+                if len(value) > self.widths[attr]:
+                    raise ValueError(f'{attr}={state[attr]!r} does not fit in {self.widths[attr]} bytes.')
+            fields.append(value)
+        for n, attr in enumerate(self.heap_attrs, len(self.fixed)):
+            value = state.get(attr)
+            if value is None:
+                null_bits |= 1 << n
+                fields.extend((0, 0))
+                continue
+            encoded = str(value).encode('utf-8')
+            fields.extend((len(heap), len(encoded)))
+            heap += encoded
+        return self.struct.pack(null_bits.to_bytes(self.null_size, 'little'), *fields)
+
+    def describe(self) -> dict:
+        return {'fixed': [list(field) for field in self.fixed], 'heap': list(self.heap_attrs)}
+
+
+@timed()
+def write_snapshot(path, model: type, generation: int, states) -> int:
+    """
+    Write states (dicts of stored attrs) as a binary snapshot file, atomically (tmp file + fsync + rename).
+    Returns the number of rows. 定长字段放不下的值（比如超长的学号）抛出 ValueError，校验过的数据不会出现。
+    """
+    layout = RecordLayout(model)
+    index_attrs = index_attrs_of(model)
+    records, heap = bytearray(), bytearray()
+    values = {attr: [] for attr in index_attrs}
+    count = 0
+    for state in states:
+        records += layout.pack(state, heap)
+        for attr in index_attrs:
+            values[attr].append(state.get(attr))
+        count += 1
+    indexes = {}
+    for attr in index_attrs:
+        column = values[attr]
+        rows = [row for row, value in enumerate(column) if HashIndex.is_value_indexable(value)]
+        rows.sort(key=column.__getitem__)  # sort 是稳定的，相同的值按行号排
+        indexes[attr] = array('I', rows)
+    header = {'model': model.__name__, 'generation': generation, 'count': count, 'record_size': layout.size,
+              'byteorder': sys.byteorder, **layout.describe()}
+    # 先用占位的偏移量算出文件头的长度，再填真正的偏移量；偏移量用定长的数字，两次的长度一样
+    header.update(records_offset=0, heap_offset=0, heap_size=len(heap),
+                  indexes={attr: [0, len(rows)] for attr, rows in indexes.items()})
+    header_size = len(_encode_header(header, placeholder=True))
+    offset = _aligned(header_size)
+    header['records_offset'] = offset
+    offset = _aligned(offset + len(records))
+    header['heap_offset'] = offset
+    offset = _aligned(offset + len(heap))
+    for attr, rows in indexes.items():
+        header['indexes'][attr] = [offset, len(rows)]
+        offset = _aligned(offset + len(rows) * rows.itemsize)
+    sections = [(header['records_offset'], records), (header['heap_offset'], heap),
+                *((header['indexes'][attr][0], rows.tobytes()) for attr, rows in indexes.items())]
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as fp:
+        fp.write(_encode_header(header))
+        for section_offset, data in sections:
+            fp.write(b'\0' * (section_offset - fp.tell()))
+            fp.write(data)
+        fp.flush()
+        os.fsync(fp.fileno())
+        count_bytes('write_snapshot', written=fp.tell())
+    os.replace(tmp_path, path)  # 新文件名，不会覆盖正在被映射的文件
+    return count
+
+
+def _encode_header(header: dict, placeholder=False) -> bytes:
+    if placeholder:  # 偏移量写成最长的样子，只用来计算长度
+        header = {**header, 'records_offset': 2 ** 63, 'heap_offset': 2 ** 63,
+                  'indexes': {attr: [2 ** 63, n] for attr, (_, n) in header['indexes'].items()}}
+    data = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    if not placeholder:
+        data = data.ljust(len(_encode_header(header, placeholder=True)) - len(MAGIC) - _LENGTH.size)
+    return MAGIC + _LENGTH.pack(len(data)) + data
+
+
+class MappedSnapshot:
+    """
+    A snapshot file opened with mmap (read only). Opening reads only the header; rows are decoded when accessed.
+    path 为 None 或文件不存在时是空快照。
+    """
+
+    def __init__(self, model: type, path=None):
+        self.model = model
+        self.path = path
+        self.layout = RecordLayout(model)
+        self.generation = 0
+        self.count = 0
+        self._file = None
+        self._map = None
+        self._indexes: dict[str, memoryview] = {}
+        self._readers = {}
+        if path is not None and os.path.exists(path):
+            self._open(path)
+
+    @timed('MappedSnapshot.open')
+    def _open(self, path):
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f'{path} is not a snapshot file.')
+        (header_size, ) = _LENGTH.unpack_from(self._map, len(MAGIC))
+        start = len(MAGIC) + _LENGTH.size
+        header = json.loads(bytes(self._map[start:start + header_size]))
+        if header['model'] != self.model.__name__ or header['fixed'] != [list(field) for field in self.layout.fixed] \
+                or header['heap'] != list(self.layout.heap_attrs) or header['byteorder'] != sys.byteorder:
+            self.close()
+            raise ValueError(f'{path} was written with another layout of {header["model"]}.')
+        self.generation = header['generation']
+        self.count = header['count']
+        self._records_offset = header['records_offset']
+        self._heap_offset = header['heap_offset']
+        view = memoryview(self._map)
+        self._indexes = {attr: view[offset:offset + n * 4].cast('I') for attr, (offset, n) in header['indexes'].items()}
+        view.release()
+        self._readers = {attr: self._sort_key_reader(attr) for attr in self._indexes}
+
+    def _sort_key_reader(self, attr: str):
+        """
+        row -> value of attr as compared by _bisect: raw UTF-8 bytes for strings (same order as str, no decoding),
+        int otherwise. 二分的每一步只切一段 bytes，比 value() 解码快很多。
+        """
+        mm, size = self._map, self.layout.size
+        field_offset, field = self.layout.fields[attr]
+        base = self._records_offset + field_offset
+        if attr in self.layout.heap_attrs:
+            unpack, heap = field.unpack_from, self._heap_offset
+
+            def read_heap(row):
+                start, length = unpack(mm, base + row * size)
+                return mm[heap + start:heap + start + length]
+            return read_heap
+        if attr in self.layout.widths:
+            width = self.layout.widths[attr]
+            return lambda row: mm[base + row * size:base + row * size + width].rstrip(b'\0')
+        unpack = field.unpack_from
+        return lambda row: unpack(mm, base + row * size)[0]
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        for rows in self._indexes.values():
+            rows.release()  # 有 memoryview 引用时 mmap 不能关闭
+        self._indexes = {}
+        self._readers = {}
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _is_null(self, offset: int, n: int) -> bool:
+        return bool(self._map[offset + n // 8] & (1 << n % 8))
+
+    def value(self, row: int, attr: str):
+        """Decode one attribute of a row."""
+        offset = self._records_offset + row * self.layout.size
+        if self._is_null(offset, self.layout.null_bit[attr]):
+            return None
+        field_offset, field = self.layout.fields[attr]
+        if attr in self.layout.heap_attrs:
+            start, length = field.unpack_from(self._map, offset + field_offset)
+            start += self._heap_offset
+            return self._map[start:start + length].decode('utf-8')
+        (value, ) = field.unpack_from(self._map, offset + field_offset)
+        return value.rstrip(b'\0').decode('utf-8') if isinstance(value, bytes) else value
+
+    def state(self, row: int) -> dict:
+        """All attributes of a row as the dict of Model.to_dict()."""
+        if not 0 <= row < self.count:
+            raise IndexError('snapshot row out of range')
+        layout = self.layout
+        offset = self._records_offset + row * layout.size
+        fields = layout.struct.unpack_from(self._map, offset)
+        null_bits = int.from_bytes(fields[0], 'little')
+        state = {}
+        for n, (attr, _) in enumerate(layout.fixed):
+            if not null_bits & (1 << n):
+                value = fields[n + 1]
+                state[attr] = value.rstrip(b'\0').decode('utf-8') if isinstance(value, bytes) else value
+        heap_fields = len(layout.fixed) + 1
+        for n, attr in enumerate(layout.heap_attrs):
+            if not null_bits & (1 << (n + len(layout.fixed))):
+                start, length = fields[heap_fields + 2 * n], fields[heap_fields + 2 * n + 1]
+                start += self._heap_offset
+                state[attr] = self._map[start:start + length].decode('utf-8')
+        return state
+
+    def item(self, row: int):
+        return self.model.from_dict(self.state(row))
+
+    def is_indexed(self, attr: str) -> bool:
+        return attr in self._indexes
+
+    def _bisect(self, attr: str, value, right=False) -> int:
+        """Position of value in the index of attr, like bisect_left/bisect_right on the sorted values."""
+        rows, read = self._indexes[attr], self._readers[attr]
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        low, high = 0, len(rows)
+        while low < high:
+            middle = (low + high) // 2
+            middle_value = read(rows[middle])
+            if middle_value < value or (right and middle_value == value):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def equal_rows(self, attr: str, value) -> list[int]:
+        """Rows whose attr equals value, ascending, O(log n + k) on the index."""
+        if not HashIndex.is_value_indexable(value):
+            return []
+        return sorted(self._indexes[attr][self._bisect(attr, value):self._bisect(attr, value, right=True)])
+
+    def range_rows(self, attr: str, low=None, high=None, high_inclusive=True) -> list[int]:
+        """Rows with low <= attr <= high (or < high), ordered by (attr, row); None means unbounded."""
+        rows = self._indexes[attr]
+        start = 0 if low is None else self._bisect(attr, low)
+        end = len(rows) if high is None else self._bisect(attr, high, right=high_inclusive)
+        return rows[start:end].tolist() if start < end else []
+
+
+class MappedJournal(Journal):
+    """
+    Journal whose snapshot is a MappedSnapshot: load() returns the mapped snapshot instead of a list of states,
+    compact() writes a new generation of the binary snapshot and returns it opened.
+    快照文件是 f'{snapshot_path}.{generation}'，日志的 generation 头指向其中一个。
+    """
+
+    def __init__(self, journal_path, snapshot_path, model: type, **kwargs):
+        super().__init__(journal_path, snapshot_path, **kwargs)
+        self.model = model
+
+    def _snapshot_files(self) -> dict[int, str]:
+        files = {}
+        for path in glob.glob(f'{glob.escape(self.snapshot_path)}.*'):
+            suffix = path.rsplit('.', 1)[1]
+            if suffix.isdigit():
+                files[int(suffix)] = path
+        return files
+
+    def _load_snapshot(self):
+        files = self._snapshot_files()
+        if not files:
+            return 0, MappedSnapshot(self.model)
+        generation = max(files)
+        self._remove_snapshots_before(generation)
+        return generation, MappedSnapshot(self.model, files[generation])
+
+    def _write_snapshot(self, states):
+        path = f'{self.snapshot_path}.{self.generation}'
+        write_snapshot(path, self.model, self.generation, states)
+        self._remove_snapshots_before(self.generation)
+        return MappedSnapshot(self.model, path)
+
+    def _remove_snapshots_before(self, generation: int):
+        """Windows 上还被映射着的文件删不掉，留到下次再删"""
+        for old_generation, path in self._snapshot_files().items():
+            if old_generation < generation:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,781 @@
+# Storage backends of SqList
+"""
+SqList 的存储后端。SqList 只把 self.sq_list 当成一个 "列表" 来用（append/insert/remove/pop/下标/遍历，
+以及批量删除 remove_many），
+所以任何实现了这些方法的对象都可以作为存储后端：
+* ListStorage: 默认，就是 Python list，索引由 SqList 在内存里维护；
+* DictStorage: 也在内存里，按主键存在有序的 dict 里，按主键删除 O(1)，成绩（选课关系）用它；
+* SQLiteStorage: 存在 SQLite 文件里，索引交给 SQLite，查询时才把行还原成对象，数据量可以比内存大；
+* MappedStorage: 数据在 mmap 打开的二进制快照里（snapshot.py），启动不用加载，快照之后的修改在内存的覆盖层里。
+"""
+import sqlite3
+from bisect import bisect_right, insort
+from contextlib import contextmanager
+from functools import partial
+from itertools import islice
+
+from .indexes import HashIndex, SortedIndex, prefix_upper_bound
+from .snapshot import MappedSnapshot, index_attrs_of
+
+
+class ListStorage(list):
+    """Default storage, items are kept in memory."""
+    in_memory = True  # SqList 需要自己维护索引
+
+    def item_updated(self, old_key, changes: dict):
+        pass  # 对象就在内存里，setattr 已经改好了
+
+    def remove_many(self, items) -> list:
+        """
+        Remove items (by identity) in one pass and return the removed ones.
+        要删除的对象先记在一个集合里（墓碑），再扫一遍列表只留下其他的，O(n + k)；逐个 remove 是 O(n * k)。
+        """
+        tombstones = {id(item) for item in items}
+        kept, removed = [], []
+        for item in self:
+            (removed if id(item) in tombstones else kept).append(item)
+        self[:] = kept
+        return removed
+
+    def close(self):
+        pass
+
+
+class DictStorage:
+    """
+    In-memory storage keyed by primary key: an insertion-ordered dict pk -> item, iterated in the order of a list.
+
+    remove/remove_many 按主键 O(1)，删除一个学生的全部成绩只和他的成绩数有关，不用扫描整个列表；
+    代价是按下标访问要从头数过去 O(n)，成绩不按下标用。主键不能重复，SqList 添加之前检查（_key_conflict）。
+    """
+    in_memory = True
+
+    def __init__(self, model: type):
+        self.pk_attrs: tuple = getattr(model, 'pk_attrs', ('id', ))
+        self._items: dict[tuple, object] = {}
+
+    def _key(self, item) -> tuple:
+        return tuple(getattr(item, attr) for attr in self.pk_attrs)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items.values())
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self._items))
+            if step < 0:
+                return list(self._items.values())[i]
+            return list(islice(self._items.values(), start, stop, step))
+        if i < 0:
+            i += len(self._items)
+        if not 0 <= i < len(self._items):
+            raise IndexError('DictStorage index out of range')
+        return next(islice(self._items.values(), i, None))
+
+    def _rekey(self, old_key: tuple, new_key: tuple, item):
+        """Replace the entry of old_key by new_key -> item at the same position, O(n), only when a pk changes."""
+        self._items = {(new_key if key == old_key else key): (item if key == old_key else value)
+                       for key, value in self._items.items()}
+
+    def __setitem__(self, i: int, item):
+        old_key, key = self._key(self[i]), self._key(item)
+        if key == old_key:
+            self._items[key] = item
+        else:
+            self._rekey(old_key, key, item)
+
+    def append(self, item):
+        self._items[self._key(item)] = item
+
+    def extend(self, items):
+        for item in items:
+            self._items[self._key(item)] = item
+
+    def insert(self, i: int, item):
+        items = list(self._items.items())
+        items.insert(i, (self._key(item), item))
+        self._items = dict(items)
+
+    def remove(self, item):
+        key = self._key(item)
+        if self._items.get(key) is not item:
+            raise ValueError(f'{item} is not in storage.')
+        del self._items[key]
+
+    def remove_many(self, items) -> list:
+        """Remove items by primary key, O(k); items not stored are skipped."""
+        removed = []
+        for item in items:
+            key = self._key(item)
+            if self._items.get(key) is item:
+                del self._items[key]
+                removed.append(item)
+        return removed
+
+    def pop(self, i: int = -1):
+        item = self[i]
+        del self._items[self._key(item)]
+        return item
+
+    def clear(self):
+        self._items.clear()
+
+    def find_by_key(self, key: tuple):
+        return self._items.get(key)
+
+    def item_updated(self, old_key: tuple, changes: dict):
+        item = self._items.get(old_key)
+        if item is not None and any(attr in self.pk_attrs for attr in changes):
+            new_key = self._key(item)
+            if new_key != old_key:
+                self._rekey(old_key, new_key, item)
+
+    def close(self):
+        pass
+
+
+class SQLiteStorage:
+    """
+    Store items of one model in a SQLite table.
+
+    * 一个 storage 只用一个连接，SQL 语句在初始化时拼好，由 sqlite3 的语句缓存复用（prepared statement）；
+    * 列就是 model.stored_attrs，另外有一列 pos 保存顺序，下标相关的操作都按 pos 排序；
+    * 主键列建唯一索引，model 声明的 unique_index_attrs/index_attrs/sorted_index_attrs 建普通索引（B 树，范围查询也能用）；
+    * 批量插入用 executemany，batch() 里的修改放在一个事务里提交。
+    """
+    in_memory = False  # 查询交给 SQLite 的索引
+    EXISTING_CHUNK_SIZE = 500  # 老版本的 SQLite 一条语句最多 999 个参数
+
+    def __init__(self, db_path, model: type, table_name=None, connection=None):
+        self.model = model
+        self.table_name = table_name or model.__name__.lower()
+        self.columns: tuple = model.stored_attrs
+        self.pk_attrs: tuple = getattr(model, 'pk_attrs', ('id', ))
+        # isolation_level=None: 自动提交，batch() 里手动 BEGIN/COMMIT
+        self.connection = connection or sqlite3.connect(db_path, isolation_level=None, check_same_thread=False,
+                                                        cached_statements=256)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self._create_table()
+        self._prepare_statements()
+        self._data_version = self._read_data_version()
+
+    def _create_table(self):
+        table = self.table_name
+        columns = ', '.join(self.columns)
+        self.connection.execute(f'CREATE TABLE IF NOT EXISTS {table} (pos REAL NOT NULL, {columns})')
+        self.connection.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_pos ON {table} (pos)')
+        pk_columns = ', '.join(self.pk_attrs)
+        self.connection.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_pk ON {table} ({pk_columns})')
+        indexed_attrs = dict.fromkeys((*getattr(self.model, 'unique_index_attrs', ()), *getattr(self.model, 'index_attrs', ()),
+                                       *getattr(self.model, 'adjacency_index_attrs', ()),
+                                       *getattr(self.model, 'sorted_index_attrs', ())))  # 去重并保持顺序
+        for attr in indexed_attrs:
+            self.connection.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_{attr} ON {table} ({attr})')
+
+    def _prepare_statements(self):
+        table = self.table_name
+        columns = ', '.join(self.columns)
+        placeholders = ', '.join('?' * (len(self.columns) + 1))
+        pk_where = ' AND '.join(f'{attr} = ?' for attr in self.pk_attrs)
+        self._sql = {
+            'count': f'SELECT COUNT(*) FROM {table}',
+            'max_pos': f'SELECT MAX(pos) FROM {table}',
+            'insert': f'INSERT INTO {table} (pos, {columns}) VALUES ({placeholders})',
+            'select_all': f'SELECT {columns} FROM {table} ORDER BY pos',
+            'select_at': f'SELECT pos, {columns} FROM {table} ORDER BY pos LIMIT ? OFFSET ?',
+            'select_where': f'SELECT {columns} FROM {table} WHERE {{attr}} = ? ORDER BY pos',
+            'select_range': f'SELECT {columns} FROM {table} WHERE {{where}} ORDER BY {{attr}}, pos',
+            'select_by_key': f'SELECT {columns} FROM {table} WHERE {pk_where}',
+            'select_filter': f'SELECT {columns} FROM {table} WHERE {{where}} ORDER BY pos',
+            'select_existing': f'SELECT DISTINCT {{attr}} FROM {table} WHERE {{attr}} IN ({{placeholders}})',
+            'delete': f'DELETE FROM {table} WHERE {pk_where}',
+            'delete_at_pos': f'DELETE FROM {table} WHERE pos = ?',
+            'position': f'SELECT COUNT(*) FROM {table} WHERE pos < (SELECT pos FROM {table} WHERE {pk_where})',
+            'update': f'UPDATE {table} SET {{assignments}} WHERE {pk_where}',
+        }
+        self._update_sql: dict[tuple, str] = {}  # 修改的列 -> UPDATE 语句，用到时再拼
+        self._select_where_sql = {attr: self._sql['select_where'].format(attr=attr) for attr in self.columns}
+
+    def _row_values(self, pos, item) -> tuple:
+        return (pos, *(getattr(item, attr, None) for attr in self.columns))
+
+    def _to_item(self, row):
+        # NULL 的可选属性不还原，和内存里 "没设置这个属性" 一致
+        return self.model.from_dict({attr: value for attr, value in zip(self.columns, row) if value is not None})
+
+    def _item_key(self, item) -> tuple:
+        return tuple(getattr(item, attr) for attr in self.pk_attrs)
+
+    def _next_pos(self) -> float:
+        max_pos = self.connection.execute(self._sql['max_pos']).fetchone()[0]
+        return 0.0 if max_pos is None else float(int(max_pos) + 1)
+
+    def _row_at(self, i: int):
+        """Return (pos, *columns) of the i-th row, support negative index like list."""
+        if i < 0:
+            i += len(self)
+        row = self.connection.execute(self._sql['select_at'], (1, i)).fetchone() if i >= 0 else None
+        if row is None:
+            raise IndexError('list index out of range')
+        return row
+
+    # ---- list protocol used by SqList ----
+    def __len__(self):
+        return self.connection.execute(self._sql['count']).fetchone()[0]
+
+    def __iter__(self):
+        for row in self.connection.execute(self._sql['select_all']):
+            yield self._to_item(row)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return [self[j] for j in range(start, stop, step)]
+            rows = self.connection.execute(self._sql['select_at'], (max(stop - start, 0), start))
+            return [self._to_item(row[1:]) for row in rows]
+        return self._to_item(self._row_at(i)[1:])
+
+    def __setitem__(self, i: int, item):
+        pos = self._row_at(i)[0]
+        with self.batch():
+            self.connection.execute(self._sql['delete_at_pos'], (pos, ))
+            self.connection.execute(self._sql['insert'], self._row_values(pos, item))
+
+    def append(self, item):
+        self.connection.execute(self._sql['insert'], self._row_values(self._next_pos(), item))
+
+    def extend(self, items):
+        """Bulk insert with executemany() in one transaction."""
+        start = self._next_pos()
+        with self.batch():
+            self.connection.executemany(
+                self._sql['insert'], (self._row_values(start + n, item) for n, item in enumerate(items)))
+
+    def insert(self, i: int, item):
+        length = len(self)
+        if i >= length:
+            return self.append(item)
+        if i < 0:
+            i = max(i + length, 0)
+        pos = self._row_at(i)[0]
+        prev_pos = self._row_at(i - 1)[0] if i > 0 else pos - 1
+        self.connection.execute(self._sql['insert'], self._row_values((prev_pos + pos) / 2, item))
+
+    def remove(self, item):
+        cursor = self.connection.execute(self._sql['delete'], self._item_key(item))
+        if cursor.rowcount == 0:
+            raise ValueError(f'{item} not in storage')
+
+    def remove_many(self, items) -> list:
+        """Delete items by primary key in one transaction, return the ones which existed."""
+        removed = []
+        with self.batch():
+            for item in items:
+                if self.connection.execute(self._sql['delete'], self._item_key(item)).rowcount:
+                    removed.append(item)
+        return removed
+
+    def pop(self, i: int = -1):
+        row = self._row_at(i)
+        self.connection.execute(self._sql['delete_at_pos'], (row[0], ))
+        return self._to_item(row[1:])
+
+    # ---- extra methods, SqList uses them when in_memory is False ----
+    def find_items(self, attr: str, value) -> list:
+        """Items whose attr equals value, using the SQLite index of attr if there is one."""
+        sql = self._select_where_sql.get(attr)
+        if sql is None:
+            return []
+        return [self._to_item(row) for row in self.connection.execute(sql, (value, ))]
+
+    def existing_values(self, attr: str, values) -> set:
+        """The values already stored in column attr, one IN query per EXISTING_CHUNK_SIZE values."""
+        if attr not in self.columns:
+            return set()
+        values = list(values)
+        existing = set()
+        for start in range(0, len(values), self.EXISTING_CHUNK_SIZE):
+            chunk = values[start:start + self.EXISTING_CHUNK_SIZE]
+            sql = self._sql['select_existing'].format(attr=attr, placeholders=', '.join('?' * len(chunk)))
+            existing.update(row[0] for row in self.connection.execute(sql, chunk))
+        return existing
+
+    def find_range(self, attr: str, low=None, high=None) -> list:
+        """Items with low <= attr <= high ordered by attr, None means unbounded."""
+        return self._select_range(attr, low, high, '<=')
+
+    def find_prefix(self, attr: str, prefix: str) -> list:
+        """Items whose attr starts with prefix, as a range query so the index of attr is used."""
+        return self._select_range(attr, prefix, prefix_upper_bound(prefix) if prefix else None, '<')
+
+    def _select_range(self, attr: str, low, high, high_op: str) -> list:
+        if attr not in self.columns:
+            return []
+        # 和内存里的索引一样，NULL 和 '' 不参与范围查询；None 表示没有这个边界
+        conditions, params = [f"{attr} IS NOT NULL AND {attr} != ''"], []
+        if low is not None:
+            conditions.append(f'{attr} >= ?')
+            params.append(low)
+        if high is not None:
+            conditions.append(f'{attr} {high_op} ?')
+            params.append(high)
+        sql = self._sql['select_range'].format(attr=attr, where=' AND '.join(conditions))
+        return [self._to_item(row) for row in self.connection.execute(sql, params)]
+
+    def _filter_sql(self, conditions) -> tuple[str, list]:
+        """SELECT of query.Condition list; like the in-memory query, NULL and '' only match exact."""
+        clauses, params = [], []
+        for condition in conditions:
+            attr, op, value = condition.attr, condition.op, condition.value
+            if op == 'exact':
+                clauses.append(f'{attr} IS NULL' if value is None else f'{attr} = ?')
+                params.extend(() if value is None else (value, ))
+                continue
+            clauses.append(f"{attr} IS NOT NULL AND {attr} != ''")
+            if op == 'in':
+                clauses.append(f'{attr} IN ({", ".join("?" * len(value))})')
+                params.extend(value)
+            elif op == 'startswith':
+                if value:  # 范围条件，能用上 attr 的索引（LIKE 用不上）
+                    clauses.append(f'{attr} >= ? AND {attr} < ?')
+                    params.extend((value, prefix_upper_bound(value)))
+            else:
+                clauses.append(f'{attr} {condition.symbol} ?')
+                params.append(value)
+        return self._sql['select_filter'].format(where=' AND '.join(clauses) or '1'), params
+
+    def query(self, conditions):
+        """Items matching all conditions, rows are read lazily from the cursor."""
+        sql, params = self._filter_sql(conditions)
+        for row in self.connection.execute(sql, params):
+            yield self._to_item(row)
+
+    def explain_query(self, conditions) -> list[str]:
+        sql, params = self._filter_sql(conditions)
+        return [row[-1] for row in self.connection.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+
+    def find_by_key(self, key: tuple):
+        row = self.connection.execute(self._sql['select_by_key'], key).fetchone()
+        return self._to_item(row) if row else None
+
+    def position_of(self, item):
+        key = self._item_key(item)
+        if self.find_by_key(key) is None:
+            return None
+        return self.connection.execute(self._sql['position'], key).fetchone()[0]
+
+    def item_updated(self, old_key: tuple, changes: dict):
+        """One UPDATE for all changed columns of the row."""
+        attrs = tuple(changes)
+        sql = self._update_sql.get(attrs)
+        if sql is None:
+            unknown = [attr for attr in attrs if attr not in self.columns]
+            if unknown:
+                raise ValueError(f'{unknown[0]} is not a column of {self.table_name}.')
+            sql = self._update_sql[attrs] = self._sql['update'].format(
+                assignments=', '.join(f'{attr} = ?' for attr in attrs))
+        self.connection.execute(sql, (*changes.values(), *old_key))
+
+    def _read_data_version(self) -> int:
+        return self.connection.execute('PRAGMA data_version').fetchone()[0]
+
+    def changed_by_others(self) -> bool:
+        """Whether other connections (e.g. another running instance) committed changes since the last check."""
+        data_version = self._read_data_version()  # 只有其他连接提交修改时才会变
+        changed, self._data_version = data_version != self._data_version, data_version
+        return changed
+
+    @contextmanager
+    def batch(self):
+        """Changes inside the with block are committed in one transaction, or rolled back if it raises."""
+        began = not self.connection.in_transaction  # 嵌套的 batch 由最外层提交
+        if began:
+            self.connection.execute('BEGIN IMMEDIATE')  # 一开始就拿写锁，多个进程的写事务排队执行
+        try:
+            yield self
+        except BaseException:
+            if began:
+                self.connection.execute('ROLLBACK')
+            raise
+        if began:
+            self.connection.execute('COMMIT')
+
+    def close(self):
+        self.connection.close()
+
+
+class MappedStorage:
+    """
+    Items in a memory-mapped binary snapshot (snapshot.MappedSnapshot) plus an in-memory overlay of later changes.
+
+    * 打开时只映射快照文件，不还原对象；查询在快照的索引上二分，只有查到的行才还原成对象；
+    * 快照之后的修改放在覆盖层：新增的对象接在快照后面，改过的行整行换成对象，删除的行记成墓碑（有序的行号）；
+      覆盖层的对象有自己的 HashIndex/SortedIndex，查询时和快照的结果按顺序合并；
+    * 做快照（MappedJournal.compact）之后 SqList 调用 attach_snapshot() 换成新快照，覆盖层清空；
+    * 和 SQLiteStorage 一样，返回的都是副本，修改属性后要调用 item_updated()。
+    在中间插入（insert）会把全部数据搬进覆盖层，只有 replay 旧日志里的 insert 才会用到。
+    """
+    in_memory = False  # 查询交给快照的索引
+
+    def __init__(self, model: type, snapshot=None):
+        self.model = model
+        self.table_name = model.__name__.lower()
+        self.pk_attrs: tuple = getattr(model, 'pk_attrs', ('id', ))
+        self.sorted_attrs = tuple(getattr(model, 'sorted_index_attrs', ()))
+        self.hash_attrs = tuple(attr for attr in index_attrs_of(model) if attr not in self.sorted_attrs)
+        self._snapshot = None
+        self.attach_snapshot(snapshot if snapshot is not None else MappedSnapshot(model))
+
+    def attach_snapshot(self, snapshot):
+        """Use snapshot as the base data and drop the overlay (the snapshot already contains it)."""
+        if self._snapshot is not None and self._snapshot is not snapshot:
+            self._snapshot.close()
+        self._snapshot = snapshot
+        self._deleted: list[int] = []  # 删除的行号，有序，用来把下标换算成行号
+        self._deleted_set: set[int] = set()
+        self._overrides: dict[int, object] = {}  # 行号 -> 改过的对象
+        self._override_rows: dict[tuple, int] = {}  # 主键 -> 改过的对象原来的行号
+        self._tail: list = []  # 快照之后新增的对象
+        self._overlay: dict[tuple, object] = {}  # 主键 -> 覆盖层的对象（改过的和新增的）
+        self._tail_positions: dict[tuple, int] = {}
+        self._tail_dirty = False
+        self._hash_indexes = {attr: HashIndex(attr) for attr in self.hash_attrs}
+        self._sorted_indexes = {attr: SortedIndex(attr) for attr in self.sorted_attrs}
+
+    def _item_key(self, item) -> tuple:
+        return tuple(getattr(item, attr) for attr in self.pk_attrs)
+
+    def _copy(self, item):
+        return self.model.from_dict(item.to_dict())
+
+    def _is_shadowed(self, row: int) -> bool:
+        return row in self._deleted_set or row in self._overrides
+
+    @property
+    def _base_length(self) -> int:
+        return self._snapshot.count - len(self._deleted)
+
+    def _get(self, row: int):
+        item = self._overrides.get(row)
+        return self._snapshot.item(row) if item is None else self._copy(item)
+
+    # ---- overlay ----
+    def _index(self, item):
+        for index in (*self._hash_indexes.values(), *self._sorted_indexes.values()):
+            index.add(item)
+
+    def _unindex(self, item):
+        for index in (*self._hash_indexes.values(), *self._sorted_indexes.values()):
+            index.remove(item)
+
+    def _add_overlay(self, item, row=None):
+        key = self._item_key(item)
+        self._overlay[key] = item
+        if row is None:
+            if not self._tail_dirty:
+                self._tail_positions[key] = len(self._tail)
+            self._tail.append(item)
+        else:
+            self._overrides[row] = item
+            self._override_rows[key] = row
+        self._index(item)
+
+    def _drop_overlay(self, item):
+        """Remove item from the overlay, return the snapshot row it replaced (None for a new item)."""
+        key = self._item_key(item)
+        self._unindex(item)
+        del self._overlay[key]
+        row = self._override_rows.pop(key, None)
+        if row is not None:
+            del self._overrides[row]
+        else:
+            self._tail.remove(item)
+            self._tail_dirty = True
+        return row
+
+    def _tail_position(self, key: tuple):
+        if self._tail_dirty:
+            self._tail_positions = {self._item_key(item): n for n, item in enumerate(self._tail)}
+            self._tail_dirty = False
+        return self._tail_positions.get(key)
+
+    def _order_of(self, item) -> int:
+        """Sort key by position: a changed row keeps its row number, new items come after the snapshot."""
+        key = self._item_key(item)
+        row = self._override_rows.get(key)
+        return row if row is not None else self._snapshot.count + self._tail_position(key)
+
+    def _base_row_of_key(self, key: tuple):
+        for row in self._snapshot.equal_rows(self.pk_attrs[0], key[0]):
+            if not self._is_shadowed(row) and all(self._snapshot.value(row, attr) == value
+                                                  for attr, value in zip(self.pk_attrs[1:], key[1:])):
+                return row
+        return None
+
+    def _locate(self, key: tuple) -> tuple:
+        """(overlay item, None), (None, snapshot row) or (None, None) when key is not stored."""
+        item = self._overlay.get(key)
+        if item is not None:
+            return item, None
+        return None, self._base_row_of_key(key)
+
+    def _row_at(self, i: int) -> int:
+        """Snapshot row of position i (< _base_length): the smallest row with row - deleted rows before it == i."""
+        row = i
+        while True:
+            moved = i + bisect_right(self._deleted, row)
+            if moved == row:
+                return row
+            row = moved
+
+    # ---- list protocol used by SqList ----
+    def __len__(self):
+        return self._base_length + len(self._tail)
+
+    def __iter__(self):
+        for row in range(self._snapshot.count):
+            if row not in self._deleted_set:
+                yield self._get(row)
+        for item in list(self._tail):
+            yield self._copy(item)
+
+    def _normalize(self, i: int) -> int:
+        length = len(self)
+        if i < 0:
+            i += length
+        if not 0 <= i < length:
+            raise IndexError('list index out of range')
+        return i
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return [self[j] for j in range(start, stop, step)]
+            return self._slice(start, stop - start)
+        i = self._normalize(i)
+        base = self._base_length
+        return self._get(self._row_at(i)) if i < base else self._copy(self._tail[i - base])
+
+    def _slice(self, start: int, count: int) -> list:
+        items = []
+        base = self._base_length
+        if start < base and count > 0:
+            row = self._row_at(start)
+            while row < self._snapshot.count and len(items) < count:
+                if row not in self._deleted_set:
+                    items.append(self._get(row))
+                row += 1
+        tail_start = max(start - base, 0)
+        items.extend(self._copy(item) for item in self._tail[tail_start:tail_start + max(count - len(items), 0)])
+        return items
+
+    def __setitem__(self, i: int, item):
+        i = self._normalize(i)
+        base = self._base_length
+        if i < base:
+            row = self._row_at(i)
+            old_item = self._overrides.get(row)
+            if old_item is not None:
+                self._drop_overlay(old_item)
+            self._add_overlay(self._copy(item), row)
+            return
+        old_item = self._tail[i - base]
+        self._unindex(old_item)
+        del self._overlay[self._item_key(old_item)]
+        new_item = self._copy(item)
+        self._tail[i - base] = new_item
+        self._overlay[self._item_key(new_item)] = new_item
+        self._index(new_item)
+        self._tail_dirty = True
+
+    def append(self, item):
+        self._add_overlay(self._copy(item))
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def insert(self, i: int, item):
+        length = len(self)
+        if i >= length:
+            return self.append(item)
+        if i < 0:
+            i = max(i + length, 0)
+        items = list(self)  # 快照里的顺序不能改，全部搬进覆盖层
+        self.attach_snapshot(MappedSnapshot(self.model))
+        items.insert(i, self._copy(item))
+        for new_item in items:
+            self._add_overlay(new_item)
+
+    def _remove(self, item):
+        """Remove item by primary key, return the snapshot row to mark deleted (or None)."""
+        overlay_item, row = self._locate(self._item_key(item))
+        if overlay_item is not None:
+            return self._drop_overlay(overlay_item)
+        if row is None:
+            raise ValueError(f'{item} not in storage')
+        return row
+
+    def remove(self, item):
+        row = self._remove(item)
+        if row is not None:
+            insort(self._deleted, row)
+            self._deleted_set.add(row)
+
+    def remove_many(self, items) -> list:
+        """Remove items by primary key, the deleted rows are merged into the tombstones once."""
+        removed, rows = [], []
+        for item in items:
+            try:
+                row = self._remove(item)
+            except ValueError:
+                continue
+            removed.append(item)
+            if row is not None:
+                rows.append(row)
+                self._deleted_set.add(row)  # 同一批里的下一个 _locate 就能看到
+        if rows:
+            self._deleted = sorted(self._deleted + rows)
+        return removed
+
+    def pop(self, i: int = -1):
+        item = self[i]
+        self.remove(item)
+        return item
+
+    def clear(self):
+        self.attach_snapshot(MappedSnapshot(self.model))
+
+    def close(self):
+        self._snapshot.close()
+
+    # ---- extra methods, SqList uses them when in_memory is False ----
+    def _overlay_matches(self, attr: str, value) -> list:
+        index = self._hash_indexes.get(attr) or self._sorted_indexes.get(attr)
+        if index is not None:
+            return index.get(value)
+        return [item for item in self._overlay.values() if getattr(item, attr, None) == value]
+
+    def find_items(self, attr: str, value) -> list:
+        """Items whose attr equals value in position order, binary search on the snapshot index of attr."""
+        if self._snapshot.is_indexed(attr):
+            rows = self._snapshot.equal_rows(attr, value)
+        else:
+            rows = [row for row in range(self._snapshot.count) if self._snapshot.value(row, attr) == value]
+        found = [(row, None) for row in rows if not self._is_shadowed(row)]
+        found += [(self._order_of(item), item) for item in self._overlay_matches(attr, value)]
+        found.sort(key=lambda entry: entry[0])
+        return [self._snapshot.item(order) if item is None else self._copy(item) for order, item in found]
+
+    def existing_values(self, attr: str, values) -> set:
+        return {value for value in values if self.find_items(attr, value)}
+
+    def find_range(self, attr: str, low=None, high=None) -> list:
+        """Items with low <= attr <= high ordered by attr, None means unbounded."""
+        return self._find_range(attr, low, high, True)
+
+    def find_prefix(self, attr: str, prefix: str) -> list:
+        if not prefix:
+            return self._find_range(attr, None, None, True)
+        return self._find_range(attr, prefix, prefix_upper_bound(prefix), False)
+
+    def _find_range(self, attr: str, low, high, high_inclusive: bool) -> list:
+        def in_range(value):
+            return HashIndex.is_value_indexable(value) and (low is None or value >= low) and (
+                high is None or value < high or (high_inclusive and value == high))
+        snapshot = self._snapshot
+        if snapshot.is_indexed(attr):
+            rows = snapshot.range_rows(attr, low, high, high_inclusive)
+        else:
+            rows = [row for row in range(snapshot.count) if in_range(snapshot.value(row, attr))]
+        found = [(snapshot.value(row, attr), row, None) for row in rows if not self._is_shadowed(row)]
+        sorted_index = self._sorted_indexes.get(attr)
+        overlay = sorted_index.range(low, high) if sorted_index is not None else self._overlay.values()
+        found += [(getattr(item, attr), self._order_of(item), item) for item in overlay
+                  if in_range(getattr(item, attr, None))]
+        found.sort(key=lambda entry: entry[:2])
+        return [snapshot.item(order) if item is None else self._copy(item) for _, order, item in found]
+
+    def _equality_path(self, condition):
+        values = (condition.value, ) if condition.op == 'exact' else tuple(dict.fromkeys(condition.value))
+        if not all(HashIndex.is_value_indexable(value) for value in values):
+            return None
+        return (f'SEARCH {self.table_name} USING SNAPSHOT INDEX ({condition.attr} {condition.symbol} ?)',
+                lambda: [item for value in values for item in self.find_items(condition.attr, value)])
+
+    def _range_path(self, attr: str, conditions):
+        lows = [condition.value for condition in conditions if condition.attr == attr and condition.op in ('gt', 'gte')]
+        highs = [condition.value for condition in conditions if condition.attr == attr and condition.op in ('lt', 'lte')]
+        low, high = (max(lows) if lows else None), (min(highs) if highs else None)
+        return f'SEARCH {self.table_name} USING SNAPSHOT INDEX ({attr} range)', partial(self.find_range, attr, low, high)
+
+    def _access_path(self, conditions) -> tuple:
+        """(description, fetch) of the first usable index: equality, then prefix, then range; else a full scan."""
+        indexed = [condition for condition in conditions if self._snapshot.is_indexed(condition.attr)]
+        for condition in indexed:
+            path = self._equality_path(condition) if condition.op in ('exact', 'in') else None
+            if path is not None:
+                return path
+        for condition in indexed:
+            if condition.op == 'startswith':
+                return (f'SEARCH {self.table_name} USING SNAPSHOT INDEX ({condition.attr} startswith ?)',
+                        partial(self.find_prefix, condition.attr, condition.value))
+        for condition in indexed:
+            if condition.op in ('gt', 'gte', 'lt', 'lte'):
+                return self._range_path(condition.attr, indexed)
+        return f'SCAN {self.table_name}', self.__iter__
+
+    def query(self, conditions):
+        """Items matching all conditions; candidates come from one snapshot index, the conditions are checked on each."""
+        _, fetch = self._access_path(conditions)
+        for item in fetch():
+            if all(condition.match(item) for condition in conditions):
+                yield item
+
+    def explain_query(self, conditions) -> list[str]:
+        return [self._access_path(conditions)[0]]
+
+    def find_by_key(self, key: tuple):
+        item, row = self._locate(key)
+        if item is not None:
+            return self._copy(item)
+        return None if row is None else self._snapshot.item(row)
+
+    def position_of(self, item):
+        key = self._item_key(item)
+        overlay_item, row = self._locate(key)
+        if overlay_item is not None:
+            row = self._override_rows.get(key)
+            if row is None:
+                return self._base_length + self._tail_position(key)
+        if row is None:
+            return None
+        return row - bisect_right(self._deleted, row)
+
+    def item_updated(self, old_key: tuple, changes: dict):
+        """The stored copy gets the changes too; a snapshot row becomes an overlay object the first time it changes."""
+        item, row = self._locate(old_key)
+        if item is not None:
+            self._unindex(item)
+            del self._overlay[old_key]
+            for attr, new_value in changes.items():
+                setattr(item, attr, new_value)
+            new_key = self._item_key(item)
+            self._overlay[new_key] = item
+            row = self._override_rows.pop(old_key, None)
+            if row is not None:
+                self._override_rows[new_key] = row
+            elif new_key != old_key:
+                self._tail_dirty = True
+            self._index(item)
+        elif row is not None:
+            item = self._snapshot.item(row)
+            for attr, new_value in changes.items():
+                setattr(item, attr, new_value)
+            self._add_overlay(item, row)
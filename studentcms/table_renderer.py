@@ -0,0 +1,49 @@
+# Table rendering of model lists
+"""
+把一页数据渲染成表格字符串，再一次 write 出去，而不是每行一个 print。
+每个 model 的格式（列名、取值的属性、宽度）只在第一次用到时编译成一个 format 模板，之后每行只做一次 str.format。
+"""
+import sys
+from operator import attrgetter
+
+
+class TableRenderer:
+    """
+    Render items of one model as fixed-width rows.
+
+    columns: ((title, attr, width), ...)，attr 可以是 property（比如 gender_display）；值是 None 的显示为空。
+    """
+    _cache: dict = {}
+
+    def __init__(self, columns: tuple):
+        self.columns = columns
+        self.header = ''.join(f'{title:<{width}}' for title, _, width in columns)
+        self._template = ''.join(f'{{{i}:<{width}}}' for i, (_, _, width) in enumerate(columns))
+        getter = attrgetter(*(attr for _, attr, _ in columns))
+        self._getter = getter if len(columns) > 1 else (lambda item: (getter(item), ))
+
+    @classmethod
+    def for_model(cls, model: type):
+        """One renderer per model, built from model.table_columns."""
+        renderer = cls._cache.get(model)
+        if renderer is None:
+            renderer = cls._cache[model] = cls(model.table_columns)
+        return renderer
+
+    def render_row(self, item) -> str:
+        return self._template.format(*['' if value is None else value for value in self._getter(item)])
+
+    def render(self, items, footer='') -> str:
+        """Header + rows (+ footer) as one string."""
+        lines = [self.header]
+        lines.extend(map(self.render_row, items))
+        if footer:
+            lines.append(footer)
+        lines.append('')
+        return '\n'.join(lines)
+
+    def write_page(self, items, footer='', out=None):
+        """Write a whole page with a single write()."""
+        out = out or sys.stdout
+        out.write(self.render(items, footer))
+        out.flush()
@@ -0,0 +1,54 @@
+# Unit of work on SqList
+"""
+事务：先把要改的属性记下来，提交时一起检查、一起修改，要么全部成功，要么一个都不改。
+
+    with student_list.transaction() as tx:
+        tx.update(student, name='张三', age=20)
+        tx.update(other, {'age': 21})
+    success, msg = tx.result
+
+提交由 SqList.apply_changes() 执行：所有新值（check_data）和唯一约束（按修改之后的最终状态，交换两个学号也可以）先检查完，
+然后在一个 batch 里修改，每个对象的索引各更新一次、存储更新一次、日志只写一条 ('update', key, changes)，
+整个事务只 fsync 一次（SQLite 是一个事务）。修改的过程中出了异常，已经改过的对象按旧值改回去。
+with 块里抛出异常时什么都不改。
+"""
+
+
+class Transaction:
+    """Changes queued by update(), applied all or none by commit() (or at the end of the with block)."""
+
+    def __init__(self, sq_list):
+        self.sq_list = sq_list
+        self.changes: dict[tuple, tuple] = {}  # item key -> (item, {attr: new_value})
+        self.result = None  # commit() 的返回值 (success, msg)
+
+    def update(self, item, changes: dict = None, **kwargs):
+        """Queue attribute changes of item; later changes of the same attribute win."""
+        key = self.sq_list._item_key(item)  # 按主键合并：SQLite 等存储每次查询返回的是不同的副本
+        self.changes.setdefault(key, (item, {}))[1].update(changes or {}, **kwargs)
+        return self
+
+    def __len__(self):
+        return len(self.changes)
+
+    def commit(self) -> tuple[bool, str]:
+        if self.result is None:
+            changes, self.changes = list(self.changes.values()), {}
+            self.result = self.sq_list.apply_changes(changes)
+        return self.result
+
+    def rollback(self):
+        """Drop the queued changes, nothing has been applied yet."""
+        self.changes = {}
+        if self.result is None:
+            self.result = (False, 'Transaction rolled back.')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
@@ -11,6 +11,8 @@ class UserInterfaceManager:
         '4': 'Find students',
         '5': 'Update students',
         '6': 'Student course score statistics',
+        '7': 'Query students by age or number',
+        '8': 'Course rankings',
         'q': 'Quit'
     }
     BOUNDARY_CHAR = '-'
@@ -34,33 +36,43 @@ class UserInterfaceManager:
         print(self.BOUNDARY_CHAR * self.BOUNDARY_LENGTH)
         
     def run(self):
-        while True:
-            os.system('cls')  # 清屏
-            self.display_menu()
-            option = input('Please choose an option: ')
-            option = option.strip().lower()
-            if option == '1':  # TODO: 在内部操作也设置上输入q和ctrl c 退出
-                self.manager.show_all_student_info()
-                os.system('pause')
-            elif option == '2':
-                self.manager.add_student()  # TODO: 不需要返回值，error需要print
-                os.system('pause')
-            elif option == '3':
-                self.manager.delete_student_2()
-                os.system('pause')
-            elif option == '4':
-                self.manager.get_student()
-                os.system('pause')
-            elif option == '5':
-                self.manager.update_student()
-                os.system('pause')
-            elif option == '6':
-                self.manager.student_course_score_statistics()  # TODO: 这个需要做完 Course 相关才能进行成绩统计
-                os.system('pause')
-            elif option == 'q':
-                print('Quitting...')
-                break
-            else:
-                print('Invalid option, please try again.')
+        try:
+            while True:
+                os.system('cls')  # 清屏
+                self.display_menu()
+                option = input('Please choose an option: ')
+                option = option.strip().lower()
+                self.manager.refresh()  # 同时运行多个实例时，先同步其他实例的修改
+                if option == 'q':
+                    print('Quitting...')
+                    break
+                if not self.run_option(option):
+                    print('Invalid option, please try again.')
                 os.system('pause')
+        finally:  # q、Ctrl+C 和没有处理的异常都会走到这里：提交日志、写入 --metrics 文件
+            self.manager.close()
         return
+
+    def run_option(self, option) -> bool:
+        """Run the action of a menu option, False if the option is invalid."""
+        if option == '1':  # TODO: 在内部操作也设置上输入q和ctrl c 退出
+            self.manager.show_all_student_info()
+        elif option == '2':
+            self.manager.add_student()  # TODO: 不需要返回值，error需要print
+        elif option == '3':
+            self.manager.delete_student_2()
+        elif option == '4':
+            self.manager.get_student()
+        elif option == '5':
+            self.manager.update_student()
+        elif option == '6':
+            self.manager.student_course_score_statistics()
+        elif option == '7':
+            self.manager.query_students()
+        elif option == '8':
+            self.manager.show_rankings()
+        elif option == 'm':  # 隐藏的选项：操作统计，不在菜单里显示
+            self.manager.show_metrics()
+        else:
+            return False
+        return True
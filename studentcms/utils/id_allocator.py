@@ -0,0 +1,64 @@
+import threading
+
+from .locks import FileLock, lock_path_of
+from .pickle_utils import load_pickle_file, update_pickle_file_atomically
+
+DEFAULT_BLOCK_SIZE = 1000
+
+
+class IdAllocator:
+    """
+    按段预留 id：一次从 pickle 文件里预留 block_size 个 id，然后在内存里发号，用完再预留下一段。
+    文件里存的是 "下一个可用 id"（高水位），和之前 get_new_unique_stu_id 的格式一致。
+    高水位先落盘再发号，所以进程崩溃最多浪费掉没用完的那一段 id，不会发出重复的 id。
+    读-改-写高水位时持有文件锁，同时运行的多个程序实例拿到的是不重叠的 id 段。
+    """
+
+    def __init__(self, file_path, block_size=DEFAULT_BLOCK_SIZE):
+        self.file_path = file_path
+        self.block_size = block_size
+        self._blocks: dict[str, list[int]] = {}  # key -> [next_id, end_id)
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(lock_path_of(file_path))
+
+    def _reserve_block(self, key: str, size: int) -> list[int]:
+        with self._file_lock:
+            pickle_data = load_pickle_file(self.file_path)
+            start = pickle_data.get(key)
+            if not start:
+                start = 1
+            pickle_data[key] = start + size
+            update_pickle_file_atomically(self.file_path, pickle_data)
+        return [start, start + size]
+
+    def allocate(self, key: str) -> int:
+        """Get a new unique id of a table, e.g. allocate('student_id')."""
+        return self.allocate_many(key, 1)[0]
+
+    def allocate_many(self, key: str, count: int) -> list[int]:
+        """Get count new unique ids at once, used by bulk inserts."""
+        ids: list[int] = []
+        with self._lock:
+            block = self._blocks.get(key)
+            while count > 0:
+                if block is None or block[0] >= block[1]:
+                    block = self._reserve_block(key, max(self.block_size, count))
+                    self._blocks[key] = block
+                taken = min(count, block[1] - block[0])
+                ids.extend(range(block[0], block[0] + taken))
+                block[0] += taken
+                count -= taken
+        return ids
+
+
+_allocators: dict[str, IdAllocator] = {}
+_allocators_lock = threading.Lock()
+
+
+def get_id_allocator(file_path) -> IdAllocator:
+    """One allocator per pickle file, so every model shares the reserved blocks of that file."""
+    with _allocators_lock:
+        allocator = _allocators.get(file_path)
+        if allocator is None:
+            allocator = _allocators[file_path] = IdAllocator(file_path)
+        return allocator
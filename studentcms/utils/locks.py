@@ -0,0 +1,183 @@
+# Locks for running several threads / several instances on the same data
+"""
+* FileLock: 进程间的互斥锁，同时运行多个程序实例时，保护共享的文件（id 文件、日志文件）；
+* RWLock: 线程之间的读写锁，多个读者可以同时读，写者独占。
+"""
+import functools
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """
+    Inter-process exclusive lock on a separate ``.lock`` file.
+
+    锁的是单独的 .lock 文件，不是数据文件本身，因为数据文件会被 os.replace 整个换掉。
+    同一个进程里可以重入（嵌套 with 不会死锁），线程之间用 RLock 互斥。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fp = None
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        self._depth += 1
+        if self._depth > 1:
+            return
+        try:
+            self._fp = open(self.path, 'a+b')
+            if fcntl is not None:
+                fcntl.flock(self._fp.fileno(), fcntl.LOCK_EX)
+            else:
+                self._lock_windows()
+        except BaseException:
+            if self._fp is not None:
+                self._fp.close()
+                self._fp = None
+            self._depth -= 1
+            self._thread_lock.release()
+            raise
+
+    def _lock_windows(self):
+        self._fp.seek(0)
+        while True:
+            try:
+                msvcrt.locking(self._fp.fileno(), msvcrt.LK_LOCK, 1)  # LK_LOCK 重试 10 秒后仍拿不到会抛 OSError
+                return
+            except OSError:
+                continue
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(self._fp.fileno(), fcntl.LOCK_UN)
+                else:
+                    self._fp.seek(0)
+                    msvcrt.locking(self._fp.fileno(), msvcrt.LK_UNLCK, 1)
+            finally:
+                self._fp.close()
+                self._fp = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def lock_path_of(file_path) -> str:
+    return f'{os.fspath(file_path)}.lock'
+
+
+class RWLock:
+    """
+    Reader-writer lock: readers run in parallel, writers are exclusive.
+
+    * 写者优先：有写者在等的时候，新来的读者要等，写者不会被源源不断的读者饿死；
+    * 可重入：持有写锁的线程可以再拿写锁或读锁，持有读锁的线程可以再拿读锁；
+    * 读锁不能升级成写锁（两个读者同时升级会互相等待），会抛 RuntimeError。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)  # 等待时用；不等待时直接 with self._lock，快一些
+        self._readers = 0
+        self._waiting_writers = 0
+        self._writer = None  # 持有写锁的线程 id
+        self._write_depth = 0
+        self._local = threading.local()  # 每个线程持有读锁的层数，以及最外层的读锁有没有计入 _readers
+
+    def is_writing(self) -> bool:
+        """Whether the current thread holds the write lock."""
+        return self._writer == threading.get_ident()
+
+    def acquire_read(self):
+        local = self._local
+        depth = getattr(local, 'depth', 0)
+        if depth:  # 重入
+            local.depth = depth + 1
+            return
+        if self._writer == threading.get_ident():  # 写锁里读，不计入 _readers
+            local.depth, local.counted = 1, False
+            return
+        with self._lock:
+            while self._writer is not None or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        local.depth, local.counted = 1, True
+
+    def release_read(self):
+        local = self._local
+        local.depth -= 1
+        if local.depth or not local.counted:
+            return
+        with self._lock:
+            self._readers -= 1
+            if self._readers == 0 and self._waiting_writers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        if self._writer == threading.get_ident():
+            self._write_depth += 1
+            return
+        if getattr(self._local, 'depth', 0):
+            raise RuntimeError('Can not upgrade a read lock to a write lock.')
+        with self._lock:
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = threading.get_ident()
+            self._write_depth = 1
+
+    def release_write(self):
+        self._write_depth -= 1
+        if self._write_depth == 0:
+            with self._lock:
+                self._writer = None
+                self._cond.notify_all()
+
+    @contextmanager
+    def read_lock(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write_lock(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+def read_locked(func):
+    """Run the method holding self._rwlock as a reader."""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        rwlock = self._rwlock
+        rwlock.acquire_read()  # 不用 with read_lock()，这个装饰器在很热的查询路径上
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            rwlock.release_read()
+    return wrapper
@@ -0,0 +1,166 @@
+# Operation metrics
+"""
+运行时的操作统计：每个操作的调用次数、失败次数、耗时直方图，以及读写文件的字节数。
+
+* @timed() 装饰要统计的函数（和 handle_keyboard_interrupt 一样是一层 wrapper），
+  抛出异常或者返回 (False, msg) 都算失败；
+* 读写文件的地方调用 count_bytes(name, read=..., written=...)；
+* 默认关闭（settings.METRICS_ENABLED），关闭时 wrapper 只多一次属性判断，几乎没有开销；
+  metrics.enable() / disable() 可以在运行中打开、关闭。
+"""
+import functools
+import json
+import threading
+import time
+from bisect import bisect_left
+
+# 耗时直方图每一档的上限（秒）：10us, 20us, 50us, ... 10s，最后一档是 > 10s
+LATENCY_BOUNDS = tuple(base * 10 ** exp for exp in range(-5, 1) for base in (1, 2, 5)) + (10, )
+
+
+def format_seconds(seconds) -> str:
+    if seconds is None:
+        return '-'
+    if seconds < 1e-3:
+        return f'{seconds * 1e6:.0f}us'
+    if seconds < 1:
+        return f'{seconds * 1e3:.1f}ms'
+    return f'{seconds:.2f}s'
+
+
+class OperationStats:
+    __slots__ = ('count', 'failures', 'total', 'max', 'buckets', 'bytes_read', 'bytes_written')
+
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(LATENCY_BOUNDS) + 1)
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def record(self, seconds: float, failed=False):
+        self.count += 1
+        self.failures += failed
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[bisect_left(LATENCY_BOUNDS, seconds)] += 1
+
+    def percentile(self, p: float):
+        """Upper bound of the histogram bucket holding the p-th percentile (max for the last bucket)."""
+        if not self.count:
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                return min(LATENCY_BOUNDS[i], self.max) if i < len(LATENCY_BOUNDS) else self.max
+        return self.max
+
+    def to_dict(self) -> dict:
+        histogram = {f'<={format_seconds(bound)}': n for bound, n in zip(LATENCY_BOUNDS, self.buckets) if n}
+        if self.buckets[-1]:
+            histogram[f'>{format_seconds(LATENCY_BOUNDS[-1])}'] = self.buckets[-1]
+        return {
+            'count': self.count,
+            'failures': self.failures,
+            'total_seconds': round(self.total, 6),
+            'mean_seconds': self.total / self.count if self.count else None,
+            'p50_seconds': self.percentile(50),
+            'p99_seconds': self.percentile(99),
+            'max_seconds': self.max if self.count else None,
+            'histogram': histogram,
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+        }
+
+
+class Metrics:
+    """Registry of OperationStats by operation name, shared by the whole process."""
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._stats: dict[str, OperationStats] = {}
+        self.started = time.time()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.started = time.time()
+
+    def _get(self, name: str) -> OperationStats:
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = OperationStats()
+        return stats
+
+    def record(self, name: str, seconds: float, failed=False):
+        with self._lock:
+            self._get(name).record(seconds, failed)
+
+    def count_bytes(self, name: str, read=0, written=0):
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self._get(name)
+            stats.bytes_read += read
+            stats.bytes_written += written
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            operations = {name: stats.to_dict() for name, stats in sorted(self._stats.items())}
+        return {'enabled': self.enabled, 'since': self.started, 'seconds': time.time() - self.started,
+                'operations': operations}
+
+    def render(self) -> str:
+        """The snapshot as a fixed-width table."""
+        lines = [f'{"Operation":<45}{"Count":>9}{"Fail":>7}{"Mean":>10}{"P50":>10}{"P99":>10}{"Max":>10}'
+                 f'{"Read":>12}{"Written":>12}']
+        for name, stats in self.snapshot()['operations'].items():
+            lines.append(f'{name:<45}{stats["count"]:>9}{stats["failures"]:>7}'
+                         f'{format_seconds(stats["mean_seconds"]):>10}{format_seconds(stats["p50_seconds"]):>10}'
+                         f'{format_seconds(stats["p99_seconds"]):>10}{format_seconds(stats["max_seconds"]):>10}'
+                         f'{stats["bytes_read"]:>12}{stats["bytes_written"]:>12}')
+        return '\n'.join(lines)
+
+    def dump(self, file_path):
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=2, ensure_ascii=False)
+
+
+metrics = Metrics()
+
+
+def timed(name=None):
+    """Record every call of the decorated function under name (default: its qualified name)."""
+    def decorator(func):
+        key = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            failed = True
+            try:
+                result = func(*args, **kwargs)
+                failed = type(result) is tuple and len(result) == 2 and result[0] is False  # (False, msg)
+                return result
+            finally:
+                metrics.record(key, time.perf_counter() - start, failed)
+        return wrapper
+    return decorator
+
+
+def count_bytes(name: str, read=0, written=0):
+    metrics.count_bytes(name, read, written)
@@ -3,6 +3,7 @@ import os
 
 # from .public_utils import update_dict_values
 from ..settings import DATA_PICKLE_PATH
+from .metrics import count_bytes, timed
 
 # # TODO: 现在做到设计model，然后想到了用pickle来存放各表最新的id值，然后写了一下pickle的实现；考虑一下保存方式，假如用csv呢？还需要用pickle来长期存储吗？
 # def update_pickle_data(new_data: Dict, cover_update=True):
@@ -22,6 +23,7 @@ def init_pickle_file(file_path):
             pickle.dump({}, fp)
 
 
+@timed()
 def update_pickle_file(file_path, data):
     """
 
@@ -30,16 +32,39 @@ def update_pickle_file(file_path, data):
     try:
         with open(file_path, 'wb') as fp:
             pickle.dump(data, fp)
+            count_bytes('update_pickle_file', written=fp.tell())
     except Exception as e:
         print(f"[Error] Update pickle file occurred error: {e}")
 
 
+@timed()
+def update_pickle_file_atomically(file_path, data):
+    """
+    先写临时文件并 fsync，再 os.replace 覆盖原文件；中途崩溃时原文件保持完整。
+    和 update_pickle_file 不同，失败时会抛出异常，调用方必须知道数据没有落盘。
+    :dict data: object
+    """
+    tmp_path = f'{file_path}.tmp'
+    try:
+        with open(tmp_path, 'wb') as fp:
+            pickle.dump(data, fp)
+            fp.flush()
+            os.fsync(fp.fileno())
+            count_bytes('update_pickle_file_atomically', written=fp.tell())
+        os.replace(tmp_path, file_path)  # rename 是原子操作
+    except OSError as e:
+        print(f"[Error] Update pickle file atomically occurred error: {e}")
+        raise
+
+
+@timed()
 def load_pickle_file(file_path):
     init_pickle_file(file_path)  # if file not exists, create file
     data = {}
     try:
         with open(file_path, 'rb') as fp:
             data = pickle.load(fp)
+            count_bytes('load_pickle_file', read=fp.tell())
     except EOFError:
         print("[Error] 文件可能为空或数据不完整，请检查文件。")
     except pickle.UnpicklingError:
@@ -2,6 +2,21 @@ from datetime import datetime
 import re
 import csv
 
+try:
+    import numpy as np
+except ImportError:  # numpy 是可选依赖，没有时批量校验退化为逐个校验
+    np = None
+
+# 正则表达式只编译一次
+ID_CARD_PATTERN = re.compile(r"^\d{17}[\dXx]$")
+PHONE_NUMBER_PATTERN = re.compile(r"^1\d{10}$")
+CHINESE_NAME_PATTERN = re.compile(r"^[\u4e00-\u9fa5]{2,4}$")  # 2-4个中文字符
+ENGLISH_NAME_PATTERN = re.compile(r"^[A-Z][a-z]+(?:[-\s][A-Z][a-z]+)*$")  # eg. "John Doe"
+STUDENT_NUMBER_PATTERN = re.compile(r"^\d{11}$")  # 11位数字
+# 身份证加权因子和校验码
+ID_CARD_WEIGHT_FACTOR = (7, 9, 10, 5, 8, 4, 2, 1, 6, 3, 7, 9, 10, 5, 8, 4, 2)
+ID_CARD_CHECK_CODE = "10X98765432"
+
 
 # 深层递归更新字典的值
 def update_dict_values(origin_dict, new_dict):
@@ -44,24 +59,18 @@ def format_result(code, message, data=None):
 
 def is_id_card_valid(id_number: str):
     # 正则表达式验证身份证号格式
-    pattern = r"^\d{17}[\dXx]$"
-    if not re.match(pattern, id_number):
+    if not ID_CARD_PATTERN.match(id_number):
         return False
     
-    # 加权因子
-    weight_factor = [7, 9, 10, 5, 8, 4, 2, 1, 6, 3, 7, 9, 10, 5, 8, 4, 2]
-    # 校验码
-    check_code = "10X98765432"
-    
     # 计算校验位(中国身份证号最后一位是校验位，它是根据前面17位数字经过特定算法计算得出的)
     sum = 0
     for i in range(17):
-        sum += int(id_number[i]) * weight_factor[i]
+        sum += int(id_number[i]) * ID_CARD_WEIGHT_FACTOR[i]
     if id_number[17] in ['x', 'X']:
         id_number = id_number[:17] + '10'
     else:
         id_number = id_number[:17] + id_number[17]
-    calc_code = check_code[sum % 11]
+    calc_code = ID_CARD_CHECK_CODE[sum % 11]
 
     # 校验身份证号
     if calc_code == id_number[17]:
@@ -72,17 +81,14 @@ def is_id_card_valid(id_number: str):
     
 def is_phone_number_valid(phone_number: str):
     # 正则表达式验证手机号格式
-    pattern = r"^1\d{10}$"
-    if re.match(pattern, phone_number):
+    if PHONE_NUMBER_PATTERN.match(phone_number):
         return True
     else:
         return False
     
     
 def is_name_valid(name: str):
-    chinese_pattern = r"^[\u4e00-\u9fa5]{2,4}$"  # 2-4个中文字符
-    english_pattern = r"^[A-Z][a-z]+(?:[-\s][A-Z][a-z]+)*$"  # eg. "John Doe"
-    if re.match(chinese_pattern, name) or re.match(english_pattern, name):
+    if CHINESE_NAME_PATTERN.match(name) or ENGLISH_NAME_PATTERN.match(name):
         return True
     else:
         return False
@@ -90,13 +96,57 @@ def is_name_valid(name: str):
 
 def is_student_number_valid(student_number: str):
     # eg. 20194051220
-    pattern = r"^\d{11}$"  # 正则表达式验证学号格式,11位数字
-    if re.match(pattern, student_number):
+    if STUDENT_NUMBER_PATTERN.match(student_number):  # 正则表达式验证学号格式,11位数字
         return True
     else:
         return False
 
 
+# 批量校验：传入一整列，返回和输入等长的 list[bool]，结果和上面逐个校验的函数完全一致
+def validate_id_cards(id_numbers: list[str]) -> list[bool]:
+    """
+    先用正则筛掉格式不对的；格式对的用 numpy 一次算完校验位：
+    前17位组成 (N, 17) 的数字矩阵，和加权因子做矩阵乘法，再对 11 取余查校验码。
+    注意 is_id_card_valid 把最后一位的 X/x 当作 '1' 来比较，这里保持一致。
+    """
+    mask = [ID_CARD_PATTERN.match(id_number) is not None for id_number in id_numbers]
+    if np is None:
+        return [matched and is_id_card_valid(id_number) for matched, id_number in zip(mask, id_numbers)]
+    rows = []
+    for i, matched in enumerate(mask):
+        if not matched:
+            continue
+        if id_numbers[i].isascii():
+            rows.append(i)
+        else:  # \d 也能匹配全角等 unicode 数字，这种少见的情况逐个校验
+            mask[i] = is_id_card_valid(id_numbers[i])
+    if not rows:
+        return mask
+    head = ''.join(id_numbers[i][:17] for i in rows).encode('ascii')
+    digits = np.frombuffer(head, dtype=np.uint8).reshape(len(rows), 17).astype(np.int64) - ord('0')
+    calc_codes = np.frombuffer(ID_CARD_CHECK_CODE.encode('ascii'), dtype=np.uint8)[digits @ ID_CARD_WEIGHT_FACTOR % 11]
+    last = np.frombuffer(''.join(id_numbers[i][17] for i in rows).encode('ascii'), dtype=np.uint8).copy()
+    last[(last == ord('X')) | (last == ord('x'))] = ord('1')
+    for i, valid in zip(rows, (calc_codes == last).tolist()):
+        mask[i] = valid
+    return mask
+
+
+def validate_phone_numbers(phone_numbers: list[str]) -> list[bool]:
+    match = PHONE_NUMBER_PATTERN.match
+    return [match(phone_number) is not None for phone_number in phone_numbers]
+
+
+def validate_names(names: list[str]) -> list[bool]:
+    chinese_match, english_match = CHINESE_NAME_PATTERN.match, ENGLISH_NAME_PATTERN.match
+    return [chinese_match(name) is not None or english_match(name) is not None for name in names]
+
+
+def validate_student_numbers(student_numbers: list[str]) -> list[bool]:
+    match = STUDENT_NUMBER_PATTERN.match
+    return [match(student_number) is not None for student_number in student_numbers]
+
+
 def handle_keyboard_interrupt(func):
     def wrapper(*args, **kwargs):
         try:
@@ -107,18 +157,114 @@ def handle_keyboard_interrupt(func):
     return wrapper
 
 
-def save_data_to_csv(objs, filename):
-    with open(filename, mode='w', newline='') as file:
+def save_data_to_csv(objs, filename, attrs):
+    """
+    流式写入：objs 可以是生成器，一行一行地写，不会把所有数据先拼到内存里。
+    没有的属性写空字符串。
+    """
+    count = 0
+    with open(filename, mode='w', newline='', encoding='utf-8') as file:
         writer = csv.writer(file)
-        writer.writerow(['id', 'name', 'age'])  # 写入列名
+        writer.writerow(attrs)  # 写入列名
         for obj in objs:
-            writer.writerow([obj.id, obj.name, obj.age])
+            writer.writerow(['' if getattr(obj, attr, None) is None else getattr(obj, attr) for attr in attrs])
+            count += 1
+    return count
+
+
+def iter_csv_rows(filename):
+    """生成器，每次读一行（dict），文件多大内存占用都一样"""
+    with open(filename, mode='r', newline='', encoding='utf-8') as file:
+        yield from csv.DictReader(file)
 
 
-def load_data_from_csv(filename, Obj):
-    with open(filename, mode='r') as file:
-        csv_rows = csv.DictReader(file)
-        for row in csv_rows:
-            # Obj(int(row['id']), row['name'], int(row['age']))
-            pass  # TODO: Obj.add_item(Obj(int(row['id']), row['name'], int(row['age'])))
-    return
+def iter_csv_chunks(filename, chunk_size):
+    """生成器，每次返回 chunk_size 行"""
+    chunk = []
+    for row in iter_csv_rows(filename):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class CsvErrorWriter:
+    """
+    导入时把校验不通过的行写到错误文件里（原来的列 + line + error 列），第一次有错误时才创建文件。
+    写错误文件失败（磁盘满、没有权限）只打印警告，不会中断导入。
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.count = 0
+        self._file = None
+        self._writer = None
+
+    def write(self, row: dict, line_number: int, error: str):
+        self.count += 1
+        if not self.filename:
+            return
+        extras = row.get(None)  # DictReader 把比列名多出来的格子放在 None 键下
+        if extras:
+            error = f'{error} (extra cells: {", ".join(map(str, extras))})'
+        try:
+            if self._writer is None:
+                # DictReader 的每一行都有全部列名（短的行补 None），去掉 None 键就是文件的列名
+                fieldnames = [key for key in row if key is not None] + ['line', 'error']
+                self._file = open(self.filename, mode='w', newline='', encoding='utf-8')
+                self._writer = csv.DictWriter(self._file, fieldnames=fieldnames, extrasaction='ignore')
+                self._writer.writeheader()
+            self._writer.writerow({**row, 'line': line_number, 'error': error})
+        except (OSError, ValueError, csv.Error) as e:
+            print(f'[Warning] Writing rejected rows to {self.filename} failed: {e}')
+            self.close()
+            self.filename = None  # 之后的错误行只计数
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def load_data_from_csv(filename, parse_rows, add_items, error_filename=None, batch_size=1000):
+    """
+    流式导入 CSV，每次只处理 batch_size 行。
+
+    Args:
+        parse_rows: list[row(dict)] -> list[(True, data) / (False, error message)]，按列做类型转换和校验
+        add_items: list[data] -> (success, msg)，一批一批地插入
+        error_filename: 校验不通过的行写到这个文件里，不会中断导入
+
+    Returns:
+        tuple[bool, str]: (success, message)
+    """
+    imported = 0
+    error_writer = CsvErrorWriter(error_filename)
+    try:
+        first_line_number = 2  # 第1行是列名
+        for chunk in iter_csv_chunks(filename, batch_size):
+            accepted, accepted_rows = [], []
+            for offset, (row, (success, data_or_msg)) in enumerate(zip(chunk, parse_rows(chunk))):
+                if success:
+                    accepted.append(data_or_msg)
+                    accepted_rows.append((row, first_line_number + offset))
+                else:
+                    error_writer.write(row, first_line_number + offset, data_or_msg)
+            if accepted:
+                success, msg = add_items(accepted)
+                if success is False:  # 整批被拒绝（比如和其他实例同时导入了重复的学号），这批都算失败
+                    for row, line_number in accepted_rows:
+                        error_writer.write(row, line_number, msg)
+                else:
+                    imported += len(accepted)
+            first_line_number += len(chunk)
+    except OSError as e:
+        return False, f'Import {filename} occurred error: {e}'
+    finally:
+        error_writer.close()
+    msg = f'{imported} rows imported, {error_writer.count} rows rejected.'
+    if error_writer.count and error_filename:
+        msg += f' See {error_filename}.'
+    return True, msg